@@ -0,0 +1,132 @@
+"""Move stored media files between storage backends.
+
+    python migrate_storage.py --to s3 [--from gridfs] [--concurrency 8] [--limit N] [--dry-run]
+
+Run from the backend directory with the API's environment (.env, MONGO_URL,
+DB_NAME and the STORAGE_* settings of the target). Files are moved oldest
+first: the bytes are copied to the target and verified, the files document
+is repointed, and the old copy is deleted after STORAGE_MOVE_GRACE_SECONDS
+so downloads already reading it can finish. The API keeps serving files
+during a migration, and an interrupted run can simply be started again;
+files already moved are skipped.
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+from server import (
+    STORAGE_MOVE_GRACE_SECONDS,
+    client,
+    db,
+    get_storage_backend,
+    move_stored_file,
+    release_moved_file,
+    storage_filter
+)
+
+MB = 1024 * 1024
+
+def pending_filter(source, target):
+    if source:
+        return storage_filter(source)
+    return {"$nor": [storage_filter(target)]}
+
+async def report(query):
+    pipeline = [
+        {"$match": query},
+        {"$group": {"_id": {"$ifNull": ["$storage", "gridfs"]}, "files": {"$sum": 1}, "bytes": {"$sum": "$length"}}}
+    ]
+    async for result in db.fs.files.aggregate(pipeline):
+        print(f"  {result['_id']}: {result['files']} files, {result['bytes'] / MB:.1f} MB")
+
+async def migrate(source, target, concurrency, limit, batch_size, grace):
+    target_backend = get_storage_backend(target)  # fails early on missing settings
+    if source:
+        get_storage_backend(source)
+    query = pending_filter(source, target)
+
+    queue = asyncio.Queue(maxsize=concurrency * 2)
+    releases = []
+    totals = {"moved": 0, "skipped": 0, "failed": 0, "bytes": 0}
+    started = time.perf_counter()
+
+    async def mover():
+        while True:
+            document = await queue.get()
+            try:
+                old_backend = await move_stored_file(document["_id"], target)
+                if old_backend is None:
+                    totals["skipped"] += 1
+                else:
+                    totals["moved"] += 1
+                    totals["bytes"] += document["length"]
+                    releases.append(asyncio.create_task(release_moved_file(old_backend, document["_id"], grace)))
+            except Exception as e:
+                totals["failed"] += 1
+                print(f"Failed to move {document['_id']}: {e}", file=sys.stderr)
+            finally:
+                queue.task_done()
+
+            done = totals["moved"] + totals["skipped"] + totals["failed"]
+            if done % 100 == 0:
+                elapsed = time.perf_counter() - started
+                print(f"{done} files, {totals['bytes'] / MB:.1f} MB moved, {totals['bytes'] / MB / elapsed:.1f} MB/s")
+
+    movers = [asyncio.create_task(mover()) for _ in range(concurrency)]
+
+    # Page through the pending files by _id so the cursor never outlives a batch
+    last_id = None
+    queued = 0
+    while limit is None or queued < limit:
+        page_query = {**query, "_id": {"$gt": last_id}} if last_id is not None else query
+        page_size = batch_size if limit is None else min(batch_size, limit - queued)
+        documents = await db.fs.files.find(page_query, {"_id": 1, "length": 1}).sort("_id", 1).limit(page_size).to_list(page_size)
+        if not documents:
+            break
+        for document in documents:
+            await queue.put(document)
+        queued += len(documents)
+        last_id = documents[-1]["_id"]
+
+    await queue.join()
+    for task in movers:
+        task.cancel()
+
+    elapsed = time.perf_counter() - started
+    print(
+        f"Moved {totals['moved']} files ({totals['bytes'] / MB:.1f} MB) to {target_backend.name} in {elapsed:.1f}s, "
+        f"{totals['skipped']} skipped, {totals['failed']} failed"
+    )
+    if releases:
+        print(f"Deleting old copies after the {grace:.0f}s grace period...")
+        results = await asyncio.gather(*releases, return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                print(f"Failed to delete an old copy: {result}", file=sys.stderr)
+    return 1 if totals["failed"] else 0
+
+async def main():
+    parser = argparse.ArgumentParser(description="Move stored media files between storage backends")
+    parser.add_argument("--to", required=True, choices=["gridfs", "local", "s3"], help="Backend to move files to")
+    parser.add_argument("--from", dest="source", choices=["gridfs", "local", "s3"], help="Only move files from this backend")
+    parser.add_argument("--concurrency", type=int, default=8, help="Files moved at once")
+    parser.add_argument("--limit", type=int, default=None, help="Move at most this many files")
+    parser.add_argument("--batch-size", type=int, default=500, help="Files documents read per query")
+    parser.add_argument("--grace", type=float, default=STORAGE_MOVE_GRACE_SECONDS, help="Seconds to keep old copies")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be moved")
+    args = parser.parse_args()
+    if args.source == args.to:
+        parser.error("--from and --to name the same backend")
+
+    try:
+        print("Files to move:")
+        await report(pending_filter(args.source, args.to))
+        if args.dry_run:
+            return 0
+        return await migrate(args.source, args.to, args.concurrency, args.limit, args.batch_size, args.grace)
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -1,21 +1,67 @@
-from fastapi import FastAPI, APIRouter, UploadFile, File, HTTPException, Form, Request
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, APIRouter, UploadFile, File, HTTPException, Form, Request, Query
+from fastapi.responses import StreamingResponse, Response, JSONResponse, RedirectResponse
+from fastapi.encoders import jsonable_encoder
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorGridOut
+from pymongo import IndexModel, ASCENDING, DESCENDING, TEXT, ReturnDocument, UpdateOne
+from pymongo.errors import PyMongoError, DuplicateKeyError, BulkWriteError
+from bson import ObjectId
+from bson.errors import InvalidId
 import gridfs
-from gridfs import GridFS
-import pymongo
 import os
+import asyncio
+import time
+import base64
+import hashlib
+import hmac
+import json
+import math
+import mmap
+import re
+import subprocess
+import tempfile
+import shutil
+import secrets
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 import io
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple, Callable, Awaitable, Union
+from collections import OrderedDict
 import uuid
-from datetime import datetime, timezone
+from datetime import datetime, timezone, timedelta
+from email.utils import format_datetime, parsedate_to_datetime
 import mimetypes
 from emergentintegrations.payments.stripe.checkout import StripeCheckout, CheckoutSessionResponse, CheckoutStatusResponse, CheckoutSessionRequest
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import stripe
+except ImportError:  # only reachable through emergentintegrations
+    stripe = None
+
+try:
+    import boto3
+    from botocore.config import Config as BotoConfig
+    from botocore.exceptions import ClientError as BotoClientError
+except ImportError:  # only needed when STORAGE_BACKEND is s3
+    boto3 = None
+    
+    class BotoClientError(Exception):
+        pass
+
+try:
+    import redis.asyncio as aioredis
+    from redis.exceptions import RedisError
+except ImportError:  # only needed when CACHE_BACKEND_URL points at Redis
+    aioredis = None
+    
+    class RedisError(Exception):
+        pass
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -25,12 +71,11 @@ mongo_url = os.environ['MONGO_URL']
 client = AsyncIOMotorClient(mongo_url)
 db = client[os.environ['DB_NAME']]
 
-# Synchronous MongoDB client for GridFS
-sync_client = pymongo.MongoClient(mongo_url)
-sync_db = sync_client[os.environ['DB_NAME']]
+# GridFS chunk size, also the read granularity of files in other storage backends
+GRIDFS_CHUNK_SIZE = int(os.environ.get('GRIDFS_CHUNK_SIZE', 255 * 1024))
 
-# GridFS for file storage
-fs = gridfs.GridFS(sync_db)
+# How many GridFS chunks a download may read ahead of the client
+DOWNLOAD_READ_AHEAD_CHUNKS = int(os.environ.get('DOWNLOAD_READ_AHEAD_CHUNKS', 4))
 
 # Create the main app without a prefix
 app = FastAPI(title="Gizzle TV L.L.C. API", version="1.0.0")
@@ -51,12 +96,81 @@ class ContentItem(BaseModel):
     description: Optional[str] = None
     thumbnail_id: Optional[str] = None
     processing_status: str = "pending"  # pending, processing, completed, failed
+    processing_error: Optional[str] = None
+    derivatives: Dict[str, str] = Field(default_factory=dict)  # "<variant>_<format>" -> GridFS file id
+    media_info: Dict[str, Any] = Field(default_factory=dict)  # duration, width, height, codecs
+    model_id: Optional[str] = None  # ModelProfile featured in the upload
+    member_id: Optional[str] = None  # CommunityMember who uploaded it
+    view_count: int = 0
+    abr_status: Optional[str] = None  # pending, processing, ready, failed (videos only)
+    hls_id: Optional[str] = None  # GridFS id of the HLS master playlist
+    renditions: List[Dict[str, Any]] = Field(default_factory=list)  # name, width, height, bitrate
 
 class ContentItemCreate(BaseModel):
     category: str
     tags: List[str] = Field(default_factory=list)
     description: Optional[str] = None
 
+class UploadSessionCreate(BaseModel):
+    filename: str
+    content_type: str
+    category: str
+    total_size: int = Field(gt=0)
+    tags: List[str] = Field(default_factory=list)
+    description: Optional[str] = None
+    model_id: Optional[str] = None
+    member_id: Optional[str] = None
+
+class UploadSession(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    filename: str
+    content_type: str
+    category: str
+    total_size: int
+    tags: List[str] = Field(default_factory=list)
+    description: Optional[str] = None
+    file_id: str  # GridFS id reserved for the assembled file
+    chunk_size: int
+    gridfs_chunk_size: int
+    total_chunks: int
+    model_id: Optional[str] = None
+    member_id: Optional[str] = None
+    received_chunks: List[int] = Field(default_factory=list)
+    status: str = "open"  # open, completing, completed
+    content_id: Optional[str] = None
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+class DirectUploadCreate(BaseModel):
+    filename: str
+    content_type: str
+    category: str
+    total_size: int = Field(gt=0)
+    sha256: Optional[str] = None  # hex digest; the object store then checks the upload against it
+    tags: List[str] = Field(default_factory=list)
+    description: Optional[str] = None
+    model_id: Optional[str] = None
+    member_id: Optional[str] = None
+
+class DirectUpload(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    filename: str
+    content_type: str
+    category: str
+    total_size: int
+    sha256: Optional[str] = None
+    tags: List[str] = Field(default_factory=list)
+    description: Optional[str] = None
+    file_id: str  # id the object is stored under
+    storage: str  # backend the upload URL points at
+    model_id: Optional[str] = None
+    member_id: Optional[str] = None
+    status: str = "open"  # open, completing, completed
+    content_id: Optional[str] = None
+    url_expires_at: datetime
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
 class CommunityMember(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     username: str
@@ -112,6 +226,25 @@ class ModelProfileCreate(BaseModel):
     tags: List[str] = Field(default_factory=list)
     subscription_price: Optional[float] = None
 
+class LiveStreamCreate(BaseModel):
+    title: str
+    description: Optional[str] = None
+    tags: List[str] = Field(default_factory=list)
+    model_id: Optional[str] = None
+
+class LiveStream(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    title: str
+    description: Optional[str] = None
+    tags: List[str] = Field(default_factory=list)
+    model_id: Optional[str] = None
+    stream_key_hash: str  # SHA-256 of the ingest key, which is only shown once
+    status: str = "created"  # created, live, ended
+    segment_count: int = 0
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    started_at: Optional[datetime] = None
+    ended_at: Optional[datetime] = None
+
 class PaymentTransaction(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     session_id: str
@@ -153,147 +286,3930 @@ SUBSCRIPTION_PLANS = {
     )
 }
 
-# Routes
-@api_router.get("/")
-async def root():
-    return {"message": "Welcome to Gizzle TV L.L.C. API"}
+# Upload configuration
+VALID_CATEGORIES = ["videos", "pictures", "live_streams"]
 
-@api_router.get("/health")
-async def health_check():
-    return {"status": "healthy", "timestamp": datetime.now(timezone.utc)}
+# Enhanced file size limits for high-quality content
+MAX_FILE_SIZES = {
+    "videos": 10 * 1024 * 1024 * 1024,  # 10GB for videos
+    "pictures": 100 * 1024 * 1024,       # 100MB for pictures
+    "live_streams": 5 * 1024 * 1024 * 1024  # 5GB for live streams
+}
 
-# Content Management Endpoints
-@api_router.post("/content/upload")
-async def upload_content(
-    category: str = Form(...),
-    description: str = Form(None),
-    tags: str = Form(""),
-    file: UploadFile = File(...)
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1MB chunks
+
+def file_too_large_detail(category: str) -> str:
+    """Human readable 413 message for a category's size limit"""
+    max_size = MAX_FILE_SIZES.get(category, 100 * 1024 * 1024)
+    if max_size >= 1024 * 1024 * 1024:
+        return f"File too large. Maximum size for {category}: {max_size // (1024*1024*1024)}GB"
+    return f"File too large. Maximum size for {category}: {max_size // (1024*1024)}MB"
+
+def validate_upload_target(category: str, content_type: str):
+    """Reject unknown categories and file types that do not fit the category"""
+    if category not in VALID_CATEGORIES:
+        raise HTTPException(status_code=400, detail="Invalid category")
+    
+    if category == "videos":
+        if not content_type.startswith("video/"):
+            raise HTTPException(status_code=400, detail="Invalid file type for videos")
+    elif category == "pictures":
+        if not content_type.startswith("image/"):
+            raise HTTPException(status_code=400, detail="Invalid file type for pictures")
+
+async def validate_uploader(model_id: Optional[str], member_id: Optional[str]):
+    """Reject attribution to model profiles or members that do not exist"""
+    if model_id and not await db.model_profiles.find_one({"id": model_id}, {"_id": 1}):
+        raise HTTPException(status_code=400, detail="Unknown model_id")
+    if member_id and not await db.community_members.find_one({"id": member_id}, {"_id": 1}):
+        raise HTTPException(status_code=400, detail="Unknown member_id")
+
+def gridfs_file_metadata(category: str, file_size: int, tag_list: List[str]) -> Dict[str, Any]:
+    """Metadata stored on every uploaded GridFS file"""
+    return {
+        "category": category,
+        "original_size": file_size,
+        "upload_timestamp": datetime.now(timezone.utc),
+        "high_quality": file_size > (100 * 1024 * 1024),  # Mark as high-quality if > 100MB
+        "tags": tag_list
+    }
+
+def parse_file_id(file_id: str) -> ObjectId:
+    """Convert a GridFS file id from a URL into an ObjectId, 404 if malformed"""
+    try:
+        return ObjectId(file_id)
+    except (InvalidId, TypeError):
+        raise HTTPException(status_code=404, detail="File not found")
+
+# HTTP caching for stored media. Files under a GridFS id never change, so
+# videos and pictures can be cached aggressively; live streams stay short.
+CATEGORY_CACHE_CONTROL = {
+    "videos": os.environ.get('CACHE_CONTROL_VIDEOS', 'public, max-age=604800, immutable'),
+    "pictures": os.environ.get('CACHE_CONTROL_PICTURES', 'public, max-age=2592000, immutable'),
+    "live_streams": os.environ.get('CACHE_CONTROL_LIVE_STREAMS', 'public, max-age=60')
+}
+DEFAULT_CACHE_CONTROL = os.environ.get('CACHE_CONTROL_DEFAULT', 'public, max-age=3600')
+
+def file_etag(grid_out) -> str:
+    """Strong ETag for a GridFS file; stored files are immutable, so id and length suffice"""
+    return f'"{grid_out._id}-{grid_out.length}"'
+
+def file_last_modified(grid_out) -> datetime:
+    """GridFS upload date as an aware UTC datetime truncated to whole seconds"""
+    upload_date = grid_out.upload_date
+    if upload_date.tzinfo is None:
+        upload_date = upload_date.replace(tzinfo=timezone.utc)
+    return upload_date.replace(microsecond=0)
+
+def etag_matches(header_value: str, etag: str, weak: bool = True) -> bool:
+    """Compare an If-None-Match / If-Range value against our ETag"""
+    if header_value.strip() == "*":
+        return True
+    for candidate in header_value.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            if not weak:
+                continue
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+def parse_http_date(value: str) -> Optional[datetime]:
+    """Parse an HTTP date header, None if it is malformed"""
+    try:
+        parsed = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if parsed is None:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+def is_not_modified(request: Request, etag: str, last_modified: datetime) -> bool:
+    """Evaluate If-None-Match / If-Modified-Since for a GET (RFC 7232 order)"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag_matches(if_none_match, etag)
+    
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        since = parse_http_date(if_modified_since)
+        return since is not None and last_modified <= since
+    return False
+
+def if_range_allows(request: Request, etag: str, last_modified: datetime) -> bool:
+    """Whether a Range request may be honoured given its If-Range precondition"""
+    if_range = request.headers.get("if-range")
+    if not if_range:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        return etag_matches(if_range, etag, weak=False)
+    since = parse_http_date(if_range)
+    return since is not None and since == last_modified
+
+# Byte range serving
+MAX_RANGES_PER_REQUEST = 16
+
+def parse_range_header(range_header: str, file_size: int) -> Optional[List[Tuple[int, int]]]:
+    """Parse a bytes Range header into sorted, coalesced inclusive (start, end) pairs.
+    
+    Returns None when the header should be ignored and the full file served
+    (unknown unit, malformed spec, too many ranges). Raises 416 when the
+    header is valid but no range overlaps the file.
+    """
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or not spec.strip():
+        return None
+    
+    ranges = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        first, sep, last = part.partition("-")
+        if not sep:
+            return None
+        try:
+            if first:
+                start = int(first)
+                end = int(last) if last else file_size - 1
+                if start < 0 or end < start:
+                    return None
+            else:
+                suffix_length = int(last)
+                if suffix_length < 0:
+                    return None
+                if suffix_length == 0:
+                    continue
+                start = max(file_size - suffix_length, 0)
+                end = file_size - 1
+        except ValueError:
+            return None
+        
+        # Ranges starting past the end are unsatisfiable and dropped
+        if start >= file_size:
+            continue
+        ranges.append((start, min(end, file_size - 1)))
+    
+    if not ranges:
+        raise HTTPException(
+            status_code=416,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{file_size}"}
+        )
+    
+    # Merge overlapping or adjacent ranges so no byte is sent twice
+    ranges.sort()
+    merged = [ranges[0]]
+    for start, end in ranges[1:]:
+        last_start, last_end = merged[-1]
+        if start <= last_end + 1:
+            merged[-1] = (last_start, max(last_end, end))
+        else:
+            merged.append((start, end))
+    
+    if len(merged) > MAX_RANGES_PER_REQUEST:
+        return None
+    return merged
+
+async def iter_grid_range(grid_out, start: int, end: int, read_ahead: int = None):
+    """Yield bytes start..end (inclusive) of a stored file, one chunk at a time.
+    
+    Works on a GridOut or a StoredFile from any storage backend. Seeks
+    straight to the chunk holding `start` and then reads on chunk
+    boundaries, so only the chunks covering the range are fetched. Up to
+    `read_ahead` chunks are prefetched while the client drains the previous
+    ones, which bounds memory per viewer to roughly (read_ahead + 1) chunks.
+    If the client disconnects the response is cancelled and reading stops.
+    """
+    if read_ahead is None:
+        read_ahead = DOWNLOAD_READ_AHEAD_CHUNKS
+    
+    async def read_chunks():
+        grid_out.seek(start)
+        chunk_size = grid_out.chunk_size
+        remaining = end - start + 1
+        # The first read finishes the partial chunk, later reads are chunk aligned
+        read_size = chunk_size - (start % chunk_size)
+        while remaining > 0:
+            data = await grid_out.read(min(read_size, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            read_size = chunk_size
+            yield data
+    
+    if read_ahead <= 0:
+        async for data in read_chunks():
+            yield data
+        return
+    
+    queue = asyncio.Queue(maxsize=read_ahead)
+    
+    async def prefetch():
+        try:
+            async for data in read_chunks():
+                await queue.put(data)
+        except Exception as e:
+            await queue.put(e)
+        else:
+            await queue.put(None)
+    
+    reader = asyncio.create_task(prefetch())
+    try:
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        reader.cancel()
+
+# Media storage backends. The bytes of a stored file live in GridFS, on
+# the local filesystem or in an S3-compatible object store, while its
+# catalogue entry (name, length, content type, upload date and metadata
+# such as the SHA-256 and reference count) stays in the GridFS files
+# collection whatever the backend, so lookups, deduplication and reports
+# work the same for all of them. A files document names its backend in
+# "storage" (absent for GridFS). New files go to STORAGE_BACKEND; existing
+# ones are read from wherever their document says, so migrate_storage.py
+# can move files while the API serves them.
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'gridfs')  # gridfs, local or s3
+STORAGE_LOCAL_DIR = Path(os.environ.get('STORAGE_LOCAL_DIR', ROOT_DIR / 'media'))
+STORAGE_S3_BUCKET = os.environ.get('STORAGE_S3_BUCKET', '')
+STORAGE_S3_PREFIX = os.environ.get('STORAGE_S3_PREFIX', 'media/')
+STORAGE_S3_ENDPOINT_URL = os.environ.get('STORAGE_S3_ENDPOINT_URL') or None  # MinIO and other S3-compatible stores
+STORAGE_S3_REGION = os.environ.get('STORAGE_S3_REGION') or None
+STORAGE_S3_MAX_CONNECTIONS = int(os.environ.get('STORAGE_S3_MAX_CONNECTIONS', 50))
+STORAGE_S3_PART_SIZE = max(5 * 1024 * 1024, int(os.environ.get('STORAGE_S3_PART_SIZE', 8 * 1024 * 1024)))
+# One ranged GET serves up to this many bytes of sequential reads
+STORAGE_S3_READ_WINDOW = GRIDFS_CHUNK_SIZE * max(1, int(os.environ.get('STORAGE_S3_READ_WINDOW', 8 * 1024 * 1024)) // GRIDFS_CHUNK_SIZE)
+# How long the old copy of a moved file is kept for downloads already reading it
+STORAGE_MOVE_GRACE_SECONDS = float(os.environ.get('STORAGE_MOVE_GRACE_SECONDS', 60))
+
+class StoredFile:
+    """A file stored outside GridFS, read through the same interface as a GridOut
+    (`_id`, `length`, `chunk_size`, `seek()` and `read()`), so downloads and the
+    media cache treat every backend alike.
+    """
+    
+    def __init__(self, document: Dict[str, Any], backend):
+        self._id = document["_id"]
+        self.filename = document.get("filename")
+        self.length = document["length"]
+        self.chunk_size = document.get("chunkSize", GRIDFS_CHUNK_SIZE)
+        self.upload_date = document["uploadDate"]
+        self.content_type = document.get("contentType")
+        self.metadata = document.get("metadata")
+        self.backend = backend
+        self.position = 0
+        self.stream = None  # backend specific read state
+    
+    def seek(self, position: int):
+        self.position = position
+    
+    async def read(self, size: int) -> bytes:
+        # Always returns `size` bytes short of the end, which keeps chunked
+        # reads on chunk boundaries
+        size = min(size, self.length - self.position)
+        pieces = []
+        while size > 0:
+            data = await self.backend.read(self, self.position, size)
+            if not data:
+                raise IOError(f"{self.backend.name} copy of {self._id} ends at {self.position} of {self.length} bytes")
+            pieces.append(data)
+            self.position += len(data)
+            size -= len(data)
+        return b"".join(pieces)
+
+async def rechunk(chunks, size: int):
+    """Regroup an async stream of byte strings into pieces of exactly `size` bytes (the last may be short)"""
+    buffer = bytearray()
+    async for data in chunks:
+        buffer += data
+        while len(buffer) >= size:
+            yield bytes(buffer[:size])
+            del buffer[:size]
+    if buffer:
+        yield bytes(buffer)
+
+class GridFSStorage:
+    """Bytes as chunk documents in fs.chunks"""
+    
+    name = "gridfs"
+    
+    async def open(self, document: Dict[str, Any]):
+        return AsyncIOMotorGridOut(db.fs, file_document=document)
+    
+    async def write(self, file_id: ObjectId, chunks) -> int:
+        length = 0
+        n = 0
+        try:
+            async for data in rechunk(chunks, GRIDFS_CHUNK_SIZE):
+                await write_gridfs_chunk(file_id, n, data)
+                length += len(data)
+                n += 1
+        except BaseException:
+            await self.delete(file_id)
+            raise
+        return length
+    
+    async def delete(self, file_id: ObjectId):
+        await db.fs.chunks.delete_many({"files_id": file_id})
+    
+    async def stat(self, file_id: ObjectId) -> Optional[int]:
+        results = await db.fs.chunks.aggregate([
+            {"$match": {"files_id": file_id}},
+            {"$group": {"_id": None, "length": {"$sum": {"$binarySize": "$data"}}}}
+        ]).to_list(1)
+        return results[0]["length"] if results else None
+
+class LocalStorage:
+    """Bytes as files under STORAGE_LOCAL_DIR, fanned out over 256 directories"""
+    
+    name = "local"
+    
+    def __init__(self, root: Path):
+        self.root = root
+        self.root.mkdir(parents=True, exist_ok=True)
+    
+    def path(self, file_id: ObjectId) -> Path:
+        # The low bytes of an ObjectId are a counter, so they spread evenly
+        key = str(file_id)
+        return self.root / key[-2:] / key
+    
+    async def open(self, document: Dict[str, Any]) -> StoredFile:
+        return StoredFile(document, self)
+    
+    async def read(self, handle: StoredFile, position: int, size: int) -> bytes:
+        def read_range():
+            with open(self.path(handle._id), "rb") as f:
+                f.seek(position)
+                return f.read(size)
+        return await asyncio.to_thread(read_range)
+    
+    async def write(self, file_id: ObjectId, chunks) -> int:
+        path = self.path(file_id)
+        path.parent.mkdir(exist_ok=True)
+        partial = path.with_name(f".{path.name}.{uuid.uuid4().hex}.part")
+        length = 0
+        try:
+            with open(partial, "wb") as f:
+                async for data in chunks:
+                    await asyncio.to_thread(f.write, data)
+                    length += len(data)
+                await asyncio.to_thread(os.fsync, f.fileno())
+            os.replace(partial, path)
+        except BaseException:
+            partial.unlink(missing_ok=True)
+            raise
+        return length
+    
+    async def delete(self, file_id: ObjectId):
+        self.path(file_id).unlink(missing_ok=True)
+    
+    async def stat(self, file_id: ObjectId) -> Optional[int]:
+        try:
+            return self.path(file_id).stat().st_size
+        except FileNotFoundError:
+            return None
+
+class S3Storage:
+    """Bytes as objects in an S3-compatible bucket, keyed STORAGE_S3_PREFIX + file id.
+    
+    boto3 is synchronous, so every call runs in a thread. Large writes use
+    multipart uploads of STORAGE_S3_PART_SIZE parts; reads stream ranged
+    GETs of up to STORAGE_S3_READ_WINDOW bytes.
+    """
+    
+    name = "s3"
+    
+    def __init__(self, bucket: str, prefix: str):
+        if boto3 is None:
+            raise RuntimeError("STORAGE_BACKEND=s3 needs the boto3 package installed")
+        if not bucket:
+            raise RuntimeError("STORAGE_BACKEND=s3 needs STORAGE_S3_BUCKET")
+        self.bucket = bucket
+        self.prefix = prefix
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=STORAGE_S3_ENDPOINT_URL,
+            region_name=STORAGE_S3_REGION,
+            config=BotoConfig(max_pool_connections=STORAGE_S3_MAX_CONNECTIONS, retries={"mode": "standard"})
+        )
+    
+    def key(self, file_id: ObjectId) -> str:
+        return f"{self.prefix}{file_id}"
+    
+    async def open(self, document: Dict[str, Any]) -> StoredFile:
+        return StoredFile(document, self)
+    
+    async def read(self, handle: StoredFile, position: int, size: int) -> bytes:
+        def read_range():
+            stream = handle.stream
+            if stream is None or stream["position"] != position:
+                if stream is not None:
+                    stream["body"].close()
+                end = min(position + STORAGE_S3_READ_WINDOW, handle.length) - 1
+                response = self.client.get_object(Bucket=self.bucket, Key=self.key(handle._id), Range=f"bytes={position}-{end}")
+                stream = handle.stream = {"body": response["Body"], "position": position, "end": end}
+            data = stream["body"].read(min(size, stream["end"] - position + 1))
+            stream["position"] += len(data)
+            if stream["position"] > stream["end"] or not data:
+                stream["body"].close()
+                handle.stream = None
+            return data
+        return await asyncio.to_thread(read_range)
+    
+    async def write(self, file_id: ObjectId, chunks) -> int:
+        key = self.key(file_id)
+        length = 0
+        upload_id = None
+        parts = []
+        try:
+            async for part in rechunk(chunks, STORAGE_S3_PART_SIZE):
+                length += len(part)
+                if upload_id is None and len(part) < STORAGE_S3_PART_SIZE:
+                    # Fits in one part: a single PUT
+                    await asyncio.to_thread(self.client.put_object, Bucket=self.bucket, Key=key, Body=part)
+                    return length
+                if upload_id is None:
+                    upload = await asyncio.to_thread(self.client.create_multipart_upload, Bucket=self.bucket, Key=key)
+                    upload_id = upload["UploadId"]
+                response = await asyncio.to_thread(
+                    self.client.upload_part,
+                    Bucket=self.bucket, Key=key, UploadId=upload_id, PartNumber=len(parts) + 1, Body=part
+                )
+                parts.append({"PartNumber": len(parts) + 1, "ETag": response["ETag"]})
+            if upload_id is None:
+                await asyncio.to_thread(self.client.put_object, Bucket=self.bucket, Key=key, Body=b"")
+            else:
+                await asyncio.to_thread(
+                    self.client.complete_multipart_upload,
+                    Bucket=self.bucket, Key=key, UploadId=upload_id, MultipartUpload={"Parts": parts}
+                )
+        except BaseException:
+            if upload_id is not None:
+                await asyncio.to_thread(self.client.abort_multipart_upload, Bucket=self.bucket, Key=key, UploadId=upload_id)
+            raise
+        return length
+    
+    async def delete(self, file_id: ObjectId):
+        await asyncio.to_thread(self.client.delete_object, Bucket=self.bucket, Key=self.key(file_id))
+    
+    async def presign_upload(
+        self,
+        file_id: ObjectId,
+        content_type: str,
+        length: int,
+        sha256: Optional[str],
+        expires_in: int
+    ) -> Tuple[str, Dict[str, str]]:
+        """URL and headers for one PUT of the whole file.
+        
+        Type, length and (if given) SHA-256 are signed, so the store rejects
+        any other body.
+        """
+        params = {"Bucket": self.bucket, "Key": self.key(file_id), "ContentType": content_type, "ContentLength": length}
+        headers = {"Content-Type": content_type}
+        if sha256:
+            checksum = base64.b64encode(bytes.fromhex(sha256)).decode()
+            params["ChecksumSHA256"] = checksum
+            headers["x-amz-checksum-sha256"] = checksum
+        # Signing may have to fetch credentials first
+        url = await asyncio.to_thread(self.client.generate_presigned_url, "put_object", Params=params, ExpiresIn=expires_in)
+        return url, headers
+    
+    async def presign_download(
+        self,
+        file_id: ObjectId,
+        expires_in: int,
+        content_type: Optional[str] = None,
+        content_disposition: Optional[str] = None,
+        cache_control: Optional[str] = None
+    ) -> str:
+        params = {"Bucket": self.bucket, "Key": self.key(file_id)}
+        # The store sends these in place of what it has on the object
+        if content_type:
+            params["ResponseContentType"] = content_type
+        if content_disposition:
+            params["ResponseContentDisposition"] = content_disposition
+        if cache_control:
+            params["ResponseCacheControl"] = cache_control
+        return await asyncio.to_thread(self.client.generate_presigned_url, "get_object", Params=params, ExpiresIn=expires_in)
+    
+    async def stat(self, file_id: ObjectId) -> Optional[int]:
+        try:
+            response = await asyncio.to_thread(self.client.head_object, Bucket=self.bucket, Key=self.key(file_id))
+        except BotoClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+        return response["ContentLength"]
+
+storage_backends: Dict[str, Any] = {}
+
+def get_storage_backend(name: str):
+    backend = storage_backends.get(name)
+    if backend is None:
+        if name == "gridfs":
+            backend = GridFSStorage()
+        elif name == "local":
+            backend = LocalStorage(STORAGE_LOCAL_DIR)
+        elif name == "s3":
+            backend = S3Storage(STORAGE_S3_BUCKET, STORAGE_S3_PREFIX)
+        else:
+            raise ValueError(f"Unsupported storage backend: {name}")
+        storage_backends[name] = backend
+    return backend
+
+# Where new files are written
+storage = get_storage_backend(STORAGE_BACKEND)
+
+def storage_filter(name: str) -> Dict[str, Any]:
+    """files documents whose bytes are in the named backend"""
+    return {"storage": {"$exists": False}} if name == "gridfs" else {"storage": name}
+
+def backend_for_document(document: Dict[str, Any]):
+    return get_storage_backend(document.get("storage", "gridfs"))
+
+async def open_stored_file(file_id: ObjectId):
+    """Readable handle on a stored file; raises gridfs.errors.NoFile like GridFS does"""
+    document = await db.fs.files.find_one({"_id": file_id})
+    if document is None:
+        raise gridfs.errors.NoFile(f"no file with id {file_id}")
+    return await backend_for_document(document).open(document)
+
+async def open_stored_file_by_name(filename: str):
+    """Latest file stored under a name"""
+    document = await db.fs.files.find_one({"filename": filename}, sort=[("uploadDate", DESCENDING)])
+    if document is None:
+        raise gridfs.errors.NoFile(f"no file named {filename}")
+    return await backend_for_document(document).open(document)
+
+async def register_stored_file(
+    file_id: ObjectId,
+    filename: str,
+    length: int,
+    content_type: Optional[str],
+    metadata: Dict[str, Any],
+    backend
 ):
-    """Upload video or image content with support for large files"""
+    """Insert the files document for bytes already written to `backend`.
     
-    # Validate category
-    valid_categories = ["videos", "pictures", "live_streams"]
-    if category not in valid_categories:
-        raise HTTPException(status_code=400, detail="Invalid category")
+    If the insert fails (a duplicate hash, say) the bytes are deleted, so
+    nothing is left without a catalogue entry.
+    """
+    document = {
+        "_id": file_id,
+        "length": length,
+        "chunkSize": GRIDFS_CHUNK_SIZE,
+        "uploadDate": datetime.now(timezone.utc),
+        "filename": filename,
+        "contentType": content_type,
+        "metadata": metadata
+    }
+    if backend.name != "gridfs":
+        document["storage"] = backend.name
+    try:
+        await db.fs.files.insert_one(document)
+    except BaseException:
+        await backend.delete(file_id)
+        raise
+
+async def put_stored_file(chunks, filename: str, content_type: str, metadata: Dict[str, Any], file_id: Optional[ObjectId] = None) -> ObjectId:
+    """Write a stream of bytes to the configured backend and catalogue it"""
+    file_id = file_id or ObjectId()
+    length = await storage.write(file_id, chunks)
+    await register_stored_file(file_id, filename, length, content_type, metadata, storage)
+    return file_id
+
+async def delete_stored_file(file_id: ObjectId):
+    # The catalogue entry goes first, so no reader can open a file whose bytes are gone
+    document = await db.fs.files.find_one_and_delete({"_id": file_id}, {"storage": 1})
+    if document is not None:
+        await backend_for_document(document).delete(file_id)
+
+async def move_stored_file(file_id: ObjectId, target_name: str):
+    """Copy a file's bytes to another backend and repoint its files document.
+    
+    Returns the backend still holding the old copy, for the caller to delete
+    once downloads already reading it are done (see release_moved_file), or
+    None when there was nothing to move.
+    """
+    document = await db.fs.files.find_one({"_id": file_id})
+    if document is None:
+        return None
+    source = backend_for_document(document)
+    target = get_storage_backend(target_name)
+    if source is target:
+        return None
+    
+    handle = await source.open(document)
+    length = await target.write(file_id, iter_grid_range(handle, 0, document["length"] - 1))
+    stored = await target.stat(file_id)
+    if length != document["length"] or stored != length:
+        await target.delete(file_id)
+        raise IOError(f"Copy of {file_id} to {target.name} has {stored} bytes, expected {document['length']}")
+    
+    # Repoint only if the file was not moved or deleted meanwhile
+    switch = {"$unset": {"storage": ""}} if target.name == "gridfs" else {"$set": {"storage": target.name}}
+    updated = await db.fs.files.update_one({"_id": file_id, **storage_filter(source.name)}, switch)
+    if updated.modified_count == 0:
+        await target.delete(file_id)
+        return None
+    return source
+
+async def release_moved_file(source, file_id: ObjectId, delay: float = STORAGE_MOVE_GRACE_SECONDS):
+    await asyncio.sleep(delay)
+    await source.delete(file_id)
+
+# Hot media cache. Chunk data read from storage goes through two tiers kept
+# by each worker: a byte-budgeted LRU of file chunks in memory, holding
+# small objects and the requested parts of large ones, and a disk cache of
+# whole large objects, served from memory-mapped files straight out of the
+# page cache. Objects are only admitted once they have been requested
+# MEDIA_CACHE_ADMIT_REQUESTS times (MEDIA_CACHE_DISK_ADMIT_REQUESTS for
+# disk) within a popularity window, so one-off requests never push out the
+# hot set. Files never change under a file id, so entries need no
+# invalidation; the files document is still read per request, so a deleted
+# file stops being served at once.
+MEDIA_CACHE_MEMORY_BYTES = int(os.environ.get('MEDIA_CACHE_MEMORY_BYTES', 256 * 1024 * 1024))
+MEDIA_CACHE_SMALL_OBJECT_BYTES = int(os.environ.get('MEDIA_CACHE_SMALL_OBJECT_BYTES', 4 * 1024 * 1024))  # never copied to disk
+MEDIA_CACHE_DISK_DIR = Path(os.environ.get('MEDIA_CACHE_DISK_DIR', Path(tempfile.gettempdir()) / 'gizzle-media-cache'))
+MEDIA_CACHE_DISK_BYTES = int(os.environ.get('MEDIA_CACHE_DISK_BYTES', 10 * 1024 * 1024 * 1024))  # 0 disables the disk tier
+MEDIA_CACHE_ADMIT_REQUESTS = int(os.environ.get('MEDIA_CACHE_ADMIT_REQUESTS', 2))
+MEDIA_CACHE_DISK_ADMIT_REQUESTS = int(os.environ.get('MEDIA_CACHE_DISK_ADMIT_REQUESTS', 3))
+MEDIA_CACHE_POPULARITY_WINDOW_SECONDS = float(os.environ.get('MEDIA_CACHE_POPULARITY_WINDOW_SECONDS', 300))
+MEDIA_CACHE_TRACKED_OBJECTS = int(os.environ.get('MEDIA_CACHE_TRACKED_OBJECTS', 100000))
+MEDIA_CACHE_FILL_WORKERS = int(os.environ.get('MEDIA_CACHE_FILL_WORKERS', 2))
+MEDIA_CACHE_FILL_QUEUE_SIZE = 100
+MEDIA_CACHE_READ_SIZE = 1024 * 1024
+
+def process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+class MediaCache:
+    """Memory and disk tiers in front of storage reads for this worker"""
+    
+    def __init__(self, memory_bytes: int, disk_root: Path, disk_bytes: int, fill_workers: int):
+        self.memory_budget = memory_bytes
+        self.disk_root = disk_root
+        self.disk_dir = disk_root / str(os.getpid())
+        self.disk_budget = disk_bytes
+        self.fill_workers = fill_workers
+        self.chunks: "OrderedDict[Tuple[str, int], bytes]" = OrderedDict()
+        self.chunk_numbers: Dict[str, set] = {}  # file id -> chunk numbers held in memory
+        self.memory_used = 0
+        self.disk_files: "OrderedDict[str, int]" = OrderedDict()  # file id -> length
+        self.disk_used = 0
+        self.popularity: Dict[str, int] = {}
+        self.filling: set = set()
+        self.fill_queue: asyncio.Queue = asyncio.Queue(maxsize=MEDIA_CACHE_FILL_QUEUE_SIZE)
+        self.tasks: List[asyncio.Task] = []
+        self.metrics = {
+            "memory_hits": 0,
+            "memory_misses": 0,
+            "memory_evictions": 0,
+            "disk_hits": 0,
+            "disk_fills": 0,
+            "disk_fill_failures": 0,
+            "disk_evictions": 0,
+            "bytes_from_memory": 0,
+            "bytes_from_disk": 0,
+            "bytes_from_storage": 0,
+            "storage_bytes_read": 0
+        }
+    
+    @property
+    def disk_enabled(self) -> bool:
+        return self.disk_budget > 0 and bool(self.tasks)
+    
+    def start(self):
+        if self.disk_budget > 0:
+            try:
+                self.prepare_disk_dir()
+            except OSError as e:
+                logger.error(f"Media disk cache disabled, {self.disk_dir} is unusable: {e}")
+                self.disk_budget = 0
+            else:
+                self.tasks = [asyncio.create_task(self.filler()) for _ in range(self.fill_workers)]
+        self.tasks.append(asyncio.create_task(self.age_popularity()))
+    
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        # Open mappings stay readable after their files are removed
+        shutil.rmtree(self.disk_dir, ignore_errors=True)
+        self.disk_files.clear()
+        self.disk_used = 0
+    
+    def prepare_disk_dir(self):
+        # Each worker owns <root>/<pid>; directories of dead workers are removed
+        self.disk_root.mkdir(parents=True, exist_ok=True)
+        for path in self.disk_root.iterdir():
+            if path.is_dir() and path.name.isdigit() and not process_alive(int(path.name)):
+                shutil.rmtree(path, ignore_errors=True)
+        shutil.rmtree(self.disk_dir, ignore_errors=True)
+        self.disk_dir.mkdir()
+    
+    def record_request(self, grid_out):
+        """Count a request for popularity and queue a disk copy once a large object is hot"""
+        file_id = str(grid_out._id)
+        count = self.popularity.get(file_id, 0) + 1
+        self.popularity[file_id] = count
+        if len(self.popularity) > MEDIA_CACHE_TRACKED_OBJECTS:
+            self.decay_popularity()
+        
+        if (
+            self.disk_enabled
+            and count >= MEDIA_CACHE_DISK_ADMIT_REQUESTS
+            and MEDIA_CACHE_SMALL_OBJECT_BYTES < grid_out.length <= self.disk_budget // 8
+            and not (isinstance(grid_out, StoredFile) and grid_out.backend.name == "local")  # already on disk
+            and file_id not in self.disk_files
+            and file_id not in self.filling
+        ):
+            try:
+                self.fill_queue.put_nowait((grid_out._id, grid_out.length))
+                self.filling.add(file_id)
+            except asyncio.QueueFull:
+                pass  # asked again on a later request
+    
+    def decay_popularity(self):
+        # Halving keeps recent demand dominant and forgets one-off requests
+        self.popularity = {file_id: count // 2 for file_id, count in self.popularity.items() if count > 1}
+    
+    async def age_popularity(self):
+        while True:
+            await asyncio.sleep(MEDIA_CACHE_POPULARITY_WINDOW_SECONDS)
+            self.decay_popularity()
+    
+    async def iter_range(self, grid_out, start: int, end: int):
+        """Yield bytes start..end (inclusive) of a stored file from the fastest tier holding them"""
+        file_id = str(grid_out._id)
+        mapped = self.open_disk_copy(file_id, grid_out.length)
+        if mapped is not None:
+            self.metrics["disk_hits"] += 1
+            async for data in self.iter_mapped(mapped, start, end):
+                yield data
+        elif self.memory_budget > 0 and self.popularity.get(file_id, 0) >= MEDIA_CACHE_ADMIT_REQUESTS:
+            async for data in self.iter_chunks(grid_out, start, end):
+                yield data
+        else:
+            async for data in iter_grid_range(grid_out, start, end):
+                self.metrics["bytes_from_storage"] += len(data)
+                self.metrics["storage_bytes_read"] += len(data)
+                yield data
+    
+    async def iter_chunks(self, grid_out, start: int, end: int):
+        # Only the chunks covering the range are cached, so seeking players
+        # leave the parts actually watched in memory
+        file_id = str(grid_out._id)
+        chunk_size = grid_out.chunk_size
+        number, last = start // chunk_size, end // chunk_size
+        while number <= last:
+            data = self.chunks.get((file_id, number))
+            if data is not None:
+                self.chunks.move_to_end((file_id, number))
+                self.metrics["memory_hits"] += 1
+                piece = self.slice_chunk(data, number * chunk_size, start, end)
+                self.metrics["bytes_from_memory"] += len(piece)
+                yield piece
+                number += 1
+                continue
+            
+            # Fetch the run of missing chunks in one chunk-aligned read
+            run_end = number
+            while run_end < last and (file_id, run_end + 1) not in self.chunks:
+                run_end += 1
+            read_end = min((run_end + 1) * chunk_size, grid_out.length) - 1
+            async for data in iter_grid_range(grid_out, number * chunk_size, read_end):
+                self.metrics["memory_misses"] += 1
+                self.metrics["storage_bytes_read"] += len(data)
+                self.store_chunk(file_id, number, data)
+                piece = self.slice_chunk(data, number * chunk_size, start, end)
+                self.metrics["bytes_from_storage"] += len(piece)
+                yield piece
+                number += 1
+    
+    @staticmethod
+    def slice_chunk(data: bytes, offset: int, start: int, end: int) -> bytes:
+        low, high = max(start - offset, 0), min(end - offset + 1, len(data))
+        return data if low == 0 and high == len(data) else data[low:high]
+    
+    def store_chunk(self, file_id: str, number: int, data: bytes):
+        if len(data) > self.memory_budget or (file_id, number) in self.chunks:
+            return
+        self.chunks[(file_id, number)] = data
+        self.chunk_numbers.setdefault(file_id, set()).add(number)
+        self.memory_used += len(data)
+        while self.memory_used > self.memory_budget:
+            (evicted_id, evicted_number), evicted = self.chunks.popitem(last=False)
+            self.forget_chunk(evicted_id, evicted_number, evicted)
+            self.metrics["memory_evictions"] += 1
+    
+    def forget_chunk(self, file_id: str, number: int, data: bytes):
+        self.memory_used -= len(data)
+        numbers = self.chunk_numbers.get(file_id)
+        if numbers is not None:
+            numbers.discard(number)
+            if not numbers:
+                del self.chunk_numbers[file_id]
+    
+    def drop_memory(self, file_id: str):
+        for number in list(self.chunk_numbers.get(file_id, ())):
+            data = self.chunks.pop((file_id, number), None)
+            if data is not None:
+                self.forget_chunk(file_id, number, data)
+    
+    def open_disk_copy(self, file_id: str, length: int) -> Optional[mmap.mmap]:
+        if file_id not in self.disk_files:
+            return None
+        try:
+            with open(self.disk_dir / file_id, "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            self.drop_disk_copy(file_id)
+            return None
+        if len(mapped) != length:
+            mapped.close()
+            self.drop_disk_copy(file_id)
+            return None
+        self.disk_files.move_to_end(file_id)
+        return mapped
+    
+    async def iter_mapped(self, mapped: mmap.mmap, start: int, end: int):
+        # The mapping outlives eviction of its file, so readers never block it
+        try:
+            position = start
+            while position <= end:
+                read_end = min(position + MEDIA_CACHE_READ_SIZE, end + 1)
+                if read_end <= end and hasattr(mmap, "MADV_WILLNEED"):
+                    # Let the kernel page in the next read while this one is sent
+                    advise_from = read_end - read_end % mmap.PAGESIZE
+                    mapped.madvise(mmap.MADV_WILLNEED, advise_from, min(MEDIA_CACHE_READ_SIZE, len(mapped) - advise_from))
+                data = mapped[position:read_end]
+                position = read_end
+                self.metrics["bytes_from_disk"] += len(data)
+                yield data
+        finally:
+            mapped.close()
+    
+    def drop_disk_copy(self, file_id: str):
+        length = self.disk_files.pop(file_id, None)
+        if length is not None:
+            self.disk_used -= length
+            (self.disk_dir / file_id).unlink(missing_ok=True)
+    
+    async def filler(self):
+        while True:
+            object_id, length = await self.fill_queue.get()
+            try:
+                await self.fill(object_id, length)
+                self.metrics["disk_fills"] += 1
+            except Exception as e:
+                self.metrics["disk_fill_failures"] += 1
+                logger.error(f"Failed to copy {object_id} to the media cache: {e}")
+            finally:
+                self.filling.discard(str(object_id))
+    
+    async def fill(self, object_id: ObjectId, length: int):
+        file_id = str(object_id)
+        grid_out = await open_stored_file(object_id)
+        partial = self.disk_dir / f".{file_id}.{uuid.uuid4().hex}.part"
+        loop = asyncio.get_running_loop()
+        try:
+            with open(partial, "wb") as f:
+                async for data in iter_grid_range(grid_out, 0, length - 1):
+                    self.metrics["storage_bytes_read"] += len(data)
+                    await loop.run_in_executor(None, f.write, data)
+            while self.disk_files and self.disk_used + length > self.disk_budget:
+                evicted_id = next(iter(self.disk_files))
+                self.drop_disk_copy(evicted_id)
+                self.metrics["disk_evictions"] += 1
+            os.replace(partial, self.disk_dir / file_id)
+        except BaseException:
+            partial.unlink(missing_ok=True)
+            raise
+        self.disk_files[file_id] = length
+        self.disk_used += length
+        # Served from the disk copy from now on
+        self.drop_memory(file_id)
+    
+    def stats(self) -> Dict[str, Any]:
+        metrics = self.metrics
+        served = metrics["bytes_from_memory"] + metrics["bytes_from_disk"] + metrics["bytes_from_storage"]
+        return {
+            "memory": {
+                "bytes": self.memory_used,
+                "budget": self.memory_budget,
+                "chunks": len(self.chunks),
+                "objects": len(self.chunk_numbers),
+                "hits": metrics["memory_hits"],
+                "misses": metrics["memory_misses"],
+                "evictions": metrics["memory_evictions"]
+            },
+            "disk": {
+                "bytes": self.disk_used,
+                "budget": self.disk_budget,
+                "objects": len(self.disk_files),
+                "hits": metrics["disk_hits"],
+                "fills": metrics["disk_fills"],
+                "fills_pending": len(self.filling),
+                "fill_failures": metrics["disk_fill_failures"],
+                "evictions": metrics["disk_evictions"]
+            },
+            "tracked_objects": len(self.popularity),
+            "bytes_from_memory": metrics["bytes_from_memory"],
+            "bytes_from_disk": metrics["bytes_from_disk"],
+            "bytes_from_storage": metrics["bytes_from_storage"],
+            "storage_bytes_read": metrics["storage_bytes_read"],
+            "hit_ratio": round((served - metrics["bytes_from_storage"]) / served, 4) if served else None
+        }
+
+media_cache = MediaCache(MEDIA_CACHE_MEMORY_BYTES, MEDIA_CACHE_DISK_DIR, MEDIA_CACHE_DISK_BYTES, MEDIA_CACHE_FILL_WORKERS)
+
+# Content listing pagination
+CONTENT_LISTING_SORT = [("upload_timestamp", -1), ("id", -1)]
+
+def encode_content_cursor(item: Dict[str, Any]) -> str:
+    """Opaque cursor pointing just after `item` in the listing order"""
+    payload = json.dumps([item["upload_timestamp"].isoformat(), item["id"]])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_content_cursor(cursor: str) -> Tuple[datetime, str]:
+    """Inverse of encode_content_cursor, 400 if the cursor was tampered with"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        timestamp, item_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(timestamp), str(item_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+# Indexes backing every hot query, declared per collection. Created
+# idempotently at startup; build results are kept in INDEX_BUILD_STATUS.
+MONGO_INDEXES = {
+    "content_items": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel(
+            [("category", ASCENDING), ("upload_timestamp", DESCENDING), ("id", DESCENDING)],
+            name="category_upload_timestamp_id"
+        ),
+        IndexModel([("processing_status", ASCENDING)], name="processing_status"),
+        IndexModel([("filename", ASCENDING)], name="filename"),
+        IndexModel([("tags", ASCENDING)], name="tags"),
+        IndexModel([("abr_status", ASCENDING)], name="abr_status", sparse=True),
+        IndexModel(
+            [("original_filename", TEXT), ("description", TEXT), ("tags", TEXT)],
+            name="search_text",
+            weights={"tags": 10, "original_filename": 5, "description": 1}
+        )
+    ],
+    "model_profiles": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("username", ASCENDING)], name="username_unique", unique=True),
+        IndexModel([("is_featured", ASCENDING)], name="is_featured"),
+        IndexModel([("category", ASCENDING)], name="category"),
+        IndexModel([("verification_status", ASCENDING)], name="verification_status"),
+        IndexModel([("tags", ASCENDING)], name="tags"),
+        IndexModel(
+            [("name", TEXT), ("username", TEXT), ("tags", TEXT), ("bio", TEXT)],
+            name="search_text",
+            weights={"name": 10, "username": 8, "tags": 5, "bio": 1}
+        )
+    ],
+    "community_members": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("username", ASCENDING)], name="username_unique", unique=True),
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True)
+    ],
+    "upload_sessions": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("status", ASCENDING), ("updated_at", ASCENDING)], name="status_updated_at")
+    ],
+    "direct_uploads": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("status", ASCENDING), ("updated_at", ASCENDING)], name="status_updated_at")
+    ],
+    # GridFS's own indexes, declared because chunks and files documents are written directly
+    "fs.files": [
+        IndexModel([("filename", ASCENDING), ("uploadDate", ASCENDING)], name="filename_1_uploadDate_1"),
+        IndexModel(
+            [("metadata.sha256", ASCENDING)],
+            name="metadata_sha256_unique",
+            unique=True,
+            partialFilterExpression={"metadata.sha256": {"$exists": True}}
+        )
+    ],
+    "fs.chunks": [
+        IndexModel([("files_id", ASCENDING), ("n", ASCENDING)], name="files_id_1_n_1", unique=True)
+    ],
+    "payment_events": [
+        IndexModel([("event_id", ASCENDING)], name="event_id_unique", unique=True),
+        IndexModel([("status", ASCENDING), ("next_attempt_at", ASCENDING), ("created", ASCENDING)], name="status_next_attempt_created")
+    ],
+    "content_tag_stats": [
+        IndexModel([("category", ASCENDING), ("count", DESCENDING)], name="category_count")
+    ],
+    "search_suggestions": [
+        IndexModel([("kind", ASCENDING), ("term", ASCENDING)], name="kind_term")
+    ],
+    "live_streams": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("status", ASCENDING), ("started_at", DESCENDING)], name="status_started_at")
+    ],
+    "live_segments": [
+        IndexModel([("stream_id", ASCENDING), ("sequence", ASCENDING)], name="stream_id_sequence_unique", unique=True)
+    ],
+    "payment_transactions": [
+        IndexModel([("session_id", ASCENDING)], name="session_id_unique", unique=True)
+    ]
+}
+
+INDEX_BUILD_STATUS: Dict[str, Dict[str, str]] = {}
+
+async def ensure_indexes():
+    """Create every declared index, recording per-index success or failure"""
+    for collection_name, indexes in MONGO_INDEXES.items():
+        collection_status = INDEX_BUILD_STATUS.setdefault(collection_name, {})
+        for index in indexes:
+            index_name = index.document["name"]
+            collection_status[index_name] = "building"
+            try:
+                await db[collection_name].create_indexes([index])
+                collection_status[index_name] = "ready"
+            except PyMongoError as e:
+                # e.g. existing duplicates blocking a unique index
+                collection_status[index_name] = f"failed: {e}"
+                logger.error(f"Failed to build index {collection_name}.{index_name}: {e}")
+    
+    failed = sum(1 for statuses in INDEX_BUILD_STATUS.values() for status in statuses.values() if status != "ready")
+    logger.info(f"Index provisioning finished ({failed} failed)")
+
+def duplicate_key_field(error: DuplicateKeyError) -> Optional[str]:
+    """Name of the field whose unique index rejected an insert"""
+    details = error.details or {}
+    key_pattern = details.get("keyPattern") or details.get("keyValue") or {}
+    if key_pattern:
+        return next(iter(key_pattern))
+    # Older servers only report the index name in the message
+    for field in ("username", "email", "id"):
+        if f"{field}_" in str(error):
+            return field
+    return None
+
+# Background media processing
+MEDIA_QUEUE_SIZE = int(os.environ.get('MEDIA_QUEUE_SIZE', 100))
+MEDIA_WORKERS = int(os.environ.get('MEDIA_WORKERS', 2))
+MEDIA_PROCESS_WORKERS = int(os.environ.get('MEDIA_PROCESS_WORKERS', 2))
+MEDIA_RESCAN_INTERVAL = float(os.environ.get('MEDIA_RESCAN_INTERVAL', 30))
+THUMBNAIL_WIDTH = int(os.environ.get('THUMBNAIL_WIDTH', 480))
+
+def extract_media_metadata(path: str) -> Dict[str, Any]:
+    """Probe a video with ffprobe and grab a JPEG thumbnail with ffmpeg.
+    
+    Runs inside the media process pool, so it must stay a plain top-level
+    function that only takes and returns picklable values.
+    """
+    probe = subprocess.run(
+        ["ffprobe", "-v", "error", "-print_format", "json", "-show_format", "-show_streams", path],
+        capture_output=True, check=True, timeout=120
+    )
+    info = json.loads(probe.stdout)
+    streams = info.get("streams", [])
+    video = next((stream for stream in streams if stream.get("codec_type") == "video"), {})
+    audio = next((stream for stream in streams if stream.get("codec_type") == "audio"), {})
+    duration = float(info.get("format", {}).get("duration") or video.get("duration") or 0)
+    
+    media_info = {
+        "duration": duration,
+        "width": video.get("width"),
+        "height": video.get("height"),
+        "video_codec": video.get("codec_name"),
+        "audio_codec": audio.get("codec_name"),
+        "format": info.get("format", {}).get("format_name")
+    }
+    
+    thumbnail = None
+    if video:
+        # A frame a little way in is more representative than the first one
+        offset = min(1.0, duration / 10) if duration else 0
+        grab = subprocess.run(
+            [
+                "ffmpeg", "-v", "error", "-ss", f"{offset:.3f}", "-i", path,
+                "-frames:v", "1", "-vf", f"scale={THUMBNAIL_WIDTH}:-2",
+                "-f", "image2", "-c:v", "mjpeg", "pipe:1"
+            ],
+            capture_output=True, check=True, timeout=120
+        )
+        thumbnail = grab.stdout or None
+    
+    return {"media_info": media_info, "thumbnail": thumbnail}
+
+async def download_to_tempfile(file_id: ObjectId, suffix: str = "") -> str:
+    """Copy a stored file to a local temp file for tools that need a path"""
+    grid_out = await open_stored_file(file_id)
+    handle = tempfile.NamedTemporaryFile(suffix=suffix, delete=False)
+    try:
+        async for data in iter_grid_range(grid_out, 0, grid_out.length - 1):
+            await asyncio.to_thread(handle.write, data)
+    except BaseException:
+        handle.close()
+        os.unlink(handle.name)
+        raise
+    handle.close()
+    return handle.name
+
+async def store_media_bytes(filename: str, data: bytes, content_type: str, metadata: Dict[str, Any]) -> ObjectId:
+    """Store a small generated file (thumbnail, derivative)"""
+    async def body():
+        yield data
+    return await put_stored_file(body(), filename, content_type, metadata)
+
+class MediaPipeline:
+    """Moves uploaded videos from "processing" to "completed"/"failed".
+    
+    Mongo is the source of truth: an item is pending work for as long as its
+    processing_status is "processing". New uploads are handed over directly
+    when the bounded queue has room; a periodic rescan picks up anything that
+    did not fit and anything left over from a previous run, blocking on the
+    queue so the backlog is drained at the pace the workers allow.
+    """
+    
+    def __init__(self, workers: int, process_workers: int, queue_size: int, rescan_interval: float):
+        self.workers = workers
+        self.process_workers = process_workers
+        self.rescan_interval = rescan_interval
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.in_flight = set()
+        self.pool = None
+        self.tasks = []
+    
+    def start(self):
+        self.pool = ProcessPoolExecutor(
+            max_workers=self.process_workers,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+        self.tasks = [asyncio.create_task(self.worker()) for _ in range(self.workers)]
+        self.tasks.append(asyncio.create_task(self.rescan()))
+    
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        if self.pool:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+    
+    def submit(self, content_id: str) -> bool:
+        """Queue an item without waiting; False means the rescan will get to it"""
+        if content_id in self.in_flight:
+            return True
+        try:
+            self.queue.put_nowait(content_id)
+        except asyncio.QueueFull:
+            logger.info(f"Media queue full, deferring {content_id} to the next rescan")
+            return False
+        self.in_flight.add(content_id)
+        return True
+    
+    async def rescan(self):
+        while True:
+            try:
+                cursor = db.content_items.find({"processing_status": "processing"}, {"_id": 0, "id": 1})
+                async for item in cursor:
+                    if item["id"] in self.in_flight:
+                        continue
+                    self.in_flight.add(item["id"])
+                    await self.queue.put(item["id"])
+            except PyMongoError as e:
+                logger.error(f"Media rescan failed: {e}")
+            await asyncio.sleep(self.rescan_interval)
+    
+    async def worker(self):
+        while True:
+            content_id = await self.queue.get()
+            try:
+                await self.process(content_id)
+            except Exception as e:
+                logger.error(f"Media processing failed for {content_id}: {e}")
+                # Must not end the worker: the rescan retries items left in "processing"
+                try:
+                    previous = await db.content_items.find_one_and_update(
+                        {"id": content_id, "processing_status": {"$ne": "failed"}},
+                        {"$set": {"processing_status": "failed", "processing_error": str(e)[:500]}},
+                        projection={"_id": 0, "category": 1, "processing_status": 1}
+                    )
+                    if previous:
+                        await record_status_change(previous["category"], previous["processing_status"], "failed")
+                        await invalidate_content_listings(previous["category"])
+                except (PyMongoError, *CACHE_BACKEND_ERRORS) as bookkeeping_error:
+                    logger.error(f"Could not mark {content_id} as failed: {bookkeeping_error}")
+            finally:
+                self.in_flight.discard(content_id)
+                self.queue.task_done()
+    
+    async def process(self, content_id: str):
+        item = await db.content_items.find_one({"id": content_id, "processing_status": "processing"})
+        if not item:
+            return
+        
+        suffix = Path(item.get("original_filename") or "").suffix
+        path = await download_to_tempfile(ObjectId(item["filename"]), suffix=suffix)
+        try:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(self.pool, extract_media_metadata, path)
+        finally:
+            os.unlink(path)
+        
+        update = {"media_info": result["media_info"], "processing_status": "completed"}
+        if item["category"] == "videos" and result["media_info"].get("height"):
+            update["abr_status"] = "pending"
+        if result["thumbnail"]:
+            thumbnail_id = await store_media_bytes(
+                f"{Path(item.get('original_filename') or content_id).stem}_thumb.jpg",
+                result["thumbnail"],
+                content_type="image/jpeg",
+                metadata={"category": item["category"], "thumbnail_for": content_id}
+            )
+            update["thumbnail_id"] = str(thumbnail_id)
+        
+        updated = await db.content_items.update_one({"id": content_id, "processing_status": "processing"}, {"$set": update})
+        if updated.modified_count:
+            await record_status_change(item["category"], "processing", "completed")
+        await invalidate_content_listings(item["category"])
+        if update.get("abr_status") == "pending":
+            transcode_pipeline.notify()
+        logger.info(f"Processed {content_id}: {result['media_info']}")
+
+media_pipeline = MediaPipeline(
+    workers=MEDIA_WORKERS,
+    process_workers=MEDIA_PROCESS_WORKERS,
+    queue_size=MEDIA_QUEUE_SIZE,
+    rescan_interval=MEDIA_RESCAN_INTERVAL
+)
+
+# Image derivatives for the pictures category. Variants are rendered on
+# first request, stored in GridFS and memoized on ContentItem.derivatives.
+IMAGE_VARIANTS = {
+    "thumb": int(os.environ.get('IMAGE_VARIANT_THUMB_WIDTH', 320)),
+    "medium": int(os.environ.get('IMAGE_VARIANT_MEDIUM_WIDTH', 1280)),
+    "full": int(os.environ.get('IMAGE_VARIANT_FULL_WIDTH', 2560))
+}
+
+# Output formats in order of preference: (ffmpeg encoder, content type)
+IMAGE_VARIANT_FORMATS = {
+    "webp": ("libwebp", "image/webp"),
+    "jpeg": ("mjpeg", "image/jpeg")
+}
+
+def render_image_variant(path: str, max_width: int, encoder: str) -> bytes:
+    """Downscale (never upscale) and re-encode an image; runs in the media process pool"""
+    result = subprocess.run(
+        [
+            "ffmpeg", "-v", "error", "-i", path, "-frames:v", "1",
+            "-vf", f"scale='min({max_width},iw)':-2",
+            "-c:v", encoder, "-q:v", "4", "-f", "image2", "pipe:1"
+        ],
+        capture_output=True, check=True, timeout=120
+    )
+    if not result.stdout:
+        raise RuntimeError("ffmpeg produced no output")
+    return result.stdout
+
+def negotiate_image_format(accept_header: Optional[str]) -> str:
+    """Pick WebP when the client says it takes it, JPEG otherwise"""
+    if accept_header and "image/webp" in accept_header:
+        return "webp"
+    return "jpeg"
+
+derivative_jobs: Dict[str, asyncio.Task] = {}
+
+async def create_image_derivative(file_id: ObjectId, variant: str, image_format: str) -> ObjectId:
+    """Render one derivative, store it and link it from every item showing the file"""
+    path = await download_to_tempfile(file_id)
+    try:
+        loop = asyncio.get_running_loop()
+        try:
+            encoder, content_type = IMAGE_VARIANT_FORMATS[image_format]
+            data = await loop.run_in_executor(media_pipeline.pool, render_image_variant, path, IMAGE_VARIANTS[variant], encoder)
+        except (subprocess.SubprocessError, RuntimeError, OSError):
+            if image_format == "jpeg":
+                raise
+            # ffmpeg builds without libwebp still get a JPEG derivative
+            image_format = "jpeg"
+            encoder, content_type = IMAGE_VARIANT_FORMATS[image_format]
+            data = await loop.run_in_executor(media_pipeline.pool, render_image_variant, path, IMAGE_VARIANTS[variant], encoder)
+    finally:
+        os.unlink(path)
+    
+    derivative_id = await store_media_bytes(
+        f"{file_id}_{variant}.{image_format}",
+        data,
+        content_type=content_type,
+        metadata={"category": "pictures", "derivative_of": str(file_id), "variant": variant}
+    )
+    # Deduplicated uploads share the file, so they share its derivatives too
+    await db.content_items.update_many(
+        {"filename": str(file_id)},
+        {"$set": {f"derivatives.{variant}_{image_format}": str(derivative_id)}}
+    )
+    await invalidate_content_listings("pictures")
+    logger.info(f"Created {variant}/{image_format} derivative of {file_id} ({len(data)} bytes)")
+    return derivative_id
+
+async def get_image_derivative(file_id: ObjectId, variant: str, image_format: str) -> ObjectId:
+    """GridFS id of a picture derivative, rendering it once on first request"""
+    item = await db.content_items.find_one(
+        {"filename": str(file_id)}, {"_id": 0, "derivatives": 1}, sort=[("upload_timestamp", ASCENDING)]
+    )
+    if not item:
+        raise HTTPException(status_code=404, detail="File not found")
+    
+    derivatives = item.get("derivatives") or {}
+    # A JPEG stored as the WebP fallback is served for WebP requests too
+    for key in (f"{variant}_{image_format}", f"{variant}_jpeg"):
+        if key in derivatives:
+            return ObjectId(derivatives[key])
+    
+    # Concurrent first requests share one render
+    job_key = f"{file_id}:{variant}:{image_format}"
+    job = derivative_jobs.get(job_key)
+    if job is None:
+        job = asyncio.create_task(create_image_derivative(file_id, variant, image_format))
+        derivative_jobs[job_key] = job
+        job.add_done_callback(lambda _: derivative_jobs.pop(job_key, None))
+    try:
+        return await asyncio.shield(job)
+    except (subprocess.SubprocessError, RuntimeError, OSError) as e:
+        # Also covers a render that timed out and an ffmpeg that is not installed
+        logger.error(f"Failed to render {variant} derivative of {file_id}: {e}")
+        raise HTTPException(status_code=500, detail="Failed to render image variant")
+
+# Adaptive bitrate streaming. Completed videos get an HLS rendition ladder
+# built by ffmpeg in one pass (decode once, scale and encode each rung).
+# Every file of a ladder is stored in GridFS under "hls/<hls_id>/<path>",
+# the master playlist with hls_id as its own id, so a ladder never changes
+# once written and can be cached forever. Jobs are claimed in Mongo and
+# TRANSCODE_MAX_JOBS bounds how many run at once in this worker.
+ABR_LADDER = [
+    (int(height), int(bitrate))
+    for height, bitrate in (
+        rung.split(":") for rung in os.environ.get('ABR_LADDER', '1080:5000,720:2800,480:1400,360:800').split(",")
+    )
+]  # (height, video kbps), highest first
+ABR_AUDIO_BITRATE_KBPS = int(os.environ.get('ABR_AUDIO_BITRATE_KBPS', 128))
+ABR_SEGMENT_SECONDS = int(os.environ.get('ABR_SEGMENT_SECONDS', 6))
+TRANSCODE_MAX_JOBS = int(os.environ.get('TRANSCODE_MAX_JOBS', 1))
+TRANSCODE_TIMEOUT_SECONDS = int(os.environ.get('TRANSCODE_TIMEOUT_SECONDS', 4 * 3600))
+TRANSCODE_POLL_INTERVAL_SECONDS = float(os.environ.get('TRANSCODE_POLL_INTERVAL_SECONDS', 30))
+HLS_CACHE_CONTROL = "public, max-age=31536000, immutable"
+HLS_PLAYLIST_MEDIA_TYPE = "application/vnd.apple.mpegurl"
+HLS_CONTENT_TYPES = {".m3u8": HLS_PLAYLIST_MEDIA_TYPE, ".ts": "video/mp2t"}
+
+def ladder_for(source_height: int) -> List[Tuple[int, int]]:
+    """Rungs no taller than the source; the lowest one always stays"""
+    rungs = [rung for rung in ABR_LADDER if rung[0] <= source_height]
+    return rungs or [min(ABR_LADDER)]
+
+def transcode_rendition_ladder(
+    path: str,
+    output_dir: str,
+    ladder: List[Tuple[int, int]],
+    source_size: Tuple[int, int],
+    has_audio: bool
+) -> List[Dict[str, Any]]:
+    """Encode every rung as VOD HLS into output_dir/<name>/ with output_dir/master.m3u8.
+    
+    Runs inside the transcode process pool, so like extract_media_metadata
+    it must stay a top-level function with picklable arguments.
+    """
+    names = [f"{height}p" for height, _ in ladder]
+    split = f"[0:v]split={len(ladder)}" + "".join(f"[v{index}]" for index in range(len(ladder)))
+    scales = "".join(f";[v{index}]scale=-2:{height}[v{index}out]" for index, (height, _) in enumerate(ladder))
+    command = ["ffmpeg", "-v", "error", "-y", "-i", path, "-filter_complex", split + scales]
+    for index, (_, bitrate) in enumerate(ladder):
+        command += [
+            "-map", f"[v{index}out]",
+            f"-c:v:{index}", "libx264",
+            f"-b:v:{index}", f"{bitrate}k",
+            f"-maxrate:v:{index}", f"{int(bitrate * 1.07)}k",
+            f"-bufsize:v:{index}", f"{int(bitrate * 1.5)}k"
+        ]
+        if has_audio:
+            command += ["-map", "0:a:0", f"-c:a:{index}", "aac", f"-b:a:{index}", f"{ABR_AUDIO_BITRATE_KBPS}k"]
+    stream_map = " ".join(
+        f"v:{index}" + (f",a:{index}" if has_audio else "") + f",name:{name}"
+        for index, name in enumerate(names)
+    )
+    command += [
+        "-preset", "veryfast",
+        # Keyframes on segment boundaries in every rung so players can switch
+        "-force_key_frames", f"expr:gte(t,n_forced*{ABR_SEGMENT_SECONDS})",
+        "-sc_threshold", "0",
+        "-f", "hls",
+        "-hls_time", str(ABR_SEGMENT_SECONDS),
+        "-hls_playlist_type", "vod",
+        "-hls_flags", "independent_segments",
+        "-hls_segment_filename", os.path.join(output_dir, "%v", "segment_%05d.ts"),
+        "-var_stream_map", stream_map,
+        os.path.join(output_dir, "%v", "index.m3u8")
+    ]
+    subprocess.run(command, capture_output=True, check=True, timeout=TRANSCODE_TIMEOUT_SECONDS)
+    
+    # The master playlist is written here rather than by ffmpeg so its
+    # rendition paths are exactly the ones stored
+    source_width, source_height = source_size
+    audio_bps = ABR_AUDIO_BITRATE_KBPS * 1000 if has_audio else 0
+    renditions = [
+        {
+            "name": name,
+            "width": round(height * source_width / source_height / 2) * 2 if source_height else None,
+            "height": height,
+            "bitrate": int(bitrate * 1.07) * 1000 + audio_bps  # peak, as BANDWIDTH requires
+        }
+        for name, (height, bitrate) in zip(names, ladder)
+    ]
+    lines = ["#EXTM3U", "#EXT-X-VERSION:3", "#EXT-X-INDEPENDENT-SEGMENTS"]
+    for rendition in renditions:
+        resolution = f",RESOLUTION={rendition['width']}x{rendition['height']}" if rendition["width"] else ""
+        lines.append(f"#EXT-X-STREAM-INF:BANDWIDTH={rendition['bitrate']}{resolution}")
+        lines.append(f"{rendition['name']}/index.m3u8")
+    with open(os.path.join(output_dir, "master.m3u8"), "w") as master:
+        master.write("\n".join(lines) + "\n")
+    return renditions
+
+async def store_media_file(path: str, filename: str, content_type: str, metadata: Dict[str, Any], file_id: Optional[ObjectId] = None) -> ObjectId:
+    """Stream a local file into storage"""
+    async def body():
+        with open(path, "rb") as handle:
+            while True:
+                data = await asyncio.to_thread(handle.read, GRIDFS_CHUNK_SIZE * 16)
+                if not data:
+                    break
+                yield data
+    return await put_stored_file(body(), filename, content_type, metadata, file_id=file_id)
+
+async def delete_hls_files(hls_id: str):
+    """Remove every stored file of a (partly) stored ladder"""
+    async for grid_file in db.fs.files.find({"filename": {"$regex": f"^hls/{hls_id}/"}}, {"_id": 1}):
+        await delete_stored_file(grid_file["_id"])
+
+class TranscodePipeline:
+    """Builds rendition ladders for items whose abr_status is "pending" """
+    
+    def __init__(self, max_jobs: int, poll_interval: float):
+        self.max_jobs = max_jobs
+        self.poll_interval = poll_interval
+        self.wakeup = asyncio.Event()
+        self.pool = None
+        self.tasks = []
+    
+    def start(self):
+        self.pool = ProcessPoolExecutor(
+            max_workers=self.max_jobs,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+        self.tasks = [asyncio.create_task(self.run()) for _ in range(self.max_jobs)]
+    
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        if self.pool:
+            # Unfinished jobs are claimed again after their lock expires
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+    
+    def notify(self):
+        self.wakeup.set()
+    
+    async def run(self):
+        while True:
+            try:
+                while await self.process_next():
+                    pass
+            except PyMongoError as e:
+                logger.error(f"Transcode pipeline could not reach Mongo: {e}")
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+    
+    async def claim_next(self) -> Optional[Dict[str, Any]]:
+        now = datetime.now(timezone.utc)
+        return await db.content_items.find_one_and_update(
+            {"$or": [
+                {"abr_status": "pending"},
+                # Claimed by a worker that died mid-job
+                {"abr_status": "processing", "abr_locked_until": {"$lt": now}}
+            ]},
+            {"$set": {"abr_status": "processing", "abr_locked_until": now + timedelta(seconds=TRANSCODE_TIMEOUT_SECONDS + 600)}},
+            projection={"_id": 0, "id": 1, "filename": 1, "original_filename": 1, "category": 1, "media_info": 1},
+            return_document=ReturnDocument.AFTER
+        )
+    
+    async def process_next(self) -> bool:
+        item = await self.claim_next()
+        if item is None:
+            return False
+        hls_id = ObjectId()
+        try:
+            await self.transcode(item, hls_id)
+        except Exception as e:
+            logger.error(f"Transcoding {item['id']} failed: {e}")
+            await delete_hls_files(str(hls_id))
+            await db.content_items.update_one(
+                {"id": item["id"]},
+                {"$set": {"abr_status": "failed", "processing_error": str(e)[:500]}, "$unset": {"abr_locked_until": ""}}
+            )
+        return True
+    
+    async def transcode(self, item: Dict[str, Any], hls_id: ObjectId):
+        # The same bytes uploaded twice share one ladder
+        sibling = await db.content_items.find_one(
+            {"filename": item["filename"], "abr_status": "ready"},
+            {"_id": 0, "hls_id": 1, "renditions": 1}
+        )
+        if sibling:
+            await db.content_items.update_one(
+                {"id": item["id"]},
+                {"$set": {"abr_status": "ready", **sibling}, "$unset": {"abr_locked_until": ""}}
+            )
+            return
+        
+        media_info = item.get("media_info") or {}
+        ladder = ladder_for(media_info.get("height") or 0)
+        suffix = Path(item.get("original_filename") or "").suffix
+        path = await download_to_tempfile(ObjectId(item["filename"]), suffix=suffix)
+        output_dir = tempfile.mkdtemp(prefix="hls_")
+        try:
+            loop = asyncio.get_running_loop()
+            renditions = await loop.run_in_executor(
+                self.pool,
+                transcode_rendition_ladder,
+                path,
+                output_dir,
+                ladder,
+                (media_info.get("width") or 0, media_info.get("height") or 0),
+                bool(media_info.get("audio_codec"))
+            )
+            metadata = {"category": "hls", "hls_for": item["id"]}
+            for directory, _, files in os.walk(output_dir):
+                for name in files:
+                    relative = os.path.relpath(os.path.join(directory, name), output_dir)
+                    if relative == "master.m3u8":
+                        continue
+                    await store_media_file(
+                        os.path.join(directory, name),
+                        f"hls/{hls_id}/{relative}",
+                        HLS_CONTENT_TYPES.get(Path(name).suffix, "application/octet-stream"),
+                        metadata
+                    )
+            # The master goes last: its presence means the ladder is complete
+            await store_media_file(
+                os.path.join(output_dir, "master.m3u8"),
+                f"hls/{hls_id}/master.m3u8",
+                HLS_CONTENT_TYPES[".m3u8"],
+                metadata,
+                file_id=hls_id
+            )
+        finally:
+            os.unlink(path)
+            shutil.rmtree(output_dir, ignore_errors=True)
+        
+        await db.content_items.update_many(
+            {"filename": item["filename"], "abr_status": {"$in": ["pending", "processing"]}},
+            {"$set": {"abr_status": "ready", "hls_id": str(hls_id), "renditions": renditions}, "$unset": {"abr_locked_until": ""}}
+        )
+        await invalidate_content_listings(item["category"])
+        logger.info(f"Built {len(renditions)} renditions for {item['id']} as HLS {hls_id}")
+
+transcode_pipeline = TranscodePipeline(max_jobs=TRANSCODE_MAX_JOBS, poll_interval=TRANSCODE_POLL_INTERVAL_SECONDS)
+
+# Content item creation shared by every upload path
+async def create_content_item(
+    file_id: ObjectId,
+    original_filename: str,
+    content_type: str,
+    file_size: int,
+    category: str,
+    tag_list: List[str],
+    description: Optional[str],
+    reused_file: bool = False,
+    model_id: Optional[str] = None,
+    member_id: Optional[str] = None
+) -> ContentItem:
+    """Record a stored file as a ContentItem and queue it for processing"""
+    # Create content item with enhanced metadata
+    content_item = ContentItem(
+        filename=str(file_id),
+        original_filename=original_filename,
+        content_type=content_type,
+        file_size=file_size,
+        category=category,
+        tags=tag_list,
+        description=description or f"High-quality {category.rstrip('s')} upload - {original_filename}",
+        processing_status="completed" if category == "pictures" else "processing",  # Videos may need processing
+        model_id=model_id,
+        member_id=member_id
+    )
+    
+    # A deduplicated file that was already processed needs no second pass
+    if reused_file:
+        processed = await db.content_items.find_one(
+            {"filename": str(file_id), "processing_status": "completed"},
+            {"_id": 0, "media_info": 1, "thumbnail_id": 1, "derivatives": 1, "abr_status": 1, "hls_id": 1, "renditions": 1}
+        )
+        if processed:
+            content_item.media_info = processed.get("media_info") or {}
+            content_item.thumbnail_id = processed.get("thumbnail_id")
+            content_item.derivatives = processed.get("derivatives") or {}
+            content_item.processing_status = "completed"
+            # A ladder still being built is shared once it lands
+            if processed.get("abr_status") in ("pending", "processing", "ready"):
+                content_item.abr_status = "ready" if processed.get("hls_id") else "pending"
+                content_item.hls_id = processed.get("hls_id")
+                content_item.renditions = processed.get("renditions") or []
+    
+    # Save to database
+    await db.content_items.insert_one(content_item.dict())
+    await invalidate_content_listings(category)
+    await index_search_suggestions("content", [content_item.dict()])
+    await record_content_added(content_item)
+    
+    if model_id and category == "videos":
+        engagement_counters.increment("model_profiles", model_id, "video_count")
+    if member_id:
+        engagement_counters.increment("community_members", member_id, "total_uploads")
+    
+    if content_item.processing_status == "processing":
+        media_pipeline.submit(content_item.id)
+    
+    logger.info(f"Successfully uploaded {original_filename} ({file_size} bytes) in category {category}")
+    return content_item
+
+def content_upload_result(content_item: ContentItem, deduplicated: bool = False) -> Dict[str, Any]:
+    """Response body for a finished upload"""
+    return {
+        "message": "Content uploaded successfully", 
+        "content_id": content_item.id,
+        "file_size": content_item.file_size,
+        "high_quality": content_item.file_size > (100 * 1024 * 1024),
+        "processing_status": content_item.processing_status,
+        "deduplicated": deduplicated
+    }
+
+# Content-addressed storage: uploads carry their SHA-256 and a reference
+# count in GridFS metadata, and a unique index on the hash keeps one copy
+async def find_stored_file_by_hash(digest: str) -> Optional[Dict[str, Any]]:
+    return await db.fs.files.find_one({"metadata.sha256": digest}, {"_id": 1, "length": 1})
+
+# Resumable uploads. Each upload chunk is a whole number of GridFS chunks,
+# so chunks are written directly as GridFS chunk documents of the reserved
+# file id and finalizing only has to insert the files document. GridFS is
+# only the staging area when another storage backend is configured: the
+# finished file is moved there in the background.
+RESUMABLE_UPLOAD_CHUNK_SIZE = GRIDFS_CHUNK_SIZE * max(1, int(os.environ.get('RESUMABLE_UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024)) // GRIDFS_CHUNK_SIZE)
+UPLOAD_SESSION_TTL_SECONDS = int(os.environ.get('UPLOAD_SESSION_TTL_SECONDS', 24 * 60 * 60))
+UPLOAD_GC_INTERVAL_SECONDS = int(os.environ.get('UPLOAD_GC_INTERVAL_SECONDS', 15 * 60))
+
+async def get_open_upload_session(upload_id: str) -> Dict[str, Any]:
+    session = await db.upload_sessions.find_one({"id": upload_id}, {"_id": 0})
+    if not session:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    if session["status"] != "open":
+        raise HTTPException(status_code=409, detail=f"Upload is {session['status']}")
+    return session
+
+def upload_chunk_length(session: Dict[str, Any], chunk_index: int) -> int:
+    """Exact byte length expected for a chunk; only the last one may be short"""
+    start = chunk_index * session["chunk_size"]
+    return min(session["chunk_size"], session["total_size"] - start)
+
+async def write_gridfs_chunk(file_id: ObjectId, n: int, data: bytes):
+    """Upsert one GridFS chunk document, so re-sent chunks are idempotent"""
+    await db.fs.chunks.replace_one(
+        {"files_id": file_id, "n": n},
+        {"files_id": file_id, "n": n, "data": data},
+        upsert=True
+    )
+
+# Keeps references to running moves so they are not garbage collected
+storage_move_tasks: set = set()
+
+async def move_to_configured_storage(file_id: ObjectId):
+    try:
+        source = await move_stored_file(file_id, storage.name)
+        if source is not None:
+            await release_moved_file(source, file_id)
+    except Exception as e:
+        # Still complete and readable in GridFS; migrate_storage.py moves it later
+        logger.error(f"Failed to move {file_id} to {storage.name} storage: {e}")
+
+async def discard_upload_session(session: Dict[str, Any]):
+    await db.fs.chunks.delete_many({"files_id": ObjectId(session["file_id"])})
+    await db.upload_sessions.delete_one({"id": session["id"]})
+
+async def collect_abandoned_uploads():
+    """Periodically drop sessions that stopped receiving chunks"""
+    while True:
+        try:
+            cutoff = datetime.now(timezone.utc) - timedelta(seconds=UPLOAD_SESSION_TTL_SECONDS)
+            async for session in db.upload_sessions.find(
+                {"status": "open", "updated_at": {"$lt": cutoff}}, {"_id": 0}
+            ):
+                await discard_upload_session(session)
+                logger.info(f"Garbage-collected abandoned upload {session['id']}")
+            async for upload in db.direct_uploads.find(
+                {"status": "open", "updated_at": {"$lt": cutoff}}, {"_id": 0}
+            ):
+                await discard_direct_upload(upload)
+                logger.info(f"Garbage-collected abandoned direct upload {upload['id']}")
+        except (PyMongoError, BotoClientError, OSError) as e:
+            logger.error(f"Upload garbage collection failed: {e}")
+        await asyncio.sleep(UPLOAD_GC_INTERVAL_SECONDS)
+
+# Direct transfers. With an object store backend, clients upload to and
+# download from the store itself through short-lived presigned URLs, so
+# media bytes never pass through API workers. The API only signs URLs and,
+# when the client reports an upload as done, checks the object and
+# catalogues it like any other upload.
+PRESIGNED_URL_TTL_SECONDS = int(os.environ.get('PRESIGNED_URL_TTL_SECONDS', 15 * 60))
+DIRECT_DOWNLOADS = os.environ.get('STORAGE_DIRECT_DOWNLOADS', 'true').lower() in ('1', 'true', 'yes')
+# Clients may reuse a redirect to a signed URL for this long, well within its expiry
+DIRECT_DOWNLOAD_REDIRECT_MAX_AGE = min(300, PRESIGNED_URL_TTL_SECONDS // 3)
+
+def supports_direct_transfers(backend) -> bool:
+    return hasattr(backend, "presign_upload")
+
+async def direct_download_response(
+    handle,
+    media_type: str,
+    content_disposition: Optional[str],
+    cache_control: str,
+    headers: Optional[Dict[str, str]] = None
+) -> Optional[Response]:
+    """Redirect to a signed URL of the object store holding the file, None to serve it here"""
+    if not DIRECT_DOWNLOADS or not isinstance(handle, StoredFile) or not supports_direct_transfers(handle.backend):
+        return None
+    url = await handle.backend.presign_download(
+        handle._id,
+        PRESIGNED_URL_TTL_SECONDS,
+        content_type=media_type,
+        content_disposition=content_disposition,
+        cache_control=cache_control
+    )
+    return RedirectResponse(
+        url,
+        status_code=307,
+        headers={"Cache-Control": f"private, max-age={DIRECT_DOWNLOAD_REDIRECT_MAX_AGE}", **(headers or {})}
+    )
+
+async def discard_direct_upload(upload: Dict[str, Any]):
+    await get_storage_backend(upload["storage"]).delete(ObjectId(upload["file_id"]))
+    await db.direct_uploads.delete_one({"id": upload["id"]})
+
+# In-process caching
+class TTLCache:
+    """Bounded LRU cache whose entries expire after a TTL.
+    
+    get_or_load() coalesces concurrent misses for the same key into a single
+    load, so a burst of identical requests costs one backend call. A load
+    that started before an invalidation is not cached, so invalidation
+    never races with a slow read that saw the old data.
+    """
+    
+    def __init__(self, name: str, max_entries: int = 1024, ttl: float = 60.0):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries: "OrderedDict[Any, Tuple[float, Any]]" = OrderedDict()
+        self.loading: Dict[Any, asyncio.Task] = {}
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+    
+    def get(self, key, default=None):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self.entries[key]
+            self.misses += 1
+            return default
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+    
+    def set(self, key, value, ttl: Optional[float] = None):
+        self.entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+    
+    def delete(self, key):
+        self.generation += 1
+        if self.entries.pop(key, None) is not None:
+            self.invalidations += 1
+    
+    def delete_where(self, predicate: Callable[[Any], bool]):
+        """Invalidate every key the predicate selects"""
+        self.generation += 1
+        for key in [key for key in self.entries if predicate(key)]:
+            del self.entries[key]
+            self.invalidations += 1
+    
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations
+        }
+    
+    async def get_or_load(
+        self,
+        key,
+        loader: Callable[[], Awaitable[Any]],
+        ttl: Union[None, float, Callable[[Any], float]] = None
+    ):
+        """Cached value for key, else the result of one shared loader() call.
+        
+        `ttl` may be a function of the loaded value, e.g. to keep final
+        states longer than ones that are still changing.
+        """
+        missing = object()
+        value = self.get(key, missing)
+        if value is not missing:
+            return value
+        
+        task = self.loading.get(key)
+        if task is None:
+            task = asyncio.create_task(self._load(key, loader, ttl, self.generation))
+            self.loading[key] = task
+            task.add_done_callback(lambda _: self.loading.pop(key, None))
+        return await asyncio.shield(task)
+    
+    async def _load(self, key, loader, ttl, generation):
+        value = await loader()
+        if generation == self.generation:
+            self.set(key, value, ttl(value) if callable(ttl) else ttl)
+        return value
+
+CACHES: Dict[str, TTLCache] = {}
+
+def create_cache(name: str, max_entries: int, ttl: float) -> TTLCache:
+    """Create a named cache whose metrics show up at /api/health/cache"""
+    cache = TTLCache(name, max_entries=max_entries, ttl=ttl)
+    CACHES[name] = cache
+    return cache
+
+# Shared caching for multi-worker deployments. Each worker keeps a short
+# lived TTLCache in front of a backend every worker shares (Redis, or an
+# in-process dict for single-worker setups). Invalidations delete shared
+# entries and are broadcast so other workers drop their local copies, and
+# a lock in the backend lets one worker recompute a missing entry while
+# the others wait for it.
+CACHE_BACKEND_URL = os.environ.get('CACHE_BACKEND_URL', 'memory://')
+CACHE_KEY_PREFIX = os.environ.get('CACHE_KEY_PREFIX', 'gizzle:')
+CACHE_LOCAL_TTL_SECONDS = float(os.environ.get('CACHE_LOCAL_TTL_SECONDS', 5))
+CACHE_LOCK_TIMEOUT_SECONDS = float(os.environ.get('CACHE_LOCK_TIMEOUT_SECONDS', 10))
+CACHE_LOCK_POLL_SECONDS = float(os.environ.get('CACHE_LOCK_POLL_SECONDS', 0.05))
+CACHE_INVALIDATION_CHANNEL = f"{CACHE_KEY_PREFIX}invalidations"
+CACHE_BACKEND_ERRORS = (RedisError, OSError)
+
+# Identifies this worker's own invalidation messages
+CACHE_WORKER_ID = uuid.uuid4().hex
+
+class MemoryCacheBackend:
+    """Process-local backend for single-worker deployments and development"""
+    
+    name = "memory"
+    
+    def __init__(self, max_entries: int = 100000):
+        self.max_entries = max_entries
+        self.values: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self.sets: Dict[str, set] = {}
+    
+    async def get(self, key: str) -> Optional[str]:
+        entry = self.values.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self.values[key]
+            return None
+        return entry[1]
+    
+    async def set(self, key: str, value: str, ttl: float, only_if_absent: bool = False) -> bool:
+        if only_if_absent and await self.get(key) is not None:
+            return False
+        self.values[key] = (time.monotonic() + ttl, value)
+        self.values.move_to_end(key)
+        while len(self.values) > self.max_entries:
+            self.values.popitem(last=False)
+        return True
+    
+    async def delete(self, *keys: str):
+        for key in keys:
+            self.values.pop(key, None)
+    
+    async def incr(self, key: str) -> int:
+        value = int(await self.get(key) or 0) + 1
+        self.values[key] = (float("inf"), str(value))
+        return value
+    
+    async def add_members(self, key: str, *members: str):
+        self.sets.setdefault(key, set()).update(members)
+    
+    async def members(self, key: str) -> List[str]:
+        return list(self.sets.get(key, ()))
+    
+    async def remove_members(self, key: str, *members: str):
+        self.sets.get(key, set()).difference_update(members)
+    
+    async def publish(self, channel: str, message: str):
+        # Nobody else shares this process's memory
+        pass
+    
+    async def subscribe(self, channel: str, handler: Callable[[str], None]):
+        await asyncio.Event().wait()
+    
+    async def close(self):
+        pass
+
+class RedisCacheBackend:
+    """Backend on any server speaking the Redis protocol"""
+    
+    name = "redis"
+    
+    def __init__(self, url: str):
+        if aioredis is None:
+            raise RuntimeError("CACHE_BACKEND_URL needs the redis package installed")
+        self.client = aioredis.from_url(url, decode_responses=True)
+    
+    async def get(self, key: str) -> Optional[str]:
+        return await self.client.get(key)
+    
+    async def set(self, key: str, value: str, ttl: float, only_if_absent: bool = False) -> bool:
+        return bool(await self.client.set(key, value, px=max(1, int(ttl * 1000)), nx=only_if_absent))
+    
+    async def delete(self, *keys: str):
+        if keys:
+            await self.client.delete(*keys)
+    
+    async def incr(self, key: str) -> int:
+        return await self.client.incr(key)
+    
+    async def add_members(self, key: str, *members: str):
+        if members:
+            await self.client.sadd(key, *members)
+    
+    async def members(self, key: str) -> List[str]:
+        return list(await self.client.smembers(key))
+    
+    async def remove_members(self, key: str, *members: str):
+        if members:
+            await self.client.srem(key, *members)
+    
+    async def publish(self, channel: str, message: str):
+        await self.client.publish(channel, message)
+    
+    async def subscribe(self, channel: str, handler: Callable[[str], None]):
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        await pubsub.subscribe(channel)
+        try:
+            async for message in pubsub.listen():
+                handler(message["data"])
+        finally:
+            await pubsub.aclose()
+    
+    async def close(self):
+        await self.client.aclose()
+
+def create_cache_backend(url: str):
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisCacheBackend(url)
+    if url.startswith("memory://"):
+        return MemoryCacheBackend()
+    raise ValueError(f"Unsupported CACHE_BACKEND_URL: {url}")
+
+cache_backend = create_cache_backend(CACHE_BACKEND_URL)
+
+class SharedCache:
+    """Cache of JSON-serializable values shared by every worker.
+    
+    Keys are tuples of JSON scalars. Values are stored in their
+    jsonable_encoder form, so readers always get plain JSON data back
+    whether it came from the loader, this worker or another one.
+    """
+    
+    def __init__(self, name: str, max_entries: int, ttl: float):
+        self.name = name
+        self.ttl = ttl
+        self.local = TTLCache(name, max_entries=max_entries, ttl=min(ttl, CACHE_LOCAL_TTL_SECONDS))
+        self.shared_hits = 0
+        self.shared_misses = 0
+        self.loads = 0
+        self.lock_waits = 0
+        self.backend_errors = 0
+    
+    def shared_key(self, key: Tuple) -> str:
+        return f"{CACHE_KEY_PREFIX}{self.name}:{json.dumps(list(key))}"
+    
+    @property
+    def index_key(self) -> str:
+        # Every key stored in the backend, so predicates can be evaluated
+        return f"{CACHE_KEY_PREFIX}{self.name}:keys"
+    
+    @property
+    def generation_key(self) -> str:
+        return f"{CACHE_KEY_PREFIX}{self.name}:generation"
+    
+    async def get_or_load(self, key: Tuple, loader: Callable[[], Awaitable[Any]]):
+        # The local cache already coalesces concurrent misses in this worker
+        return await self.local.get_or_load(key, lambda: self.load_shared(key, loader))
+    
+    async def load_shared(self, key: Tuple, loader: Callable[[], Awaitable[Any]]):
+        shared_key = self.shared_key(key)
+        lock_key = f"{shared_key}:lock"
+        token = uuid.uuid4().hex
+        locked = False
+        try:
+            cached = await cache_backend.get(shared_key)
+            if cached is not None:
+                self.shared_hits += 1
+                return json.loads(cached)
+            self.shared_misses += 1
+            
+            # Single flight across workers: the lock holder recomputes, the
+            # rest poll for its result. A holder that dies or stalls only
+            # delays them until the lock expires.
+            deadline = time.monotonic() + CACHE_LOCK_TIMEOUT_SECONDS
+            locked = await cache_backend.set(lock_key, token, CACHE_LOCK_TIMEOUT_SECONDS, only_if_absent=True)
+            while not locked and time.monotonic() < deadline:
+                self.lock_waits += 1
+                await asyncio.sleep(CACHE_LOCK_POLL_SECONDS)
+                cached = await cache_backend.get(shared_key)
+                if cached is not None:
+                    self.shared_hits += 1
+                    return json.loads(cached)
+                locked = await cache_backend.set(lock_key, token, CACHE_LOCK_TIMEOUT_SECONDS, only_if_absent=True)
+            generation = await cache_backend.get(self.generation_key)
+        except CACHE_BACKEND_ERRORS as e:
+            self.backend_errors += 1
+            logger.warning(f"Cache backend unavailable, loading {self.name} directly: {e}")
+            self.loads += 1
+            return jsonable_encoder(await loader())
+        
+        try:
+            self.loads += 1
+            value = jsonable_encoder(await loader())
+            try:
+                await cache_backend.set(shared_key, json.dumps(value), self.ttl)
+                await cache_backend.add_members(self.index_key, json.dumps(list(key)))
+                # An invalidation that landed while we were loading may
+                # have been computed from older data: drop what we stored
+                if await cache_backend.get(self.generation_key) != generation:
+                    await cache_backend.delete(shared_key)
+            except CACHE_BACKEND_ERRORS as e:
+                self.backend_errors += 1
+                logger.warning(f"Failed to store {self.name} cache entry: {e}")
+            return value
+        finally:
+            if locked:
+                try:
+                    if await cache_backend.get(lock_key) == token:
+                        await cache_backend.delete(lock_key)
+                except CACHE_BACKEND_ERRORS:
+                    self.backend_errors += 1
+    
+    async def invalidate(self, keys: Tuple[Tuple, ...] = (), predicate: Optional[Callable[[Tuple], bool]] = None):
+        """Drop the given keys, and every key the predicate selects, in all workers"""
+        for key in keys:
+            self.local.delete(key)
+        if predicate is not None:
+            self.local.delete_where(predicate)
+        
+        try:
+            matched = [json.dumps(list(key)) for key in keys]
+            if predicate is not None:
+                matched += [member for member in await cache_backend.members(self.index_key) if predicate(tuple(json.loads(member)))]
+            await cache_backend.incr(self.generation_key)
+            await cache_backend.delete(*(f"{CACHE_KEY_PREFIX}{self.name}:{member}" for member in matched))
+            await cache_backend.remove_members(self.index_key, *matched)
+            await cache_backend.publish(CACHE_INVALIDATION_CHANNEL, json.dumps({
+                "origin": CACHE_WORKER_ID,
+                "cache": self.name,
+                "keys": [json.loads(member) for member in matched]
+            }))
+        except CACHE_BACKEND_ERRORS as e:
+            # Other workers fall back on their short local TTL
+            self.backend_errors += 1
+            logger.error(f"Failed to invalidate {self.name} cache: {e}")
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.local.stats(),
+            "backend": cache_backend.name,
+            "shared_hits": self.shared_hits,
+            "shared_misses": self.shared_misses,
+            "loads": self.loads,
+            "lock_waits": self.lock_waits,
+            "backend_errors": self.backend_errors
+        }
+
+def create_shared_cache(name: str, max_entries: int, ttl: float) -> SharedCache:
+    """Create a named cache shared across workers, listed at /api/health/cache"""
+    cache = SharedCache(name, max_entries=max_entries, ttl=ttl)
+    CACHES[name] = cache
+    return cache
+
+def apply_invalidation_message(data: str):
+    """Drop local copies of entries another worker invalidated"""
+    try:
+        message = json.loads(data)
+    except ValueError:
+        logger.warning(f"Ignoring malformed cache invalidation: {data!r}")
+        return
+    if message.get("origin") == CACHE_WORKER_ID:
+        return
+    cache = CACHES.get(message.get("cache"))
+    if isinstance(cache, SharedCache):
+        for key in message.get("keys", []):
+            cache.local.delete(tuple(key))
+
+async def listen_for_invalidations():
+    while True:
+        try:
+            await cache_backend.subscribe(CACHE_INVALIDATION_CHANNEL, apply_invalidation_message)
+        except CACHE_BACKEND_ERRORS as e:
+            logger.warning(f"Cache invalidation channel lost, resubscribing: {e}")
+        # Messages may have been missed while disconnected
+        for cache in CACHES.values():
+            if isinstance(cache, SharedCache):
+                cache.local.delete_where(lambda key: True)
+        await asyncio.sleep(1)
+
+# Payments. One StripeCheckout (per webhook URL, normally just one) is
+# reused for every request, and the Stripe SDK is pointed at a pooled HTTP
+# session so calls reuse warm TLS connections instead of handshaking again.
+STRIPE_TIMEOUT_SECONDS = float(os.environ.get('STRIPE_TIMEOUT_SECONDS', 20))
+STRIPE_MAX_CONNECTIONS = int(os.environ.get('STRIPE_MAX_CONNECTIONS', 20))
+STRIPE_MAX_RETRIES = int(os.environ.get('STRIPE_MAX_RETRIES', 2))
+# Webhook URL given to Stripe. Unset, it is derived from the request's Host
+# header, so only a few such clients are kept to bound what clients can add
+STRIPE_WEBHOOK_URL = os.environ.get('STRIPE_WEBHOOK_URL')
+STRIPE_MAX_CHECKOUT_CLIENTS = 8
+
+class PaymentClient:
+    """Lifecycle-managed Stripe checkout client shared by all payment endpoints"""
+    
+    def __init__(self):
+        self.api_key = None
+        self.http_session = None
+        self.checkouts: "OrderedDict[str, StripeCheckout]" = OrderedDict()
+    
+    def start(self):
+        """Read the API key and configure the Stripe SDK.
+        
+        The SDK's HTTP client, retries and API base are module globals, so
+        they apply to every Stripe call in the process, not only this client's.
+        """
+        self.api_key = os.environ.get('STRIPE_API_KEY')
+        if not self.api_key:
+            logger.warning("STRIPE_API_KEY not set, payment endpoints are disabled")
+            return
+        
+        self.http_session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=STRIPE_MAX_CONNECTIONS, pool_maxsize=STRIPE_MAX_CONNECTIONS)
+        self.http_session.mount("https://", adapter)
+        self.http_session.mount("http://", adapter)
+        
+        if stripe is not None:
+            stripe.default_http_client = stripe.RequestsClient(
+                timeout=STRIPE_TIMEOUT_SECONDS,
+                session=self.http_session
+            )
+            stripe.max_network_retries = STRIPE_MAX_RETRIES
+            # Lets benchmarks and tests point the SDK at a local stand-in
+            if os.environ.get('STRIPE_API_BASE'):
+                stripe.api_base = os.environ['STRIPE_API_BASE']
+    
+    def checkout(self, webhook_url: str = "") -> StripeCheckout:
+        if not self.api_key:
+            raise HTTPException(status_code=500, detail="Payment system not configured")
+        if STRIPE_WEBHOOK_URL:
+            webhook_url = STRIPE_WEBHOOK_URL
+        stripe_checkout = self.checkouts.get(webhook_url)
+        if stripe_checkout is None:
+            stripe_checkout = StripeCheckout(api_key=self.api_key, webhook_url=webhook_url)
+            self.checkouts[webhook_url] = stripe_checkout
+            if len(self.checkouts) > STRIPE_MAX_CHECKOUT_CLIENTS:
+                self.checkouts.popitem(last=False)
+        else:
+            self.checkouts.move_to_end(webhook_url)
+        return stripe_checkout
+    
+    def close(self):
+        self.checkouts.clear()
+        if self.http_session is not None:
+            self.http_session.close()
+            self.http_session = None
+
+payment_client = PaymentClient()
+
+# Payment status polling. Final transactions are answered from Mongo (and
+# then from memory) without calling Stripe; pending ones hit Stripe at most
+# once per PAYMENT_STATUS_TTL_SECONDS per session, however often they poll.
+TERMINAL_PAYMENT_STATUSES = {"paid", "failed", "expired"}
+# Webhooks can arrive (and be applied) in any order, so a final status only
+# gives way to one that outranks it: a late payment beats an expiry or a
+# failure, and nothing undoes a payment
+PAYMENT_STATUS_PRECEDENCE = {"pending": 0, "failed": 1, "expired": 1, "paid": 2}
+PAYMENT_STATUS_TTL_SECONDS = float(os.environ.get('PAYMENT_STATUS_TTL_SECONDS', 5))
+PAYMENT_STATUS_TERMINAL_TTL_SECONDS = float(os.environ.get('PAYMENT_STATUS_TERMINAL_TTL_SECONDS', 3600))
+
+payment_status_cache = create_cache("payment_status", max_entries=10000, ttl=PAYMENT_STATUS_TTL_SECONDS)
+
+def superseded_payment_statuses(transaction_status: str) -> List[str]:
+    """Stored statuses that `transaction_status` may replace"""
+    rank = PAYMENT_STATUS_PRECEDENCE.get(transaction_status, 0)
+    return [status for status, status_rank in PAYMENT_STATUS_PRECEDENCE.items() if status_rank < rank or status == "pending"]
+
+def payment_status_ttl(response: Dict[str, Any]) -> float:
+    if response.get("transaction_status") in TERMINAL_PAYMENT_STATUSES:
+        return PAYMENT_STATUS_TERMINAL_TTL_SECONDS
+    return PAYMENT_STATUS_TTL_SECONDS
+
+def transaction_status_from_checkout(status: str, payment_status: str) -> str:
+    """Map Stripe's session status / payment status onto our transaction states"""
+    if payment_status in ("paid", "no_payment_required"):
+        return "paid"
+    if status == "expired":
+        return "expired"
+    return "pending"
+
+def stored_payment_status(transaction: Dict[str, Any]) -> Dict[str, Any]:
+    """Status response built from a stored transaction, without asking Stripe"""
+    snapshot = transaction.get("checkout_status")
+    if snapshot:
+        response = {"session_id": transaction["session_id"], **snapshot}
+    else:
+        # Finalized by a webhook, which carries no full session snapshot
+        response = {
+            "session_id": transaction["session_id"],
+            "status": "expired" if transaction["payment_status"] == "expired" else "complete",
+            "payment_status": "paid" if transaction["payment_status"] == "paid" else "unpaid",
+            "amount_total": int(round(transaction["amount"] * 100)),
+            "currency": transaction["currency"],
+            "metadata": transaction.get("metadata", {})
+        }
+    response["transaction_status"] = transaction["payment_status"]
+    return response
+
+async def record_payment_status(session_id: str, transaction_status: str, snapshot: Optional[Dict[str, Any]] = None):
+    """Persist a transaction's new status and refresh its cached poll response"""
+    update = {"payment_status": transaction_status, "updated_at": datetime.now(timezone.utc)}
+    if snapshot:
+        update["checkout_status"] = snapshot
+    transaction = await db.payment_transactions.find_one_and_update(
+        {"session_id": session_id, "payment_status": {"$in": superseded_payment_statuses(transaction_status)}},
+        {"$set": update},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
+    )
+    if transaction is None:
+        # Unknown session, or it already has a status that outranks this one
+        payment_status_cache.delete(session_id)
+        return
+    
+    if transaction_status == "paid":
+        # Here you can add logic to grant premium features, credits, etc.
+        logger.info(f"Payment completed for session {session_id}")
+    if transaction_status in TERMINAL_PAYMENT_STATUSES:
+        payment_status_cache.set(session_id, stored_payment_status(transaction), PAYMENT_STATUS_TERMINAL_TTL_SECONDS)
+    else:
+        payment_status_cache.delete(session_id)
+
+def transaction_status_from_event(event_type: str, payment_status: Optional[str]) -> Optional[str]:
+    """Transaction state implied by a Stripe checkout webhook, None if irrelevant"""
+    if event_type == "checkout.session.completed":
+        return transaction_status_from_checkout("complete", payment_status)
+    if event_type == "checkout.session.async_payment_succeeded":
+        return "paid"
+    if event_type == "checkout.session.async_payment_failed":
+        return "failed"
+    if event_type == "checkout.session.expired":
+        return "expired"
+    return None
+
+async def load_payment_status(session_id: str) -> Dict[str, Any]:
+    """Status for one session; only pending sessions cost a Stripe call"""
+    transaction = await db.payment_transactions.find_one({"session_id": session_id}, {"_id": 0})
+    if transaction and transaction["payment_status"] in TERMINAL_PAYMENT_STATUSES:
+        return stored_payment_status(transaction)
+    
+    # Get checkout status from Stripe
+    checkout_status = await payment_client.checkout().get_checkout_status(session_id)
+    snapshot = {
+        "status": checkout_status.status,
+        "payment_status": checkout_status.payment_status,
+        "amount_total": checkout_status.amount_total,
+        "currency": checkout_status.currency,
+        "metadata": checkout_status.metadata
+    }
+    transaction_status = transaction_status_from_checkout(checkout_status.status, checkout_status.payment_status)
+    
+    if transaction and transaction_status != transaction["payment_status"]:
+        await record_payment_status(session_id, transaction_status, snapshot)
+    
+    return {"session_id": session_id, **snapshot, "transaction_status": transaction_status}
+
+# Webhook ingestion. Verified events are appended to payment_events (the
+# unique event_id drops provider retries) and acknowledged at once; the
+# consumer applies them in the background with retry and backoff. Claims
+# are made in Mongo, so several workers can consume the same log safely.
+WEBHOOK_MAX_ATTEMPTS = int(os.environ.get('WEBHOOK_MAX_ATTEMPTS', 8))
+WEBHOOK_RETRY_BASE_SECONDS = float(os.environ.get('WEBHOOK_RETRY_BASE_SECONDS', 2))
+WEBHOOK_RETRY_MAX_SECONDS = float(os.environ.get('WEBHOOK_RETRY_MAX_SECONDS', 300))
+WEBHOOK_POLL_INTERVAL_SECONDS = float(os.environ.get('WEBHOOK_POLL_INTERVAL_SECONDS', 5))
+WEBHOOK_CLAIM_TIMEOUT_SECONDS = 60
+
+class WebhookEventConsumer:
+    """Applies logged payment events to transactions until the log is drained"""
+    
+    def __init__(self):
+        self.wakeup = asyncio.Event()
+        self.task = None
+    
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+    
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+    
+    def notify(self):
+        self.wakeup.set()
+    
+    async def run(self):
+        while True:
+            try:
+                while await self.process_next():
+                    pass
+            except PyMongoError as e:
+                logger.error(f"Webhook consumer could not reach the event log: {e}")
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=WEBHOOK_POLL_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+    
+    async def claim_next(self) -> Optional[Dict[str, Any]]:
+        now = datetime.now(timezone.utc)
+        return await db.payment_events.find_one_and_update(
+            {"$or": [
+                {"status": "pending", "next_attempt_at": {"$lte": now}},
+                # Claimed by a worker that died mid-event
+                {"status": "processing", "locked_until": {"$lt": now}}
+            ]},
+            {"$set": {"status": "processing", "locked_until": now + timedelta(seconds=WEBHOOK_CLAIM_TIMEOUT_SECONDS)}},
+            sort=[("created", ASCENDING)],
+            projection={"_id": 0, "raw": 0},
+            return_document=ReturnDocument.AFTER
+        )
+    
+    async def process_next(self) -> bool:
+        event = await self.claim_next()
+        if event is None:
+            return False
+        
+        try:
+            transaction_status = transaction_status_from_event(event["event_type"], event.get("payment_status"))
+            if transaction_status and event.get("session_id"):
+                await record_payment_status(event["session_id"], transaction_status)
+        except Exception as e:
+            attempts = event.get("attempts", 0) + 1
+            delay = min(WEBHOOK_RETRY_BASE_SECONDS * 2 ** (attempts - 1), WEBHOOK_RETRY_MAX_SECONDS)
+            final = attempts >= WEBHOOK_MAX_ATTEMPTS
+            await db.payment_events.update_one(
+                {"event_id": event["event_id"]},
+                {"$set": {
+                    "status": "failed" if final else "pending",
+                    "attempts": attempts,
+                    "last_error": str(e)[:500],
+                    "next_attempt_at": datetime.now(timezone.utc) + timedelta(seconds=delay)
+                }}
+            )
+            logger.error(f"Webhook event {event['event_id']} failed (attempt {attempts}): {e}")
+            return True
+        
+        await db.payment_events.update_one(
+            {"event_id": event["event_id"]},
+            {"$set": {"status": "processed", "processed_at": datetime.now(timezone.utc)}}
+        )
+        logger.info(f"Webhook processed: {event['event_type']} for session {event.get('session_id')}")
+        return True
+
+webhook_consumer = WebhookEventConsumer()
+
+# Engagement counters (views, uploads) are accumulated in memory and
+# written behind as one $inc per document and flush, batched with
+# bulk_write, instead of a Mongo write per request. Cached reads may lag
+# the counters by their TTL.
+COUNTER_FLUSH_INTERVAL_SECONDS = float(os.environ.get('COUNTER_FLUSH_INTERVAL_SECONDS', 5))
+COUNTER_FLUSH_THRESHOLD = int(os.environ.get('COUNTER_FLUSH_THRESHOLD', 1000))
+
+class CounterAggregator:
+    """Write-behind buffer of counter increments, flushed on an interval or size threshold"""
+    
+    def __init__(self, flush_interval: float, flush_threshold: int):
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        # (collection, key field, key value) -> {counter field: delta}
+        self.pending: Dict[Tuple[str, str, Any], Dict[str, int]] = {}
+        self.wakeup = asyncio.Event()
+        self.task = None
+        self.increments = 0
+        self.flushes = 0
+        self.documents_updated = 0
+        self.failed_flushes = 0
+    
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+    
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        await self.flush()
+    
+    def increment(self, collection: str, key_value: Any, field: str, amount: int = 1, key_field: str = "id"):
+        deltas = self.pending.setdefault((collection, key_field, key_value), {})
+        deltas[field] = deltas.get(field, 0) + amount
+        self.increments += 1
+        if len(self.pending) >= self.flush_threshold:
+            self.wakeup.set()
+    
+    async def run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            # Shielded so stop() never abandons a batch halfway through
+            await asyncio.shield(self.flush())
+    
+    def requeue(self, key: Tuple[str, str, Any], deltas: Dict[str, int]):
+        pending = self.pending.setdefault(key, {})
+        for field, amount in deltas.items():
+            pending[field] = pending.get(field, 0) + amount
+    
+    async def flush(self):
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, {}
+        self.flushes += 1
+        
+        by_collection: Dict[str, List[Tuple[Tuple[str, str, Any], Dict[str, int]]]] = {}
+        for key, deltas in batch.items():
+            by_collection.setdefault(key[0], []).append((key, deltas))
+        
+        for collection, entries in by_collection.items():
+            operations = [UpdateOne({key_field: key_value}, {"$inc": deltas}) for (_, key_field, key_value), deltas in entries]
+            try:
+                result = await db[collection].bulk_write(operations, ordered=False)
+                self.documents_updated += result.modified_count
+            except BulkWriteError as e:
+                # The other operations were applied; only retry the failed ones
+                self.failed_flushes += 1
+                failed = {error["index"] for error in e.details.get("writeErrors", [])}
+                for index in failed:
+                    self.requeue(*entries[index])
+                logger.error(f"Counter flush to {collection} failed for {len(failed)} documents: {e}")
+            except PyMongoError as e:
+                self.failed_flushes += 1
+                for entry in entries:
+                    self.requeue(*entry)
+                logger.error(f"Counter flush to {collection} failed, retrying next interval: {e}")
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending_documents": len(self.pending),
+            "increments": self.increments,
+            "flushes": self.flushes,
+            "documents_updated": self.documents_updated,
+            "failed_flushes": self.failed_flushes
+        }
+
+engagement_counters = CounterAggregator(COUNTER_FLUSH_INTERVAL_SECONDS, COUNTER_FLUSH_THRESHOLD)
+
+# File views are credited to a single content item. A deduplicated file is
+# shared by several items, so players pass the item's `content_id`; without
+# it the view goes to the item that uploaded the file first.
+viewed_item_cache = create_cache("viewed_item", max_entries=10000, ttl=300)
+
+async def find_viewed_item(file_id: str, content_id: Optional[str]) -> Optional[str]:
+    query = {"filename": file_id}
+    if content_id:
+        query["id"] = content_id
+    item = await db.content_items.find_one(query, {"_id": 0, "id": 1}, sort=[("upload_timestamp", ASCENDING)])
+    return item["id"] if item else None
+
+# Model profile read cache. List entries are keyed by their filter
+# parameters so a write only drops the lists the changed profile could
+# appear in (before or after the change), plus that profile's own entry.
+MODEL_CACHE_TTL_SECONDS = float(os.environ.get('MODEL_CACHE_TTL_SECONDS', 60))
+MODEL_CACHE_MAX_ENTRIES = int(os.environ.get('MODEL_CACHE_MAX_ENTRIES', 1024))
+
+model_cache = create_shared_cache("model_profiles", max_entries=MODEL_CACHE_MAX_ENTRIES, ttl=MODEL_CACHE_TTL_SECONDS)
+
+def model_list_matches(key: Tuple, profile: Dict[str, Any]) -> bool:
+    """Whether a cached ("models", featured, category, verified, limit) list could contain profile"""
+    _, featured, category, verified, _ = key
+    if featured is not None and profile.get("is_featured", False) != featured:
+        return False
+    if category and profile.get("category") != category:
+        return False
+    if verified is not None and (profile.get("verification_status") == "verified") != verified:
+        return False
+    return True
+
+async def invalidate_model_cache(*profiles: Dict[str, Any]):
+    """Drop cached reads affected by a change to the given profile states"""
+    await model_cache.invalidate(
+        keys=tuple(("model", profile["id"]) for profile in profiles),
+        predicate=lambda key: key[0] == "models" and any(model_list_matches(key, profile) for profile in profiles)
+    )
+
+# Content listing cache. Any change to an item of a category drops that
+# category's cached pages.
+CONTENT_CACHE_TTL_SECONDS = float(os.environ.get('CONTENT_CACHE_TTL_SECONDS', 30))
+CONTENT_CACHE_MAX_ENTRIES = int(os.environ.get('CONTENT_CACHE_MAX_ENTRIES', 1024))
+
+content_listing_cache = create_shared_cache("content_listings", max_entries=CONTENT_CACHE_MAX_ENTRIES, ttl=CONTENT_CACHE_TTL_SECONDS)
+
+async def invalidate_content_listings(category: Optional[str] = None):
+    """Drop cached listing pages of one category, or of all of them"""
+    await content_listing_cache.invalidate(predicate=lambda key: category is None or key[1] == category)
+
+# Subscription plans are defined in code, so their cache key carries a hash
+# of the definitions: workers running different releases never share an entry.
+SUBSCRIPTION_PLANS_VERSION = hashlib.sha256(
+    json.dumps(jsonable_encoder(SUBSCRIPTION_PLANS), sort_keys=True).encode()
+).hexdigest()[:16]
+
+subscription_plans_cache = create_shared_cache("subscription_plans", max_entries=16, ttl=3600)
+
+# Content statistics for dashboards. content_stats holds one document per
+# category with item and byte totals and processing_status counts, and
+# content_tag_stats one document per (category, tag). Both are maintained
+# with $inc as items are created and change status, so reading them never
+# scans content_items. rebuild_content_stats() recomputes them from scratch.
+async def record_content_stats(category: str, items: int = 0, size: int = 0, statuses: Optional[Dict[str, int]] = None, tags: Optional[List[str]] = None):
+    increments = {"items": items, "bytes": size}
+    for status, delta in (statuses or {}).items():
+        increments[f"processing_status.{status}"] = delta
+    try:
+        await db.content_stats.update_one(
+            {"_id": category},
+            {"$inc": increments, "$set": {"updated_at": datetime.now(timezone.utc)}},
+            upsert=True
+        )
+        if tags:
+            await db.content_tag_stats.bulk_write([
+                UpdateOne(
+                    {"_id": f"{category}:{tag}"},
+                    {"$inc": {"count": items}, "$setOnInsert": {"category": category, "tag": tag}},
+                    upsert=True
+                )
+                for tag in set(tags)
+            ], ordered=False)
+    except PyMongoError as e:
+        # Drift is repaired by the next rebuild; the content write stands
+        logger.error(f"Failed to update content stats for {category}: {e}")
+
+async def record_content_added(item: ContentItem):
+    await record_content_stats(
+        item.category,
+        items=1,
+        size=item.file_size,
+        statuses={item.processing_status: 1},
+        tags=item.tags
+    )
+
+async def record_status_change(category: str, old_status: str, new_status: str):
+    await record_content_stats(category, statuses={old_status: -1, new_status: 1})
+
+async def rebuild_content_stats():
+    """Recompute every statistic from content_items (a full scan).
+    
+    Increments made while it runs can be lost, so run it when quiet.
+    """
+    totals = await db.content_items.aggregate([
+        {"$group": {
+            "_id": {"category": "$category", "status": "$processing_status"},
+            "items": {"$sum": 1},
+            "bytes": {"$sum": "$file_size"}
+        }}
+    ]).to_list(None)
+    tag_counts = await db.content_items.aggregate([
+        {"$unwind": "$tags"},
+        {"$group": {"_id": {"category": "$category", "tag": "$tags"}, "count": {"$sum": 1}}}
+    ], allowDiskUse=True).to_list(None)
+    
+    categories: Dict[str, Dict[str, Any]] = {}
+    for row in totals:
+        category = row["_id"]["category"]
+        stats = categories.setdefault(category, {"_id": category, "items": 0, "bytes": 0, "processing_status": {}})
+        stats["items"] += row["items"]
+        stats["bytes"] += row["bytes"]
+        stats["processing_status"][row["_id"]["status"]] = row["items"]
+    
+    now = datetime.now(timezone.utc)
+    await db.content_stats.delete_many({"_id": {"$ne": "_initialized"}})
+    if categories:
+        await db.content_stats.insert_many([{**stats, "updated_at": now} for stats in categories.values()])
+    await db.content_tag_stats.delete_many({})
+    for offset in range(0, len(tag_counts), 10000):
+        await db.content_tag_stats.insert_many([
+            {
+                "_id": f"{row['_id']['category']}:{row['_id']['tag']}",
+                "category": row["_id"]["category"],
+                "tag": row["_id"]["tag"],
+                "count": row["count"]
+            }
+            for row in tag_counts[offset:offset + 10000]
+        ])
+    logger.info(f"Rebuilt content stats for {len(categories)} categories and {len(tag_counts)} tags")
+
+async def initialize_content_stats():
+    """Build the statistics once for databases that predate them"""
+    try:
+        await db.content_stats.insert_one({"_id": "_initialized", "at": datetime.now(timezone.utc)})
+    except DuplicateKeyError:
+        return
+    await rebuild_content_stats()
+
+# Search. Ranked full-text queries run on the text indexes; autocomplete
+# uses search_suggestions, a dictionary of every term in searchable fields
+# with the number of documents containing it. It is kept up to date as
+# content and profiles are created and backfilled once for older data.
+SEARCH_KINDS = {
+    "content": {"collection": "content_items", "fields": ("original_filename", "description", "tags")},
+    "models": {"collection": "model_profiles", "fields": ("name", "username", "bio", "tags")}
+}
+SEARCH_FACET_LIMIT = int(os.environ.get('SEARCH_FACET_LIMIT', 20))
+SEARCH_SUGGEST_MIN_PREFIX = 2
+SEARCH_TERM_PATTERN = re.compile(r"[^\W_]{2,}")
+SEARCH_MAX_TERMS_PER_DOCUMENT = 200
+SEARCH_STOPWORDS = {"an", "and", "at", "by", "for", "from", "in", "is", "it", "of", "on", "or", "the", "to", "with"}
+
+def search_terms(document: Dict[str, Any], fields: Tuple[str, ...]) -> List[str]:
+    """Lowercased words (and whole tags) of a document's searchable fields"""
+    terms = set()
+    for field in fields:
+        value = document.get(field)
+        if not value:
+            continue
+        if field == "original_filename":
+            value = Path(value).stem
+        values = value if isinstance(value, list) else [value]
+        for text in values:
+            text = str(text).lower()
+            if field == "tags":
+                terms.add(text.strip())
+            terms.update(SEARCH_TERM_PATTERN.findall(text))
+    return sorted(term for term in terms if term and term not in SEARCH_STOPWORDS)[:SEARCH_MAX_TERMS_PER_DOCUMENT]
+
+async def index_search_suggestions(kind: str, documents: List[Dict[str, Any]]):
+    """Count the terms of newly created documents into the suggestion dictionary"""
+    counts: Dict[str, int] = {}
+    for document in documents:
+        for term in search_terms(document, SEARCH_KINDS[kind]["fields"]):
+            counts[term] = counts.get(term, 0) + 1
+    if not counts:
+        return
+    operations = [
+        UpdateOne(
+            {"_id": f"{kind}:{term}"},
+            {"$inc": {"count": count}, "$setOnInsert": {"kind": kind, "term": term}},
+            upsert=True
+        )
+        for term, count in counts.items()
+    ]
+    try:
+        await db.search_suggestions.bulk_write(operations, ordered=False)
+    except PyMongoError as e:
+        # Suggestions are a convenience; never fail the write that fed them
+        logger.error(f"Failed to index {kind} search suggestions: {e}")
+
+async def backfill_search_suggestions(batch_size: int = 1000):
+    """Build the suggestion dictionary from documents that predate it, once per database"""
+    try:
+        await db.search_suggestions.insert_one({"_id": "_backfill", "started_at": datetime.now(timezone.utc)})
+    except DuplicateKeyError:
+        return
+    
+    for kind, spec in SEARCH_KINDS.items():
+        projection = {"_id": 0, **{field: 1 for field in spec["fields"]}}
+        batch = []
+        async for document in db[spec["collection"]].find({}, projection):
+            batch.append(document)
+            if len(batch) >= batch_size:
+                await index_search_suggestions(kind, batch)
+                batch = []
+        if batch:
+            await index_search_suggestions(kind, batch)
+    
+    await db.search_suggestions.update_one({"_id": "_backfill"}, {"$set": {"finished_at": datetime.now(timezone.utc)}})
+    logger.info("Search suggestion backfill finished")
+
+def encode_search_cursor(result: Dict[str, Any]) -> str:
+    """Opaque cursor pointing just after `result` in relevance order"""
+    payload = json.dumps([result["score"], result["id"]])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_search_cursor(cursor: str) -> Tuple[float, str]:
+    """Inverse of encode_search_cursor, 400 if the cursor was tampered with"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        score, result_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return float(score), str(result_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+# Live streaming. Creators PUT MPEG-TS segments with consecutive sequence
+# numbers; the worker receiving them keeps each stream's recent segments in
+# memory and builds a sliding HLS playlist from them, so live viewers are
+# served from memory. Every segment is also archived to GridFS in the
+# background. Other workers, and replays after the stream ends, read the
+# archive, so route a stream's ingest and playback to one worker for the
+# lowest latency.
+LIVE_WINDOW_SEGMENTS = int(os.environ.get('LIVE_WINDOW_SEGMENTS', 6))  # listed in the playlist
+LIVE_RETAINED_SEGMENTS = int(os.environ.get('LIVE_RETAINED_SEGMENTS', 12))  # kept for viewers lagging behind
+LIVE_MAX_SEGMENT_BYTES = int(os.environ.get('LIVE_MAX_SEGMENT_BYTES', 16 * 1024 * 1024))
+LIVE_MAX_STREAMS = int(os.environ.get('LIVE_MAX_STREAMS', 50))
+LIVE_IDLE_TIMEOUT_SECONDS = float(os.environ.get('LIVE_IDLE_TIMEOUT_SECONDS', 60))
+LIVE_ENDED_RETENTION_SECONDS = float(os.environ.get('LIVE_ENDED_RETENTION_SECONDS', 30))
+LIVE_BLOCKING_RELOAD_TIMEOUT_SECONDS = float(os.environ.get('LIVE_BLOCKING_RELOAD_TIMEOUT_SECONDS', 6))
+LIVE_ARCHIVE_WORKERS = int(os.environ.get('LIVE_ARCHIVE_WORKERS', 2))
+LIVE_ARCHIVE_QUEUE_SIZE = int(os.environ.get('LIVE_ARCHIVE_QUEUE_SIZE', 1000))
+LIVE_SEGMENT_CACHE_CONTROL = "public, max-age=31536000, immutable"
+LIVE_PLAYLIST_CACHE_CONTROL = "no-cache"
+
+def hash_stream_key(stream_key: str) -> str:
+    return hashlib.sha256(stream_key.encode()).hexdigest()
+
+def render_hls_playlist(segments: List[Tuple[int, float]], ended: bool, vod: bool = False, max_duration: float = 0) -> str:
+    """HLS media playlist for consecutive (sequence, duration) segments.
+    
+    The target duration may not change during a stream, so live playlists
+    pass the longest duration seen so far as `max_duration`.
+    """
+    target_duration = math.ceil(max([max_duration, 1] + [duration for _, duration in segments]))
+    lines = [
+        "#EXTM3U",
+        "#EXT-X-VERSION:3",
+        f"#EXT-X-TARGETDURATION:{target_duration}",
+        f"#EXT-X-MEDIA-SEQUENCE:{segments[0][0] if segments else 0}"
+    ]
+    if vod:
+        lines.append("#EXT-X-PLAYLIST-TYPE:VOD")
+    for sequence, duration in segments:
+        lines.append(f"#EXTINF:{duration:.3f},")
+        lines.append(f"segments/{sequence}.ts")
+    if ended:
+        lines.append("#EXT-X-ENDLIST")
+    return "\n".join(lines) + "\n"
+
+class LiveStreamWindow:
+    """The most recent segments of one stream, held in memory"""
+    
+    def __init__(self, stream_id: str, key_hash: str, next_sequence: int):
+        self.stream_id = stream_id
+        self.key_hash = key_hash
+        self.next_sequence = next_sequence
+        self.segments: "OrderedDict[int, Tuple[float, bytes]]" = OrderedDict()
+        self.max_duration = 0.0
+        self.ended = False
+        self.announced = False  # status set to "live" in Mongo
+        self.last_ingest = time.monotonic()
+        self.ended_at: Optional[float] = None
+        self.updated = asyncio.Event()
+        # Segments of this stream waiting in the shared archive queue
+        self.pending_archives = 0
+        self.archived = asyncio.Event()
+        self.archived.set()
+    
+    def add(self, sequence: int, duration: float, data: bytes):
+        if sequence == self.next_sequence:
+            self.next_sequence += 1
+        elif sequence not in self.segments:
+            raise HTTPException(status_code=409, detail=f"Expected segment {self.next_sequence}")
+        # Otherwise a retry of a segment still held: replace it
+        self.segments[sequence] = (duration, data)
+        self.max_duration = max(self.max_duration, duration)
+        while len(self.segments) > LIVE_RETAINED_SEGMENTS:
+            self.segments.popitem(last=False)
+        self.last_ingest = time.monotonic()
+        self.notify()
+    
+    def end(self):
+        self.ended = True
+        self.ended_at = time.monotonic()
+        self.notify()
+    
+    def archive_queued(self):
+        self.pending_archives += 1
+        self.archived.clear()
+    
+    def archive_done(self):
+        self.pending_archives -= 1
+        if self.pending_archives == 0:
+            self.archived.set()
+    
+    def notify(self):
+        # Wakes every blocked playlist request; later ones wait on a fresh event
+        self.updated.set()
+        self.updated = asyncio.Event()
+    
+    def playlist(self) -> str:
+        listed = list(self.segments.items())[-LIVE_WINDOW_SEGMENTS:]
+        return render_hls_playlist(
+            [(sequence, duration) for sequence, (duration, _) in listed],
+            self.ended,
+            max_duration=self.max_duration
+        )
+    
+    async def wait_for(self, sequence: int, timeout: float):
+        """Block until `sequence` is available or the stream ends (LL-HLS blocking reload)"""
+        deadline = time.monotonic() + timeout
+        while sequence >= self.next_sequence and not self.ended:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            try:
+                await asyncio.wait_for(self.updated.wait(), timeout=remaining)
+            except asyncio.TimeoutError:
+                return
+    
+    @property
+    def memory_bytes(self) -> int:
+        return sum(len(data) for _, data in self.segments.values())
+
+class LiveStreamHub:
+    """In-memory live windows of this worker plus their background archiving"""
+    
+    def __init__(self, archive_workers: int, archive_queue_size: int):
+        self.archive_workers = archive_workers
+        self.windows: Dict[str, LiveStreamWindow] = {}
+        self.archive_queue: asyncio.Queue = asyncio.Queue(maxsize=archive_queue_size)
+        self.tasks: List[asyncio.Task] = []
+        self.ending: Dict[str, asyncio.Task] = {}  # idle streams being ended by the reaper
+        self.archived_segments = 0
+        self.archive_failures = 0
+    
+    def start(self):
+        self.tasks = [asyncio.create_task(self.archiver()) for _ in range(self.archive_workers)]
+        self.tasks.append(asyncio.create_task(self.reaper()))
+    
+    async def stop(self, drain_timeout: float = 30):
+        # Segments already accepted should still reach the archive
+        try:
+            await asyncio.wait_for(self.archive_queue.join(), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Shutting down with {self.archive_queue.qsize()} live segments unarchived")
+        tasks = self.tasks + list(self.ending.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.tasks = []
+    
+    async def open_window(self, stream: Dict[str, Any]) -> LiveStreamWindow:
+        window = self.windows.get(stream["id"])
+        if window is not None:
+            return window
+        if len(self.windows) >= LIVE_MAX_STREAMS:
+            raise HTTPException(status_code=503, detail="Too many live streams on this server")
+        # Resuming after a restart or on another worker continues the numbering
+        last = await db.live_segments.find_one(
+            {"stream_id": stream["id"]}, {"_id": 0, "sequence": 1}, sort=[("sequence", DESCENDING)]
+        )
+        next_sequence = last["sequence"] + 1 if last else 0
+        window = self.windows.get(stream["id"])
+        if window is None:
+            window = LiveStreamWindow(stream["id"], stream["stream_key_hash"], next_sequence)
+            self.windows[stream["id"]] = window
+        return window
+    
+    async def ingest(self, window: LiveStreamWindow, sequence: int, duration: float, data: bytes):
+        window.add(sequence, duration, data)
+        window.archive_queued()
+        try:
+            # Blocks the producer only when archiving falls this far behind
+            await self.archive_queue.put((window, sequence, duration, data))
+        except BaseException:
+            window.archive_done()
+            raise
+    
+    async def archiver(self):
+        while True:
+            window, sequence, duration, data = await self.archive_queue.get()
+            try:
+                await self.archive(window.stream_id, sequence, duration, data)
+                self.archived_segments += 1
+            except Exception as e:
+                self.archive_failures += 1
+                logger.error(f"Failed to archive segment {sequence} of live stream {window.stream_id}: {e}")
+            finally:
+                window.archive_done()
+                self.archive_queue.task_done()
+    
+    async def archive(self, stream_id: str, sequence: int, duration: float, data: bytes):
+        file_id = await store_media_bytes(
+            f"{stream_id}_{sequence}.ts",
+            data,
+            content_type="video/mp2t",
+            metadata={"category": "live_streams", "live_stream_id": stream_id, "sequence": sequence}
+        )
+        previous = await db.live_segments.find_one_and_update(
+            {"stream_id": stream_id, "sequence": sequence},
+            {"$set": {"duration": duration, "file_id": str(file_id), "size": len(data), "archived_at": datetime.now(timezone.utc)}},
+            upsert=True
+        )
+        if previous:
+            # A retried segment replaces the copy archived before it
+            await delete_stored_file(ObjectId(previous["file_id"]))
+        else:
+            await db.live_streams.update_one({"id": stream_id}, {"$inc": {"segment_count": 1}})
+    
+    async def reaper(self, interval: float = 5):
+        while True:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            for stream_id, window in list(self.windows.items()):
+                try:
+                    if not window.ended and now - window.last_ingest > LIVE_IDLE_TIMEOUT_SECONDS:
+                        # In the background, so a stream still archiving holds up no other
+                        if stream_id not in self.ending:
+                            logger.info(f"Ending idle live stream {stream_id}")
+                            self.ending[stream_id] = asyncio.create_task(self.end_idle_stream(stream_id))
+                    elif window.ended and now - window.ended_at > LIVE_ENDED_RETENTION_SECONDS:
+                        # Replays are served from the archive from here on
+                        self.windows.pop(stream_id, None)
+                except Exception as e:
+                    logger.error(f"Live stream reaper failed for {stream_id}: {e}")
+    
+    async def end_idle_stream(self, stream_id: str):
+        try:
+            await end_live_stream(stream_id)
+        except PyMongoError as e:
+            # Still idle on the next sweep, which tries again
+            logger.error(f"Failed to end idle live stream {stream_id}: {e}")
+        finally:
+            self.ending.pop(stream_id, None)
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "streams_in_memory": len(self.windows),
+            "memory_bytes": sum(window.memory_bytes for window in self.windows.values()),
+            "archive_queue": self.archive_queue.qsize(),
+            "archived_segments": self.archived_segments,
+            "archive_failures": self.archive_failures
+        }
+
+live_hub = LiveStreamHub(LIVE_ARCHIVE_WORKERS, LIVE_ARCHIVE_QUEUE_SIZE)
+
+async def get_live_stream(stream_id: str) -> Dict[str, Any]:
+    stream = await db.live_streams.find_one({"id": stream_id}, {"_id": 0})
+    if not stream:
+        raise HTTPException(status_code=404, detail="Live stream not found")
+    return stream
+
+def check_stream_key(key_hash: str, stream_key: Optional[str]):
+    if not stream_key or not hmac.compare_digest(hash_stream_key(stream_key), key_hash):
+        raise HTTPException(status_code=403, detail="Invalid stream key")
+
+def live_stream_response(stream: Dict[str, Any]) -> Dict[str, Any]:
+    response = {key: value for key, value in stream.items() if key not in ("_id", "stream_key_hash")}
+    response["playlist_url"] = f"/api/live/{stream['id']}/playlist.m3u8"
+    return response
+
+async def end_live_stream(stream_id: str, archive_timeout: float = 30):
+    # Ended streams are replayed from the archive, so let it catch up first.
+    # Only this stream's segments are waited for, others keep the queue busy
+    window = live_hub.windows.get(stream_id)
+    if window is not None:
+        try:
+            await asyncio.wait_for(window.archived.wait(), timeout=archive_timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Ending live stream {stream_id} with {window.pending_archives} segments not yet archived")
+    await db.live_streams.update_one(
+        {"id": stream_id, "status": {"$ne": "ended"}},
+        {"$set": {"status": "ended", "ended_at": datetime.now(timezone.utc)}}
+    )
+    if window is not None:
+        window.end()
+
+async def archived_playlist(stream: Dict[str, Any]) -> str:
+    """Playlist built from the GridFS archive: the whole stream once ended, else its tail"""
+    ended = stream["status"] == "ended"
+    cursor = db.live_segments.find({"stream_id": stream["id"]}, {"_id": 0, "sequence": 1, "duration": 1})
+    if ended:
+        segments = await cursor.sort("sequence", ASCENDING).to_list(None)
+    else:
+        segments = await cursor.sort("sequence", DESCENDING).limit(LIVE_WINDOW_SEGMENTS).to_list(LIVE_WINDOW_SEGMENTS)
+        segments.reverse()
+    return render_hls_playlist([(segment["sequence"], segment["duration"]) for segment in segments], ended, vod=ended)
+
+# Routes
+@api_router.get("/")
+async def root():
+    return {"message": "Welcome to Gizzle TV L.L.C. API"}
+
+@api_router.get("/health")
+async def health_check():
+    return {"status": "healthy", "timestamp": datetime.now(timezone.utc)}
+
+@api_router.get("/health/indexes")
+async def index_health_check():
+    """Report the build status of every declared MongoDB index"""
+    all_ready = all(
+        status == "ready"
+        for statuses in INDEX_BUILD_STATUS.values()
+        for status in statuses.values()
+    )
+    return {"status": "ready" if INDEX_BUILD_STATUS and all_ready else "degraded", "indexes": INDEX_BUILD_STATUS}
+
+@api_router.get("/health/cache")
+async def cache_health_check():
+    """Hit/miss metrics for the in-process caches"""
+    return {name: cache.stats() for name, cache in CACHES.items()}
+
+@api_router.get("/health/counters")
+async def counters_health_check():
+    """Write-behind engagement counter metrics"""
+    return engagement_counters.stats()
+
+@api_router.get("/health/media-cache")
+async def media_cache_health_check():
+    """Hit ratio, occupancy and eviction metrics of the hot media cache"""
+    return media_cache.stats()
+
+# Content Management Endpoints
+@api_router.post("/content/upload")
+async def upload_content(
+    category: str = Form(...),
+    description: str = Form(None),
+    tags: str = Form(""),
+    sha256: str = Form(None),
+    model_id: str = Form(None),
+    member_id: str = Form(None),
+    file: UploadFile = File(...)
+):
+    """Upload video or image content with support for large files.
+    
+    Identical bytes are stored once: the SHA-256 of the upload is computed
+    while streaming and a duplicate reuses the existing stored file. Clients
+    that send the `sha256` of their file up front skip the storage writes
+    entirely when it is already stored (the body is still hashed to verify).
+    """
+    
+    validate_upload_target(category, file.content_type)
+    await validate_uploader(model_id, member_id)
     
-    # Enhanced file size limits for high-quality content
-    max_file_sizes = {
-        "videos": 10 * 1024 * 1024 * 1024,  # 10GB for videos
-        "pictures": 100 * 1024 * 1024,       # 100MB for pictures
-        "live_streams": 5 * 1024 * 1024 * 1024  # 5GB for live streams
-    }
+    # Process tags
+    tag_list = [tag.strip() for tag in tags.split(",") if tag.strip()] if tags else []
+    max_size = MAX_FILE_SIZES.get(category, 100 * 1024 * 1024)
     
-    # Validate file type and size
-    if category == "videos":
-        if not file.content_type.startswith("video/"):
-            raise HTTPException(status_code=400, detail="Invalid file type for videos")
-    elif category == "pictures":
-        if not file.content_type.startswith("image/"):
-            raise HTTPException(status_code=400, detail="Invalid file type for pictures")
+    declared_sha256 = sha256.strip().lower() if sha256 else None
+    existing_file = await find_stored_file_by_hash(declared_sha256) if declared_sha256 else None
     
-    # Check file size
+    hasher = hashlib.sha256()
     file_size = 0
-    file_content = b""
     
-    # Read file in chunks to handle large files efficiently
-    chunk_size = 1024 * 1024  # 1MB chunks
-    while True:
-        chunk = await file.read(chunk_size)
-        if not chunk:
-            break
-        file_content += chunk
-        file_size += len(chunk)
-        
-        # Check if file exceeds size limit
-        if file_size > max_file_sizes.get(category, 100 * 1024 * 1024):
-            raise HTTPException(
-                status_code=413, 
-                detail=f"File too large. Maximum size for {category}: {max_file_sizes[category] // (1024*1024*1024)}GB" if max_file_sizes[category] >= 1024*1024*1024 else f"{max_file_sizes[category] // (1024*1024)}MB"
-            )
+    async def read_upload():
+        nonlocal file_size
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            file_size += len(chunk)
+            
+            # Check if file exceeds size limit
+            if file_size > max_size:
+                raise HTTPException(status_code=413, detail=file_too_large_detail(category))
+            
+            # hashlib releases the GIL on large buffers, keep it off the loop
+            await asyncio.to_thread(hasher.update, chunk)
+            yield chunk
     
-    # Process tags
-    tag_list = [tag.strip() for tag in tags.split(",") if tag.strip()] if tags else []
+    # Stream the upload into storage chunk by chunk so memory stays flat
+    # regardless of file size; a partly written file is removed on any error
+    file_id = None
+    if existing_file:
+        async for _ in read_upload():
+            pass
+    else:
+        file_id = ObjectId()
+        await storage.write(file_id, read_upload())
     
-    # Store in GridFS with metadata
-    file_id = fs.put(
-        file_content,
-        filename=file.filename,
-        content_type=file.content_type,
-        metadata={
-            "category": category,
-            "original_size": file_size,
-            "upload_timestamp": datetime.now(timezone.utc),
-            "high_quality": file_size > (100 * 1024 * 1024),  # Mark as high-quality if > 100MB
-            "tags": tag_list
-        }
-    )
+    digest = hasher.hexdigest()
+    if declared_sha256 and digest != declared_sha256:
+        if file_id is not None:
+            await storage.delete(file_id)
+        raise HTTPException(status_code=400, detail="Checksum mismatch")
     
-    # Create content item with enhanced metadata
-    content_item = ContentItem(
-        filename=str(file_id),
+    if file_id is not None:
+        # Catalogued once the final size and hash are known
+        try:
+            await register_stored_file(
+                file_id,
+                file.filename,
+                file_size,
+                file.content_type,
+                {**gridfs_file_metadata(category, file_size, tag_list), "sha256": digest, "ref_count": 1},
+                storage
+            )
+        except DuplicateKeyError:
+            # The _id is fresh, so it is the unique hash index: the same
+            # bytes were stored by a concurrent upload
+            existing_file = await find_stored_file_by_hash(digest)
+            if not existing_file:
+                raise
+    
+    if existing_file:
+        file_id = existing_file["_id"]
+        await db.fs.files.update_one({"_id": file_id}, {"$inc": {"metadata.ref_count": 1}})
+        logger.info(f"Deduplicated {file.filename} against stored file {file_id}")
+    
+    content_item = await create_content_item(
+        file_id=file_id,
         original_filename=file.filename,
         content_type=file.content_type,
         file_size=file_size,
         category=category,
-        tags=tag_list,
-        description=description or f"High-quality {category.rstrip('s')} upload - {file.filename}",
-        processing_status="completed" if category == "pictures" else "processing"  # Videos may need processing
+        tag_list=tag_list,
+        description=description,
+        reused_file=existing_file is not None,
+        model_id=model_id,
+        member_id=member_id
     )
+    return content_upload_result(content_item, deduplicated=existing_file is not None)
+
+# Resumable Upload Endpoints
+@api_router.post("/uploads")
+async def create_upload_session(session_data: UploadSessionCreate):
+    """Start a resumable upload; chunks are then PUT by index in any order"""
     
-    # Save to database
-    await db.content_items.insert_one(content_item.dict())
+    validate_upload_target(session_data.category, session_data.content_type)
+    if session_data.total_size > MAX_FILE_SIZES.get(session_data.category, 100 * 1024 * 1024):
+        raise HTTPException(status_code=413, detail=file_too_large_detail(session_data.category))
+    await validate_uploader(session_data.model_id, session_data.member_id)
     
-    logger.info(f"Successfully uploaded {file.filename} ({file_size} bytes) in category {category}")
+    session = UploadSession(
+        **session_data.dict(),
+        file_id=str(ObjectId()),
+        chunk_size=RESUMABLE_UPLOAD_CHUNK_SIZE,
+        gridfs_chunk_size=GRIDFS_CHUNK_SIZE,
+        total_chunks=max(1, -(-session_data.total_size // RESUMABLE_UPLOAD_CHUNK_SIZE))
+    )
+    await db.upload_sessions.insert_one(session.dict())
     
     return {
-        "message": "Content uploaded successfully", 
-        "content_id": content_item.id,
-        "file_size": file_size,
-        "high_quality": file_size > (100 * 1024 * 1024),
-        "processing_status": content_item.processing_status
+        "upload_id": session.id,
+        "chunk_size": session.chunk_size,
+        "total_chunks": session.total_chunks,
+        "expires_after_seconds": UPLOAD_SESSION_TTL_SECONDS
+    }
+
+@api_router.put("/uploads/{upload_id}/chunks/{chunk_index}")
+async def upload_chunk(upload_id: str, chunk_index: int, request: Request):
+    """Store one chunk (raw request body) straight into GridFS chunk documents"""
+    
+    session = await get_open_upload_session(upload_id)
+    if not 0 <= chunk_index < session["total_chunks"]:
+        raise HTTPException(status_code=400, detail="Chunk index out of range")
+    
+    expected_size = upload_chunk_length(session, chunk_index)
+    gridfs_chunk_size = session["gridfs_chunk_size"]
+    pieces_per_chunk = session["chunk_size"] // gridfs_chunk_size
+    file_id = ObjectId(session["file_id"])
+    
+    # Slice the body into GridFS-sized pieces and upsert them as they fill,
+    # so retries of the same chunk simply overwrite and memory stays bounded
+    buffer = bytearray()
+    received = 0
+    piece_index = chunk_index * pieces_per_chunk
+    async for data in request.stream():
+        received += len(data)
+        if received > expected_size:
+            raise HTTPException(status_code=400, detail=f"Chunk {chunk_index} must be {expected_size} bytes")
+        buffer += data
+        while len(buffer) >= gridfs_chunk_size:
+            await write_gridfs_chunk(file_id, piece_index, bytes(buffer[:gridfs_chunk_size]))
+            del buffer[:gridfs_chunk_size]
+            piece_index += 1
+    
+    if received != expected_size:
+        raise HTTPException(status_code=400, detail=f"Chunk {chunk_index} must be {expected_size} bytes")
+    if buffer:
+        await write_gridfs_chunk(file_id, piece_index, bytes(buffer))
+    
+    await db.upload_sessions.update_one(
+        {"id": upload_id},
+        {
+            "$addToSet": {"received_chunks": chunk_index},
+            "$set": {"updated_at": datetime.now(timezone.utc)}
+        }
+    )
+    return {"upload_id": upload_id, "chunk_index": chunk_index, "received_bytes": received}
+
+@api_router.get("/uploads/{upload_id}")
+async def get_upload_session(upload_id: str):
+    """Report which chunks have arrived so a client can resume"""
+    
+    session = await db.upload_sessions.find_one({"id": upload_id}, {"_id": 0})
+    if not session:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    
+    received = set(session.get("received_chunks", []))
+    return {
+        "upload_id": upload_id,
+        "status": session["status"],
+        "chunk_size": session["chunk_size"],
+        "total_chunks": session["total_chunks"],
+        "received_chunks": sorted(received),
+        "missing_chunks": [index for index in range(session["total_chunks"]) if index not in received],
+        "content_id": session.get("content_id")
+    }
+
+@api_router.post("/uploads/{upload_id}/complete")
+async def complete_upload_session(upload_id: str):
+    """Finalize a resumable upload into a stored file and a ContentItem"""
+    
+    session = await db.upload_sessions.find_one({"id": upload_id}, {"_id": 0})
+    if not session:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    
+    # Completing twice returns the same content item
+    if session["status"] == "completed":
+        item = await db.content_items.find_one({"id": session["content_id"]}, {"_id": 0})
+        return content_upload_result(ContentItem(**item))
+    
+    missing = set(range(session["total_chunks"])) - set(session.get("received_chunks", []))
+    if missing:
+        raise HTTPException(status_code=409, detail=f"Missing chunks: {sorted(missing)[:20]}")
+    
+    # Claim the session so concurrent completes cannot create two items
+    claimed = await db.upload_sessions.update_one(
+        {"id": upload_id, "status": "open"},
+        {"$set": {"status": "completing", "updated_at": datetime.now(timezone.utc)}}
+    )
+    if claimed.modified_count == 0:
+        raise HTTPException(status_code=409, detail="Upload is already being completed")
+    
+    file_id = ObjectId(session["file_id"])
+    try:
+        # The chunks are already in place, only the files document is missing
+        await db.fs.files.insert_one({
+            "_id": file_id,
+            "length": session["total_size"],
+            "chunkSize": session["gridfs_chunk_size"],
+            "uploadDate": datetime.now(timezone.utc),
+            "filename": session["filename"],
+            "contentType": session["content_type"],
+            "metadata": gridfs_file_metadata(session["category"], session["total_size"], session["tags"])
+        })
+        content_item = await create_content_item(
+            file_id=file_id,
+            original_filename=session["filename"],
+            content_type=session["content_type"],
+            file_size=session["total_size"],
+            category=session["category"],
+            tag_list=session["tags"],
+            description=session.get("description"),
+            model_id=session.get("model_id"),
+            member_id=session.get("member_id")
+        )
+    except BaseException:
+        # Reopened, so the client can retry and the GC still reclaims the chunks
+        await db.fs.files.delete_one({"_id": file_id})
+        await db.upload_sessions.update_one(
+            {"id": upload_id},
+            {"$set": {"status": "open", "updated_at": datetime.now(timezone.utc)}}
+        )
+        raise
+    
+    if storage.name != "gridfs":
+        task = asyncio.create_task(move_to_configured_storage(file_id))
+        storage_move_tasks.add(task)
+        task.add_done_callback(storage_move_tasks.discard)
+    await db.upload_sessions.update_one(
+        {"id": upload_id},
+        {"$set": {"status": "completed", "content_id": content_item.id, "updated_at": datetime.now(timezone.utc)}}
+    )
+    return content_upload_result(content_item)
+
+@api_router.delete("/uploads/{upload_id}")
+async def abort_upload_session(upload_id: str):
+    """Abandon a resumable upload and free its stored chunks"""
+    
+    session = await get_open_upload_session(upload_id)
+    await discard_upload_session(session)
+    return {"message": "Upload aborted"}
+
+# Direct Upload Endpoints
+@api_router.post("/uploads/direct")
+async def create_direct_upload(upload_data: DirectUploadCreate):
+    """Sign a URL the client PUTs the file to, straight into the object store.
+    
+    Send the returned headers with the PUT, then call `complete_url` to
+    create the content item.
+    """
+    
+    if not supports_direct_transfers(storage):
+        raise HTTPException(status_code=501, detail="Direct uploads need an object store storage backend")
+    validate_upload_target(upload_data.category, upload_data.content_type)
+    if upload_data.total_size > MAX_FILE_SIZES.get(upload_data.category, 100 * 1024 * 1024):
+        raise HTTPException(status_code=413, detail=file_too_large_detail(upload_data.category))
+    sha256 = upload_data.sha256.strip().lower() if upload_data.sha256 else None
+    if sha256 and not re.fullmatch(r"[0-9a-f]{64}", sha256):
+        raise HTTPException(status_code=400, detail="sha256 must be a hex SHA-256 digest")
+    await validate_uploader(upload_data.model_id, upload_data.member_id)
+    
+    upload = DirectUpload(
+        **upload_data.dict(exclude={"sha256"}),
+        sha256=sha256,
+        file_id=str(ObjectId()),
+        storage=storage.name,
+        url_expires_at=datetime.now(timezone.utc) + timedelta(seconds=PRESIGNED_URL_TTL_SECONDS)
+    )
+    url, headers = await storage.presign_upload(
+        ObjectId(upload.file_id), upload.content_type, upload.total_size, sha256, PRESIGNED_URL_TTL_SECONDS
+    )
+    await db.direct_uploads.insert_one(upload.dict())
+    
+    return {
+        "upload_id": upload.id,
+        "upload_url": url,
+        "method": "PUT",
+        "headers": headers,
+        "expires_at": upload.url_expires_at,
+        "complete_url": f"/api/uploads/direct/{upload.id}/complete"
+    }
+
+@api_router.post("/uploads/direct/{upload_id}/complete")
+async def complete_direct_upload(upload_id: str):
+    """Check the uploaded object and record it as a ContentItem"""
+    
+    upload = await db.direct_uploads.find_one({"id": upload_id}, {"_id": 0})
+    if not upload:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    
+    # Completing twice returns the same content item
+    if upload["status"] == "completed":
+        item = await db.content_items.find_one({"id": upload["content_id"]}, {"_id": 0})
+        return content_upload_result(ContentItem(**item))
+    
+    # Claim the upload so concurrent completes cannot create two items
+    claimed = await db.direct_uploads.update_one(
+        {"id": upload_id, "status": "open"},
+        {"$set": {"status": "completing", "updated_at": datetime.now(timezone.utc)}}
+    )
+    if claimed.modified_count == 0:
+        raise HTTPException(status_code=409, detail="Upload is already being completed")
+    
+    backend = get_storage_backend(upload["storage"])
+    file_id = ObjectId(upload["file_id"])
+    try:
+        stored_size = await backend.stat(file_id)
+        if stored_size is None:
+            raise HTTPException(status_code=409, detail="Nothing has been uploaded yet")
+        if stored_size != upload["total_size"]:
+            # Dropped so the client can upload again while the URL is valid
+            await backend.delete(file_id)
+            raise HTTPException(status_code=400, detail=f"Uploaded {stored_size} bytes, expected {upload['total_size']}")
+    except BaseException:
+        await db.direct_uploads.update_one(
+            {"id": upload_id},
+            {"$set": {"status": "open", "updated_at": datetime.now(timezone.utc)}}
+        )
+        raise
+    
+    metadata = {**gridfs_file_metadata(upload["category"], stored_size, upload["tags"]), "ref_count": 1}
+    existing_file = None
+    if upload.get("sha256"):
+        # Verified by the store against the signed checksum
+        metadata["sha256"] = upload["sha256"]
+    try:
+        await register_stored_file(file_id, upload["filename"], stored_size, upload["content_type"], metadata, backend)
+    except DuplicateKeyError:
+        # Same bytes already stored: this copy was deleted, share the other one
+        existing_file = await find_stored_file_by_hash(upload["sha256"]) if upload.get("sha256") else None
+        if not existing_file:
+            raise
+        file_id = existing_file["_id"]
+        await db.fs.files.update_one({"_id": file_id}, {"$inc": {"metadata.ref_count": 1}})
+        logger.info(f"Deduplicated direct upload {upload_id} against stored file {file_id}")
+    
+    content_item = await create_content_item(
+        file_id=file_id,
+        original_filename=upload["filename"],
+        content_type=upload["content_type"],
+        file_size=stored_size,
+        category=upload["category"],
+        tag_list=upload["tags"],
+        description=upload.get("description"),
+        reused_file=existing_file is not None,
+        model_id=upload.get("model_id"),
+        member_id=upload.get("member_id")
+    )
+    await db.direct_uploads.update_one(
+        {"id": upload_id},
+        {"$set": {"status": "completed", "content_id": content_item.id, "updated_at": datetime.now(timezone.utc)}}
+    )
+    return content_upload_result(content_item, deduplicated=existing_file is not None)
+
+@api_router.delete("/uploads/direct/{upload_id}")
+async def abort_direct_upload(upload_id: str):
+    """Abandon a direct upload and delete whatever was uploaded"""
+    
+    upload = await db.direct_uploads.find_one({"id": upload_id}, {"_id": 0})
+    if not upload:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    if upload["status"] != "open":
+        raise HTTPException(status_code=409, detail=f"Upload is {upload['status']}")
+    await discard_direct_upload(upload)
+    return {"message": "Upload aborted"}
+
+@api_router.get("/storage/dedup")
+async def get_dedup_report():
+    """How much storage content deduplication has saved"""
+    
+    pipeline = [
+        {"$match": {"metadata.sha256": {"$exists": True}}},
+        {"$group": {
+            "_id": None,
+            "hashed_files": {"$sum": 1},
+            "stored_bytes": {"$sum": "$length"},
+            "shared_files": {"$sum": {"$cond": [{"$gt": ["$metadata.ref_count", 1]}, 1, 0]}},
+            "duplicate_uploads": {"$sum": {"$subtract": ["$metadata.ref_count", 1]}},
+            "bytes_reclaimed": {"$sum": {"$multiply": ["$length", {"$subtract": ["$metadata.ref_count", 1]}]}}
+        }}
+    ]
+    results = await db.fs.files.aggregate(pipeline).to_list(1)
+    report = results[0] if results else {
+        "hashed_files": 0, "stored_bytes": 0, "shared_files": 0, "duplicate_uploads": 0, "bytes_reclaimed": 0
+    }
+    report.pop("_id", None)
+    logical_bytes = report["stored_bytes"] + report["bytes_reclaimed"]
+    report["dedup_ratio"] = round(logical_bytes / report["stored_bytes"], 3) if report["stored_bytes"] else 1.0
+    return report
+
+@api_router.get("/storage/backends")
+async def get_storage_report():
+    """Files and bytes held by each storage backend, e.g. to follow a migration"""
+    
+    pipeline = [
+        {"$group": {
+            "_id": {"$ifNull": ["$storage", "gridfs"]},
+            "files": {"$sum": 1},
+            "bytes": {"$sum": "$length"}
+        }},
+        {"$sort": {"_id": 1}}
+    ]
+    backends = {
+        result["_id"]: {"files": result["files"], "bytes": result["bytes"]}
+        for result in await db.fs.files.aggregate(pipeline).to_list(None)
     }
+    return {"write_backend": storage.name, "backends": backends}
 
 @api_router.get("/content/{category}")
-async def get_content_by_category(category: str):
-    """Get content by category"""
-    valid_categories = ["videos", "pictures", "live_streams"]
-    if category not in valid_categories:
+async def get_content_by_category(
+    category: str,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=500),
+    fields: Optional[str] = None
+):
+    """Get content by category, newest first, one page at a time.
+    
+    Pages are keyset paginated on (upload_timestamp, id): pass the
+    X-Next-Cursor header of one response as `cursor` to get the next page.
+    `fields` is an optional comma separated projection of ContentItem fields.
+    """
+    if category not in VALID_CATEGORIES:
         raise HTTPException(status_code=400, detail="Invalid category")
     
-    content_items = await db.content_items.find({"category": category}).to_list(100)
-    return [ContentItem(**item) for item in content_items]
+    requested = None
+    if fields:
+        requested = {field.strip() for field in fields.split(",") if field.strip()}
+        unknown = requested - set(ContentItem.model_fields)
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+        # The cursor is built from these, so they are always returned
+        requested = sorted(requested | {"id", "upload_timestamp"})
+    
+    page = await content_listing_cache.get_or_load(
+        ("content", category, cursor, limit, ",".join(requested) if requested else None),
+        lambda: load_content_page(category, cursor, limit, requested)
+    )
+    
+    headers = {}
+    if page["next_cursor"]:
+        headers["X-Next-Cursor"] = page["next_cursor"]
+    return JSONResponse(content=page["items"], headers=headers)
+
+async def load_content_page(category: str, cursor: Optional[str], limit: int, fields: Optional[List[str]]) -> Dict[str, Any]:
+    query = {"category": category}
+    if cursor:
+        last_timestamp, last_id = decode_content_cursor(cursor)
+        query["$or"] = [
+            {"upload_timestamp": {"$lt": last_timestamp}},
+            {"upload_timestamp": last_timestamp, "id": {"$lt": last_id}}
+        ]
+    
+    projection = {"_id": 0}
+    if fields:
+        projection.update({field: 1 for field in fields})
+    
+    # Fetch one extra item to learn whether another page exists
+    content_items = await db.content_items.find(query, projection).sort(
+        CONTENT_LISTING_SORT
+    ).limit(limit + 1).to_list(limit + 1)
+    
+    next_cursor = None
+    if len(content_items) > limit:
+        content_items = content_items[:limit]
+        next_cursor = encode_content_cursor(content_items[-1])
+    
+    return {"items": jsonable_encoder(content_items), "next_cursor": next_cursor}
 
 @api_router.get("/content/file/{file_id}")
-async def get_file(file_id: str):
-    """Stream file content"""
+async def get_file(file_id: str, request: Request, variant: Optional[str] = None, content_id: Optional[str] = None):
+    """Stream file content, honouring conditional and Range requests.
+    
+    Pictures accept `variant` (thumb, medium, full) to get a resized copy,
+    encoded as WebP or JPEG depending on the Accept header. `content_id`
+    names the content item being played, which gets the view.
+    """
+    object_id = parse_file_id(file_id)
     try:
-        file_data = fs.get(file_id)
-        
-        def iterfile():
-            yield file_data.read()
+        file_data = await open_stored_file(object_id)
+        vary_headers = {}
         
+        if variant:
+            if variant not in IMAGE_VARIANTS:
+                raise HTTPException(status_code=400, detail=f"Unknown variant. Choose from: {', '.join(IMAGE_VARIANTS)}")
+            if (file_data.metadata or {}).get("category") != "pictures":
+                raise HTTPException(status_code=400, detail="Variants are only available for pictures")
+            image_format = negotiate_image_format(request.headers.get("accept"))
+            derivative_id = await get_image_derivative(object_id, variant, image_format)
+            file_data = await open_stored_file(derivative_id)
+            vary_headers["Vary"] = "Accept"
+    except gridfs.errors.NoFile:
+        raise HTTPException(status_code=404, detail="File not found")
+    
+    # Validators come from the GridFS files document only, so a 304 never
+    # touches chunk data
+    etag = file_etag(file_data)
+    last_modified = file_last_modified(file_data)
+    category = (file_data.metadata or {}).get("category")
+    cache_headers = {
+        "ETag": etag,
+        "Last-Modified": format_datetime(last_modified, usegmt=True),
+        "Cache-Control": CATEGORY_CACHE_CONTROL.get(category, DEFAULT_CACHE_CONTROL),
+        **vary_headers
+    }
+    
+    if is_not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=cache_headers)
+    
+    file_size = file_data.length
+    media_type = file_data.content_type or mimetypes.guess_type(file_data.filename or "")[0] or "application/octet-stream"
+    headers = {
+        "Content-Disposition": f"inline; filename={file_data.filename}",
+        "Accept-Ranges": "bytes",
+        **cache_headers
+    }
+    
+    range_header = request.headers.get("range")
+    ranges = None
+    if range_header and if_range_allows(request, etag, last_modified):
+        ranges = parse_range_header(range_header, file_size)
+    
+    # Count a view when playback starts, not for every seek of the player,
+    # nor for resized copies shown in picture grids
+    if not variant and (ranges is None or ranges[0][0] == 0):
+        viewed_item = await viewed_item_cache.get_or_load(
+            (str(object_id), content_id),
+            lambda: find_viewed_item(str(object_id), content_id)
+        )
+        if viewed_item:
+            engagement_counters.increment("content_items", viewed_item, "view_count")
+    
+    # Files in an object store are fetched from it directly; it serves single
+    # ranges itself, multipart range responses are still built here
+    if ranges is None or len(ranges) == 1:
+        redirect = await direct_download_response(
+            file_data, media_type, headers["Content-Disposition"], cache_headers["Cache-Control"], vary_headers
+        )
+        if redirect is not None:
+            return redirect
+    media_cache.record_request(file_data)
+    
+    # No (usable) Range header: send the whole file
+    if ranges is None:
+        headers["Content-Length"] = str(file_size)
+        return StreamingResponse(
+            media_cache.iter_range(file_data, 0, file_size - 1),
+            media_type=media_type,
+            headers=headers
+        )
+    
+    # Single range: plain 206 with Content-Range
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        headers["Content-Range"] = f"bytes {start}-{end}/{file_size}"
+        headers["Content-Length"] = str(end - start + 1)
         return StreamingResponse(
-            iterfile(), 
-            media_type=file_data.content_type,
-            headers={"Content-Disposition": f"inline; filename={file_data.filename}"}
+            media_cache.iter_range(file_data, start, end),
+            status_code=206,
+            media_type=media_type,
+            headers=headers
+        )
+    
+    # Multiple ranges: multipart/byteranges body
+    boundary = uuid.uuid4().hex
+    part_headers = [
+        (
+            ("\r\n" if index else "")
+            + f"--{boundary}\r\n"
+            + f"Content-Type: {media_type}\r\n"
+            + f"Content-Range: bytes {start}-{end}/{file_size}\r\n\r\n"
+        ).encode()
+        for index, (start, end) in enumerate(ranges)
+    ]
+    closing = f"\r\n--{boundary}--\r\n".encode()
+    headers["Content-Length"] = str(
+        sum(len(part) for part in part_headers)
+        + sum(end - start + 1 for start, end in ranges)
+        + len(closing)
+    )
+    
+    async def iter_byteranges():
+        for part_header, (start, end) in zip(part_headers, ranges):
+            yield part_header
+            async for data in media_cache.iter_range(file_data, start, end):
+                yield data
+        yield closing
+    
+    return StreamingResponse(
+        iter_byteranges(),
+        status_code=206,
+        media_type=f"multipart/byteranges; boundary={boundary}",
+        headers=headers
+    )
+
+@api_router.get("/content/file/{file_id}/url")
+async def get_file_url(file_id: str):
+    """Where to download a file: a signed object store URL when it has one, else the API endpoint"""
+    try:
+        file_data = await open_stored_file(parse_file_id(file_id))
+    except gridfs.errors.NoFile:
+        raise HTTPException(status_code=404, detail="File not found")
+    
+    if DIRECT_DOWNLOADS and isinstance(file_data, StoredFile) and supports_direct_transfers(file_data.backend):
+        category = (file_data.metadata or {}).get("category")
+        url = await file_data.backend.presign_download(
+            file_data._id,
+            PRESIGNED_URL_TTL_SECONDS,
+            content_type=file_data.content_type,
+            content_disposition=f"inline; filename={file_data.filename}",
+            cache_control=CATEGORY_CACHE_CONTROL.get(category, DEFAULT_CACHE_CONTROL)
         )
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=PRESIGNED_URL_TTL_SECONDS)
+        return {"url": url, "direct": True, "expires_at": expires_at}
+    return {"url": f"/api/content/file/{file_id}", "direct": False, "expires_at": None}
+
+# Adaptive Bitrate Playback Endpoints
+@api_router.get("/content/{content_id}/playback")
+async def get_playback(content_id: str):
+    """Where to play an item: its HLS master playlist once the ladder is built, else the original file"""
+    item = await db.content_items.find_one(
+        {"id": content_id},
+        {"_id": 0, "filename": 1, "abr_status": 1, "hls_id": 1, "renditions": 1}
+    )
+    if not item:
+        raise HTTPException(status_code=404, detail="Content not found")
+    
+    playback = {
+        "abr_status": item.get("abr_status"),
+        "file_url": f"/api/content/file/{item['filename']}",
+        "hls_url": None,
+        "renditions": item.get("renditions") or []
+    }
+    if item.get("hls_id"):
+        playback["hls_url"] = f"/api/hls/{item['hls_id']}/master.m3u8"
+    return playback
+
+@api_router.get("/hls/{hls_id}/{path:path}")
+async def get_hls_file(hls_id: str, path: str, request: Request):
+    """Master playlist, rendition playlists and segments of a ladder; immutable once stored"""
+    object_id = parse_file_id(hls_id)
+    try:
+        grid_out = await open_stored_file_by_name(f"hls/{object_id}/{path}")
     except gridfs.errors.NoFile:
         raise HTTPException(status_code=404, detail="File not found")
+    
+    etag = file_etag(grid_out)
+    headers = {"ETag": etag, "Cache-Control": HLS_CACHE_CONTROL}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    
+    media_type = grid_out.content_type or HLS_CONTENT_TYPES.get(Path(path).suffix, "application/octet-stream")
+    # Only segments: players resolve playlist entries against the URL they
+    # fetched the playlist from, which has to stay this one
+    if not path.endswith(".m3u8"):
+        redirect = await direct_download_response(grid_out, media_type, None, HLS_CACHE_CONTROL)
+        if redirect is not None:
+            return redirect
+    
+    headers["Content-Length"] = str(grid_out.length)
+    media_cache.record_request(grid_out)
+    return StreamingResponse(
+        media_cache.iter_range(grid_out, 0, grid_out.length - 1),
+        media_type=media_type,
+        headers=headers
+    )
+
+# Live Streaming Endpoints
+@api_router.post("/live")
+async def create_live_stream(stream_data: LiveStreamCreate):
+    """Register a live stream; the returned stream_key authorizes ingest and is not shown again"""
+    
+    await validate_uploader(stream_data.model_id, None)
+    stream_key = secrets.token_urlsafe(32)
+    stream = LiveStream(**stream_data.dict(), stream_key_hash=hash_stream_key(stream_key))
+    await db.live_streams.insert_one(stream.dict())
+    
+    return {
+        **live_stream_response(stream.dict()),
+        "stream_key": stream_key,
+        "ingest_url": f"/api/live/{stream.id}/segments/{{sequence}}"
+    }
+
+@api_router.get("/live")
+async def get_live_streams(status: str = "live", limit: int = Query(20, ge=1, le=100)):
+    """Streams with the given status, most recently started first"""
+    streams = await db.live_streams.find({"status": status}, {"_id": 0}).sort(
+        "started_at", DESCENDING
+    ).limit(limit).to_list(limit)
+    return jsonable_encoder([live_stream_response(stream) for stream in streams])
+
+@api_router.get("/live/{stream_id}")
+async def get_live_stream_info(stream_id: str):
+    """A live stream's status and playlist URL"""
+    return jsonable_encoder(live_stream_response(await get_live_stream(stream_id)))
+
+@api_router.put("/live/{stream_id}/segments/{sequence}")
+async def ingest_live_segment(
+    stream_id: str,
+    sequence: int,
+    request: Request,
+    duration: float = Query(..., gt=0, le=30)
+):
+    """Push the next MPEG-TS segment (raw body), authorized by the X-Stream-Key header.
+    
+    Sequence numbers start at 0 and must be consecutive; re-sending a
+    segment that is still in the live window replaces it.
+    """
+    window = live_hub.windows.get(stream_id)
+    if window is None:
+        stream = await get_live_stream(stream_id)
+        check_stream_key(stream["stream_key_hash"], request.headers.get("x-stream-key"))
+        if stream["status"] == "ended":
+            raise HTTPException(status_code=409, detail="Live stream has ended")
+        window = await live_hub.open_window(stream)
+    else:
+        check_stream_key(window.key_hash, request.headers.get("x-stream-key"))
+        if window.ended:
+            raise HTTPException(status_code=409, detail="Live stream has ended")
+    
+    data = bytearray()
+    async for chunk in request.stream():
+        data.extend(chunk)
+        if len(data) > LIVE_MAX_SEGMENT_BYTES:
+            raise HTTPException(status_code=413, detail="Segment too large")
+    if not data:
+        raise HTTPException(status_code=400, detail="Empty segment")
+    
+    await live_hub.ingest(window, sequence, duration, bytes(data))
+    if not window.announced:
+        window.announced = True
+        await db.live_streams.update_one(
+            {"id": stream_id, "status": "created"},
+            {"$set": {"status": "live", "started_at": datetime.now(timezone.utc)}}
+        )
+    
+    return {"sequence": sequence, "next_sequence": window.next_sequence}
+
+@api_router.post("/live/{stream_id}/end")
+async def end_live_stream_endpoint(stream_id: str, request: Request):
+    """Stop a stream; its playlist becomes a complete replay of the archive"""
+    stream = await get_live_stream(stream_id)
+    check_stream_key(stream["stream_key_hash"], request.headers.get("x-stream-key"))
+    await end_live_stream(stream_id)
+    return {"message": "Live stream ended"}
+
+@api_router.get("/live/{stream_id}/playlist.m3u8")
+async def get_live_playlist(stream_id: str, hls_msn: Optional[int] = Query(None, alias="_HLS_msn", ge=0)):
+    """Sliding HLS playlist. With _HLS_msn the request waits until that segment exists."""
+    headers = {"Cache-Control": LIVE_PLAYLIST_CACHE_CONTROL}
+    
+    window = live_hub.windows.get(stream_id)
+    if window is not None and hls_msn is not None:
+        await window.wait_for(hls_msn, LIVE_BLOCKING_RELOAD_TIMEOUT_SECONDS)
+    if window is not None and not window.ended:
+        return Response(content=window.playlist(), media_type=HLS_PLAYLIST_MEDIA_TYPE, headers=headers)
+    
+    stream = await get_live_stream(stream_id)
+    return Response(content=await archived_playlist(stream), media_type=HLS_PLAYLIST_MEDIA_TYPE, headers=headers)
+
+@api_router.get("/live/{stream_id}/segments/{sequence}.ts")
+async def get_live_segment(stream_id: str, sequence: int):
+    """One segment: from memory while it is in the live window, else from the archive"""
+    headers = {"Cache-Control": LIVE_SEGMENT_CACHE_CONTROL}
+    
+    window = live_hub.windows.get(stream_id)
+    segment = window.segments.get(sequence) if window is not None else None
+    if segment is not None:
+        return Response(content=segment[1], media_type="video/mp2t", headers=headers)
+    
+    archived = await db.live_segments.find_one({"stream_id": stream_id, "sequence": sequence}, {"_id": 0, "file_id": 1})
+    if not archived:
+        raise HTTPException(status_code=404, detail="Segment not found")
+    grid_out = await open_stored_file(ObjectId(archived["file_id"]))
+    redirect = await direct_download_response(grid_out, "video/mp2t", None, LIVE_SEGMENT_CACHE_CONTROL)
+    if redirect is not None:
+        return redirect
+    headers["Content-Length"] = str(grid_out.length)
+    media_cache.record_request(grid_out)
+    return StreamingResponse(media_cache.iter_range(grid_out, 0, grid_out.length - 1), media_type="video/mp2t", headers=headers)
+
+@api_router.get("/health/live")
+async def live_health_check():
+    """In-memory live windows and archive backlog of this worker"""
+    return live_hub.stats()
 
 # Models Endpoints
 @api_router.post("/models", response_model=ModelProfile)
 async def create_model_profile(profile_data: ModelProfileCreate):
     """Create a new model profile"""
     
-    # Check if username already exists
-    existing_model = await db.model_profiles.find_one({"username": profile_data.username})
-    if existing_model:
-        raise HTTPException(status_code=400, detail="Username already exists")
-    
+    # Username uniqueness is enforced by the unique index in one round trip
     profile = ModelProfile(**profile_data.dict())
-    await db.model_profiles.insert_one(profile.dict())
+    try:
+        await db.model_profiles.insert_one(profile.dict())
+    except DuplicateKeyError as e:
+        if duplicate_key_field(e) == "username":
+            raise HTTPException(status_code=400, detail="Username already exists")
+        raise
     
+    await invalidate_model_cache(profile.dict())
+    await index_search_suggestions("models", [profile.dict()])
     return profile
 
 @api_router.get("/models", response_model=List[ModelProfile])
@@ -305,6 +4221,12 @@ async def get_models(
 ):
     """Get model profiles with optional filtering"""
     
+    return await model_cache.get_or_load(
+        ("models", featured, category, verified, limit),
+        lambda: load_models(featured, category, verified, limit)
+    )
+
+async def load_models(featured: Optional[bool], category: Optional[str], verified: Optional[bool], limit: int) -> List[ModelProfile]:
     query = {}
     
     if featured is not None:
@@ -323,6 +4245,11 @@ async def get_models(
 async def get_model_profile(model_id: str):
     """Get a specific model profile"""
     
+    profile = await model_cache.get_or_load(("model", model_id), lambda: load_model_profile(model_id))
+    engagement_counters.increment("model_profiles", model_id, "total_views")
+    return profile
+
+async def load_model_profile(model_id: str) -> ModelProfile:
     model = await db.model_profiles.find_one({"id": model_id})
     if not model:
         raise HTTPException(status_code=404, detail="Model not found")
@@ -333,57 +4260,195 @@ async def get_model_profile(model_id: str):
 async def verify_model(model_id: str):
     """Verify a model profile (admin function)"""
     
-    result = await db.model_profiles.update_one(
+    changes = {
+        "verification_status": "verified",
+        "updated_at": datetime.now(timezone.utc)
+    }
+    previous = await db.model_profiles.find_one_and_update(
         {"id": model_id},
-        {
-            "$set": {
-                "verification_status": "verified",
-                "updated_at": datetime.now(timezone.utc)
-            }
-        }
+        {"$set": changes},
+        projection={"_id": 0}
     )
     
-    if result.matched_count == 0:
+    if previous is None:
         raise HTTPException(status_code=404, detail="Model not found")
     
+    await invalidate_model_cache(previous, {**previous, **changes})
+    
     return {"message": "Model verified successfully"}
 
 @api_router.put("/models/{model_id}/feature")
 async def feature_model(model_id: str, featured: bool = True):
     """Feature/unfeature a model profile (admin function)"""
     
-    result = await db.model_profiles.update_one(
+    changes = {
+        "is_featured": featured,
+        "updated_at": datetime.now(timezone.utc)
+    }
+    previous = await db.model_profiles.find_one_and_update(
         {"id": model_id},
-        {
-            "$set": {
-                "is_featured": featured,
-                "updated_at": datetime.now(timezone.utc)
-            }
-        }
+        {"$set": changes},
+        projection={"_id": 0}
     )
     
-    if result.matched_count == 0:
+    if previous is None:
         raise HTTPException(status_code=404, detail="Model not found")
     
+    await invalidate_model_cache(previous, {**previous, **changes})
+    
     return {"message": f"Model {'featured' if featured else 'unfeatured'} successfully"}
 
+# Statistics Endpoints
+@api_router.get("/stats/content")
+async def get_content_stats(top_tags: int = Query(10, ge=0, le=100)):
+    """Per-category item counts, bytes, processing states and most used tags"""
+    
+    categories = {}
+    async for stats in db.content_stats.find({"_id": {"$in": VALID_CATEGORIES}}):
+        category = stats.pop("_id")
+        stats["processing_status"] = {status: count for status, count in stats.get("processing_status", {}).items() if count}
+        categories[category] = stats
+    
+    for category in VALID_CATEGORIES:
+        stats = categories.setdefault(category, {"items": 0, "bytes": 0, "processing_status": {}})
+        tags = await db.content_tag_stats.find(
+            {"category": category, "count": {"$gt": 0}},
+            {"_id": 0, "tag": 1, "count": 1}
+        ).sort([("count", DESCENDING)]).limit(top_tags).to_list(top_tags) if top_tags else []
+        stats["top_tags"] = tags
+    
+    return jsonable_encoder({
+        "categories": categories,
+        "totals": {
+            "items": sum(stats["items"] for stats in categories.values()),
+            "bytes": sum(stats["bytes"] for stats in categories.values())
+        }
+    })
+
+@api_router.post("/stats/content/rebuild")
+async def rebuild_content_stats_endpoint():
+    """Recompute the statistics from scratch (admin function, scans all content)"""
+    await rebuild_content_stats()
+    return {"message": "Content stats rebuilt"}
+
+# Search Endpoints
+@api_router.get("/search")
+async def search(
+    q: str = Query(..., min_length=1, max_length=200),
+    kind: str = Query("content", pattern="^(content|models)$"),
+    category: Optional[str] = None,
+    tags: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100)
+):
+    """Full-text search over content or model profiles, best matches first.
+    
+    `tags` is a comma separated list every result must carry. Facets count
+    tags (and, for content, categories) across all matches, not just the
+    page. Pass `next_cursor` back as `cursor` to get the next page.
+    """
+    match: Dict[str, Any] = {"$text": {"$search": q}}
+    if category:
+        match["category"] = category
+    tag_list = [tag.strip() for tag in tags.split(",") if tag.strip()] if tags else []
+    if tag_list:
+        match["tags"] = {"$all": tag_list}
+    
+    page_stages: List[Dict[str, Any]] = []
+    if cursor:
+        last_score, last_id = decode_search_cursor(cursor)
+        page_stages.append({"$match": {"$or": [
+            {"score": {"$lt": last_score}},
+            {"score": last_score, "id": {"$gt": last_id}}
+        ]}})
+    page_stages += [
+        {"$sort": {"score": -1, "id": 1}},
+        {"$limit": limit + 1},
+        {"$project": {"_id": 0}}
+    ]
+    
+    facets: Dict[str, List[Dict[str, Any]]] = {
+        "results": page_stages,
+        "total": [{"$count": "count"}],
+        "tags": [
+            {"$unwind": "$tags"},
+            {"$group": {"_id": "$tags", "count": {"$sum": 1}}},
+            {"$sort": {"count": -1, "_id": 1}},
+            {"$limit": SEARCH_FACET_LIMIT}
+        ]
+    }
+    if kind == "content":
+        facets["categories"] = [
+            {"$group": {"_id": "$category", "count": {"$sum": 1}}},
+            {"$sort": {"count": -1, "_id": 1}}
+        ]
+    
+    pipeline = [
+        {"$match": match},
+        {"$addFields": {"score": {"$meta": "textScore"}}},
+        {"$facet": facets}
+    ]
+    collection = db[SEARCH_KINDS[kind]["collection"]]
+    output = (await collection.aggregate(pipeline).to_list(1))[0]
+    
+    results = output["results"]
+    next_cursor = None
+    if len(results) > limit:
+        results = results[:limit]
+        next_cursor = encode_search_cursor(results[-1])
+    
+    return JSONResponse(content=jsonable_encoder({
+        "results": results,
+        "total": output["total"][0]["count"] if output["total"] else 0,
+        "facets": {
+            name: [{"value": bucket["_id"], "count": bucket["count"]} for bucket in buckets]
+            for name, buckets in output.items() if name not in ("results", "total")
+        },
+        "next_cursor": next_cursor
+    }))
+
+@api_router.get("/search/suggest")
+async def suggest_search_terms(
+    q: str = Query(..., min_length=1, max_length=100),
+    kind: str = Query("content", pattern="^(content|models)$"),
+    limit: int = Query(10, ge=1, le=50)
+):
+    """Autocomplete: the most common indexed terms starting with the last word of q"""
+    words = q.lower().split()
+    prefix = words[-1] if words else ""
+    # Shorter prefixes would sort too much of the dictionary by count
+    if len(prefix) < SEARCH_SUGGEST_MIN_PREFIX:
+        return {"suggestions": []}
+    
+    # An anchored, case-sensitive regex is a range scan on the kind_term index
+    suggestions = await db.search_suggestions.find(
+        {"kind": kind, "term": {"$regex": f"^{re.escape(prefix)}"}},
+        {"_id": 0, "term": 1, "count": 1}
+    ).sort([("count", DESCENDING), ("term", ASCENDING)]).limit(limit).to_list(limit)
+    
+    completed = " ".join(words[:-1])
+    return {"suggestions": [
+        {"text": f"{completed} {suggestion['term']}".strip(), "term": suggestion["term"], "count": suggestion["count"]}
+        for suggestion in suggestions
+    ]}
+
 # Community Endpoints
 @api_router.post("/community/members", response_model=CommunityMember)
 async def create_member(member_data: CommunityMemberCreate):
     """Create a new community member"""
     
-    # Check if username already exists
-    existing_member = await db.community_members.find_one({"username": member_data.username})
-    if existing_member:
-        raise HTTPException(status_code=400, detail="Username already exists")
-    
-    # Check if email already exists  
-    existing_email = await db.community_members.find_one({"email": member_data.email})
-    if existing_email:
-        raise HTTPException(status_code=400, detail="Email already registered")
-    
+    # Username and email uniqueness are enforced by unique indexes, so a
+    # single insert both checks and claims them without racing
     member = CommunityMember(**member_data.dict())
-    await db.community_members.insert_one(member.dict())
+    try:
+        await db.community_members.insert_one(member.dict())
+    except DuplicateKeyError as e:
+        field = duplicate_key_field(e)
+        if field == "username":
+            raise HTTPException(status_code=400, detail="Username already exists")
+        if field == "email":
+            raise HTTPException(status_code=400, detail="Email already registered")
+        raise
     
     return member
 
@@ -397,6 +4462,12 @@ async def get_community_members(limit: int = 20):
 @api_router.get("/subscriptions/plans")
 async def get_subscription_plans():
     """Get available subscription plans"""
+    return await subscription_plans_cache.get_or_load(
+        ("plans", SUBSCRIPTION_PLANS_VERSION),
+        load_subscription_plans
+    )
+
+async def load_subscription_plans() -> List[SubscriptionPlan]:
     return list(SUBSCRIPTION_PLANS.values())
 
 @api_router.post("/subscriptions/checkout")
@@ -412,15 +4483,10 @@ async def create_subscription_checkout(
     
     plan = SUBSCRIPTION_PLANS[plan_id]
     
-    # Get Stripe API key
-    stripe_api_key = os.environ.get('STRIPE_API_KEY')
-    if not stripe_api_key:
-        raise HTTPException(status_code=500, detail="Payment system not configured")
-    
-    # Initialize Stripe checkout
+    # Shared Stripe checkout client (500 if payments are not configured)
     host_url = str(request.base_url).rstrip('/')
     webhook_url = f"{host_url}/api/webhook/stripe"
-    stripe_checkout = StripeCheckout(api_key=stripe_api_key, webhook_url=webhook_url)
+    stripe_checkout = payment_client.checkout(webhook_url)
     
     # Create success and cancel URLs
     success_url = f"{host_url}/subscription-success?session_id={{CHECKOUT_SESSION_ID}}"
@@ -489,15 +4555,10 @@ async def create_purchase_checkout(
     
     item = purchase_items[item_id]
     
-    # Get Stripe API key
-    stripe_api_key = os.environ.get('STRIPE_API_KEY')
-    if not stripe_api_key:
-        raise HTTPException(status_code=500, detail="Payment system not configured")
-    
-    # Initialize Stripe checkout
+    # Shared Stripe checkout client (500 if payments are not configured)
     host_url = str(request.base_url).rstrip('/')
     webhook_url = f"{host_url}/api/webhook/stripe"
-    stripe_checkout = StripeCheckout(api_key=stripe_api_key, webhook_url=webhook_url)
+    stripe_checkout = payment_client.checkout(webhook_url)
     
     # Create success and cancel URLs
     success_url = f"{host_url}/purchase-success?session_id={{CHECKOUT_SESSION_ID}}"
@@ -551,90 +4612,66 @@ async def create_purchase_checkout(
 async def get_payment_status(session_id: str):
     """Get payment status for a session"""
     
-    # Get Stripe API key
-    stripe_api_key = os.environ.get('STRIPE_API_KEY')
-    if not stripe_api_key:
-        raise HTTPException(status_code=500, detail="Payment system not configured")
-    
-    # Initialize Stripe checkout
-    stripe_checkout = StripeCheckout(api_key=stripe_api_key, webhook_url="")
-    
     try:
-        # Get checkout status from Stripe
-        checkout_status = await stripe_checkout.get_checkout_status(session_id)
-        
-        # Find transaction in database
-        transaction = await db.payment_transactions.find_one({"session_id": session_id})
-        
-        if transaction:
-            # Update transaction status if payment is completed and not already processed
-            if checkout_status.payment_status == "paid" and transaction["payment_status"] != "paid":
-                await db.payment_transactions.update_one(
-                    {"session_id": session_id},
-                    {
-                        "$set": {
-                            "payment_status": "paid",
-                            "updated_at": datetime.now(timezone.utc)
-                        }
-                    }
-                )
-                
-                # Here you can add logic to grant premium features, credits, etc.
-                logger.info(f"Payment completed for session {session_id}")
-        
-        return {
-            "session_id": session_id,
-            "status": checkout_status.status,
-            "payment_status": checkout_status.payment_status,
-            "amount_total": checkout_status.amount_total,
-            "currency": checkout_status.currency,
-            "metadata": checkout_status.metadata
-        }
-        
+        response = await payment_status_cache.get_or_load(
+            session_id,
+            lambda: load_payment_status(session_id),
+            ttl=payment_status_ttl
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error checking payment status: {e}")
         raise HTTPException(status_code=500, detail="Failed to check payment status")
+    
+    return {key: value for key, value in response.items() if key != "transaction_status"}
 
 # Stripe Webhook Endpoint
 @api_router.post("/webhook/stripe")
 async def stripe_webhook(request: Request):
-    """Handle Stripe webhooks"""
+    """Handle Stripe webhooks: verify, log once per event id, acknowledge"""
     
-    # Get Stripe API key
-    stripe_api_key = os.environ.get('STRIPE_API_KEY')
-    if not stripe_api_key:
-        raise HTTPException(status_code=500, detail="Payment system not configured")
-    
-    # Initialize Stripe checkout
-    stripe_checkout = StripeCheckout(api_key=stripe_api_key, webhook_url="")
+    # Shared Stripe checkout client (500 if payments are not configured)
+    stripe_checkout = payment_client.checkout()
     
     try:
         # Get request body and signature
         body = await request.body()
         signature = request.headers.get("stripe-signature", "")
         
-        # Handle webhook
+        # Verify and parse the webhook
         webhook_response = await stripe_checkout.handle_webhook(body, signature)
-        
-        if webhook_response.event_type == "checkout.session.completed":
-            # Update payment status in database
-            await db.payment_transactions.update_one(
-                {"session_id": webhook_response.session_id},
-                {
-                    "$set": {
-                        "payment_status": webhook_response.payment_status,
-                        "updated_at": datetime.now(timezone.utc)
-                    }
-                }
-            )
-            
-            logger.info(f"Webhook processed: {webhook_response.event_type} for session {webhook_response.session_id}")
-        
-        return {"status": "success"}
-        
+        event = json.loads(body)
     except Exception as e:
         logger.error(f"Error processing webhook: {e}")
         raise HTTPException(status_code=400, detail="Webhook processing failed")
+    
+    # Without an id, retries could not be told apart from new events
+    event_id = event.get("id") or getattr(webhook_response, "event_id", None)
+    if not event_id:
+        raise HTTPException(status_code=400, detail="Webhook event has no id")
+    
+    now = datetime.now(timezone.utc)
+    try:
+        await db.payment_events.insert_one({
+            "event_id": event_id,
+            "event_type": webhook_response.event_type,
+            "session_id": webhook_response.session_id,
+            "payment_status": webhook_response.payment_status,
+            # Provider timestamp, so the consumer applies events in the order Stripe emitted them
+            "created": datetime.fromtimestamp(event.get("created", now.timestamp()), timezone.utc),
+            "raw": body.decode("utf-8", errors="replace"),
+            "status": "pending",
+            "attempts": 0,
+            "received_at": now,
+            "next_attempt_at": now
+        })
+    except DuplicateKeyError:
+        # Provider retry of an event we already have
+        return {"status": "success", "duplicate": True}
+    
+    webhook_consumer.notify()
+    return {"status": "success"}
 
 # Include the router in the main app
 app.include_router(api_router)
@@ -645,6 +4682,7 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Configure logging
@@ -654,6 +4692,95 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def create_indexes():
+    await ensure_indexes()
+
+@app.on_event("startup")
+async def start_media_pipeline():
+    # Resumes any item left in "processing" by a previous run via the rescan
+    media_pipeline.start()
+
+@app.on_event("startup")
+async def start_upload_gc():
+    app.state.upload_gc_task = asyncio.create_task(collect_abandoned_uploads())
+
+@app.on_event("shutdown")
+async def stop_upload_gc():
+    app.state.upload_gc_task.cancel()
+
+@app.on_event("shutdown")
+async def stop_media_pipeline():
+    await media_pipeline.stop()
+
+@app.on_event("startup")
+async def start_payment_client():
+    payment_client.start()
+
+@app.on_event("startup")
+async def start_webhook_consumer():
+    # Also drains anything logged but not applied before a restart
+    webhook_consumer.start()
+
+@app.on_event("shutdown")
+async def stop_webhook_consumer():
+    await webhook_consumer.stop()
+
+@app.on_event("shutdown")
+async def close_payment_client():
+    payment_client.close()
+
+@app.on_event("startup")
+async def start_cache_invalidation_listener():
+    app.state.cache_listener_task = asyncio.create_task(listen_for_invalidations())
+
+@app.on_event("shutdown")
+async def close_cache_backend():
+    app.state.cache_listener_task.cancel()
+    await cache_backend.close()
+
+@app.on_event("startup")
+async def start_content_stats_initialization():
+    app.state.content_stats_task = asyncio.create_task(initialize_content_stats())
+
+@app.on_event("startup")
+async def start_search_backfill():
+    app.state.search_backfill_task = asyncio.create_task(backfill_search_suggestions())
+
+@app.on_event("startup")
+async def start_engagement_counters():
+    engagement_counters.start()
+
+@app.on_event("shutdown")
+async def flush_engagement_counters():
+    # Writes out everything counted since the last interval
+    await engagement_counters.stop()
+
+@app.on_event("startup")
+async def start_transcode_pipeline():
+    # Also resumes ladders left "pending" or abandoned by a dead worker
+    transcode_pipeline.start()
+
+@app.on_event("shutdown")
+async def stop_transcode_pipeline():
+    await transcode_pipeline.stop()
+
+@app.on_event("startup")
+async def start_media_cache():
+    media_cache.start()
+
+@app.on_event("shutdown")
+async def stop_media_cache():
+    await media_cache.stop()
+
+@app.on_event("startup")
+async def start_live_hub():
+    live_hub.start()
+
+@app.on_event("shutdown")
+async def stop_live_hub():
+    await live_hub.stop()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     client.close()
\ No newline at end of file
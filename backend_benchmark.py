@@ -0,0 +1,666 @@
+import requests
+import sys
+import asyncio
+import os
+import pymongo
+import time
+import uuid
+import argparse
+import threading
+import json
+import statistics
+import random
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from concurrent.futures import ThreadPoolExecutor
+
+MB = 1024 * 1024
+GB = 1024 * MB
+
+SEARCH_VOCABULARY = [
+    "beach", "sunset", "studio", "portrait", "fashion", "runway", "fitness", "yoga", "travel", "city",
+    "night", "neon", "summer", "winter", "autumn", "spring", "golden", "hour", "backstage", "editorial",
+    "vintage", "street", "urban", "nature", "forest", "ocean", "desert", "mountain", "dance", "music",
+    "concert", "festival", "behind", "scenes", "interview", "tutorial", "makeup", "hair", "styling", "shoot",
+    "cinematic", "slow", "motion", "drone", "aerial", "closeup", "lifestyle", "morning", "routine", "vlog"
+] + [f"term{index}" for index in range(5000)]
+SEARCH_TAGS = ["fashion", "fitness", "travel", "music", "beauty", "lifestyle", "art", "sports", "food", "tech"]
+
+class StubStripeHandler(BaseHTTPRequestHandler):
+    """Minimal stand-in for the Stripe checkout API with keep-alive"""
+    protocol_version = "HTTP/1.1"
+    latency = 0.02  # simulated provider processing time
+
+    def send_json(self, payload):
+        body = json.dumps(payload).encode()
+        time.sleep(self.latency)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def checkout_session(self, session_id):
+        return {
+            "id": session_id,
+            "object": "checkout.session",
+            "url": f"https://checkout.stripe.test/pay/{session_id}",
+            "status": "open",
+            "payment_status": "unpaid",
+            "amount_total": 999,
+            "currency": "usd",
+            "metadata": {}
+        }
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_json(self.checkout_session(f"cs_test_{uuid.uuid4().hex}"))
+
+    def do_GET(self):
+        self.send_json(self.checkout_session(self.path.rstrip("/").split("/")[-1]))
+
+    def log_message(self, *args):
+        pass
+
+class GizzleTVBenchmark:
+    def __init__(self, base_url="http://localhost:8001/api", server_pid=None, stripe_stub_port=None):
+        self.base_url = base_url
+        self.server_pid = server_pid
+        self.stripe_stub_port = stripe_stub_port
+        self.results = []
+
+    def log_result(self, name, **measurements):
+        """Log benchmark results"""
+        details = ", ".join(f"{key}: {value}" for key, value in measurements.items())
+        print(f"⏱️  {name} - {details}")
+        self.results.append({"name": name, **measurements})
+
+    def server_rss_mb(self):
+        """Resident memory of the API process (needs --pid and a local server)"""
+        if not self.server_pid:
+            return None
+        try:
+            with open(f"/proc/{self.server_pid}/status") as status:
+                for line in status:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            return None
+        return None
+
+    def sample_peak_rss(self, stop_event, peak):
+        """Poll server RSS until stop_event is set, keeping the maximum"""
+        while not stop_event.is_set():
+            rss = self.server_rss_mb()
+            if rss is not None:
+                peak[0] = max(peak[0], rss)
+            time.sleep(0.05)
+
+    def multipart_body(self, size, category="videos", content_type="video/mp4", chunk_size=MB):
+        """Generate a multipart upload body without holding the payload in memory"""
+        boundary = uuid.uuid4().hex
+        filename = f"benchmark_{size // MB}MB.mp4"
+
+        def body():
+            yield (
+                f"--{boundary}\r\n"
+                f'Content-Disposition: form-data; name="category"\r\n\r\n{category}\r\n'
+                f"--{boundary}\r\n"
+                f'Content-Disposition: form-data; name="tags"\r\n\r\nbenchmark\r\n'
+                f"--{boundary}\r\n"
+                f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+                f"Content-Type: {content_type}\r\n\r\n"
+            ).encode()
+            block = b"\0" * chunk_size
+            remaining = size
+            while remaining > 0:
+                yield block[:min(chunk_size, remaining)]
+                remaining -= chunk_size
+            yield f"\r\n--{boundary}--\r\n".encode()
+
+        return body(), f"multipart/form-data; boundary={boundary}"
+
+    def benchmark_upload(self, sizes=(100 * MB, 1 * GB, 5 * GB)):
+        """Time streaming uploads and track peak server memory per file size"""
+        for size in sizes:
+            body, content_type = self.multipart_body(size)
+            baseline = self.server_rss_mb()
+            stop_event = threading.Event()
+            peak = [baseline or 0]
+            sampler = threading.Thread(target=self.sample_peak_rss, args=(stop_event, peak), daemon=True)
+            sampler.start()
+
+            start = time.perf_counter()
+            try:
+                response = requests.post(
+                    f"{self.base_url}/content/upload",
+                    data=body,
+                    headers={"Content-Type": content_type},
+                    timeout=3600
+                )
+                status = response.status_code
+            except Exception as e:
+                status = f"error ({e})"
+            elapsed = time.perf_counter() - start
+
+            stop_event.set()
+            sampler.join()
+
+            measurements = {
+                "status": status,
+                "seconds": round(elapsed, 2),
+                "MB/s": round(size / MB / elapsed, 1) if elapsed else 0
+            }
+            if baseline is not None:
+                measurements["peak_rss_growth_MB"] = round(peak[0] - baseline, 1)
+            self.log_result(f"Upload {size // MB}MB", **measurements)
+
+    def upload_benchmark_video(self, size):
+        """Upload a generated video and return its GridFS file id"""
+        body, content_type = self.multipart_body(size)
+        response = requests.post(
+            f"{self.base_url}/content/upload",
+            data=body,
+            headers={"Content-Type": content_type},
+            timeout=3600
+        )
+        content_id = response.json().get("content_id")
+        items = requests.get(f"{self.base_url}/content/videos", timeout=30).json()
+        return next((item["filename"] for item in items if item["id"] == content_id), None)
+
+    def stream_video(self, file_id):
+        """Stream a whole file like a viewer would, return bytes received"""
+        received = 0
+        with requests.get(f"{self.base_url}/content/file/{file_id}", stream=True, timeout=3600) as response:
+            for chunk in response.iter_content(chunk_size=256 * 1024):
+                received += len(chunk)
+        return received
+
+    def benchmark_concurrent_viewers(self, viewers=200, size=1 * GB):
+        """Stream one large video to many viewers at once and track server memory"""
+        file_id = self.upload_benchmark_video(size)
+        if not file_id:
+            self.log_result(f"{viewers} Concurrent Viewers", status="upload failed")
+            return
+
+        baseline = self.server_rss_mb()
+        stop_event = threading.Event()
+        peak = [baseline or 0]
+        sampler = threading.Thread(target=self.sample_peak_rss, args=(stop_event, peak), daemon=True)
+        sampler.start()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=viewers) as pool:
+            received = list(pool.map(lambda _: self.stream_video(file_id), range(viewers)))
+        elapsed = time.perf_counter() - start
+
+        stop_event.set()
+        sampler.join()
+
+        measurements = {
+            "complete_streams": sum(1 for total in received if total == size),
+            "seconds": round(elapsed, 2),
+            "aggregate_MB/s": round(sum(received) / MB / elapsed, 1) if elapsed else 0
+        }
+        if baseline is not None:
+            measurements["peak_rss_growth_MB"] = round(peak[0] - baseline, 1)
+        self.log_result(f"{viewers} Concurrent Viewers ({size // MB}MB)", **measurements)
+
+    def resumable_upload(self, size, parallelism):
+        """Upload a generated video through the resumable API with N chunks in flight"""
+        session = requests.post(f"{self.base_url}/uploads", json={
+            "filename": f"resumable_{size // MB}MB.mp4",
+            "content_type": "video/mp4",
+            "category": "videos",
+            "total_size": size,
+            "tags": ["benchmark"]
+        }, timeout=30).json()
+        upload_id, chunk_size = session["upload_id"], session["chunk_size"]
+
+        def put_chunk(index):
+            length = min(chunk_size, size - index * chunk_size)
+            response = requests.put(
+                f"{self.base_url}/uploads/{upload_id}/chunks/{index}",
+                data=b"\0" * length,
+                timeout=600
+            )
+            return response.status_code
+
+        with ThreadPoolExecutor(max_workers=parallelism) as pool:
+            statuses = list(pool.map(put_chunk, range(session["total_chunks"])))
+        response = requests.post(f"{self.base_url}/uploads/{upload_id}/complete", timeout=60)
+        return response.status_code if all(status == 200 for status in statuses) else max(statuses)
+
+    def benchmark_resumable_upload(self, size=1 * GB, parallelism_levels=(1, 4, 8)):
+        """Compare resumable upload throughput for different chunk parallelism"""
+        for parallelism in parallelism_levels:
+            start = time.perf_counter()
+            try:
+                status = self.resumable_upload(size, parallelism)
+            except Exception as e:
+                status = f"error ({e})"
+            elapsed = time.perf_counter() - start
+            self.log_result(
+                f"Resumable Upload {size // MB}MB x{parallelism}",
+                status=status,
+                seconds=round(elapsed, 2),
+                **{"MB/s": round(size / MB / elapsed, 1) if elapsed else 0}
+            )
+
+    def benchmark_checkout_latency(self, requests_count=200, stub_port=None):
+        """Checkout creation latency against a local Stripe stand-in.
+        
+        Start the API with STRIPE_API_BASE=http://localhost:<stub_port> so its
+        Stripe calls land on the stub; run before and after a change to compare.
+        """
+        stub = None
+        if stub_port:
+            stub = ThreadingHTTPServer(("0.0.0.0", stub_port), StubStripeHandler)
+            threading.Thread(target=stub.serve_forever, daemon=True).start()
+
+        latencies = []
+        failures = 0
+        for _ in range(requests_count):
+            start = time.perf_counter()
+            response = requests.post(f"{self.base_url}/subscriptions/checkout", params={"plan_id": "basic"}, timeout=30)
+            latencies.append((time.perf_counter() - start) * 1000)
+            failures += response.status_code != 200
+
+        if stub:
+            stub.shutdown()
+
+        latencies.sort()
+        self.log_result(
+            f"Checkout Latency x{requests_count}",
+            failures=failures,
+            median_ms=round(statistics.median(latencies), 1),
+            p95_ms=round(latencies[int(len(latencies) * 0.95) - 1], 1)
+        )
+
+    def benchmark_view_counting(self, views=5000, concurrency=32):
+        """Profile views through the write-behind counters vs a naive $inc per view.
+        
+        Needs MONGO_URL/DB_NAME of the API's database to read the counter
+        back and to replay the same views as per-request increments.
+        """
+        suffix = uuid.uuid4().hex[:8]
+        model_id = requests.post(f"{self.base_url}/models", json={
+            "name": "Benchmark Model",
+            "username": f"bench_{suffix}",
+            "category": "benchmark"
+        }, timeout=30).json()["id"]
+        mongo = pymongo.MongoClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+        profiles = mongo[os.environ.get("DB_NAME", "test_database")].model_profiles
+        counters_before = requests.get(f"{self.base_url}/health/counters", timeout=30).json()
+
+        def view(_):
+            return requests.get(f"{self.base_url}/models/{model_id}", timeout=30).status_code
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            statuses = list(pool.map(view, range(views)))
+        elapsed = time.perf_counter() - start
+
+        # Time until the buffered views are all in Mongo
+        flush_start = time.perf_counter()
+        while profiles.find_one({"id": model_id})["total_views"] < views and time.perf_counter() - flush_start < 60:
+            time.sleep(0.1)
+        flush_lag = time.perf_counter() - flush_start
+        counters_after = requests.get(f"{self.base_url}/health/counters", timeout=30).json()
+
+        self.log_result(
+            f"Write-behind Views x{views}",
+            failures=sum(1 for status in statuses if status != 200),
+            **{"views/s": round(views / elapsed, 1)},
+            counted=profiles.find_one({"id": model_id})["total_views"],
+            mongo_writes=counters_after["documents_updated"] - counters_before["documents_updated"],
+            flush_lag_s=round(flush_lag, 2)
+        )
+
+        # The same views as one $inc each, which is what a per-request update costs Mongo
+        profiles.update_one({"id": model_id}, {"$set": {"total_views": 0}})
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(lambda _: profiles.update_one({"id": model_id}, {"$inc": {"total_views": 1}}), range(views)))
+        elapsed = time.perf_counter() - start
+        self.log_result(
+            f"Naive $inc Views x{views}",
+            **{"increments/s": round(views / elapsed, 1)},
+            counted=profiles.find_one({"id": model_id})["total_views"],
+            mongo_writes=views
+        )
+        mongo.close()
+
+    def latency_summary(self, call, samples):
+        latencies = []
+        for _ in range(samples):
+            start = time.perf_counter()
+            call()
+            latencies.append((time.perf_counter() - start) * 1000)
+        latencies.sort()
+        return round(statistics.median(latencies), 1), round(latencies[max(0, int(len(latencies) * 0.95) - 1)], 1)
+
+    def generate_search_corpus(self, database, run_tag, size, batch_size=10000):
+        """Insert `size` synthetic content items and their suggestion terms straight into Mongo"""
+        rng = random.Random(42)
+        now = datetime.now(timezone.utc)
+        term_counts = {}
+        for offset in range(0, size, batch_size):
+            batch = []
+            for index in range(offset, min(offset + batch_size, size)):
+                # Zipf-like word choice so some terms are common and most are rare
+                words = [SEARCH_VOCABULARY[min(int(rng.paretovariate(1.2)) - 1, len(SEARCH_VOCABULARY) - 1)] for _ in range(8)]
+                tags = rng.sample(SEARCH_TAGS, 2) + [run_tag]
+                item = {
+                    "id": str(uuid.uuid4()),
+                    "filename": f"{index:024x}",
+                    "original_filename": f"{words[0]}_{words[1]}_{index}.mp4",
+                    "content_type": "video/mp4",
+                    "file_size": 0,
+                    "category": rng.choice(["videos", "pictures"]),
+                    "upload_timestamp": now - timedelta(seconds=index),
+                    "tags": tags,
+                    "description": " ".join(words[2:]),
+                    "processing_status": "completed"
+                }
+                batch.append(item)
+                for term in set(words) | set(tags):
+                    term_counts[term] = term_counts.get(term, 0) + 1
+            database.content_items.insert_many(batch, ordered=False)
+        database.search_suggestions.bulk_write([
+            pymongo.UpdateOne(
+                {"_id": f"content:{term}"},
+                {"$inc": {"count": count}, "$setOnInsert": {"kind": "content", "term": term}},
+                upsert=True
+            )
+            for term, count in term_counts.items()
+        ], ordered=False)
+        return term_counts
+
+    def remove_search_corpus(self, database, run_tag, term_counts):
+        database.content_items.delete_many({"tags": run_tag})
+        database.search_suggestions.bulk_write([
+            pymongo.UpdateOne({"_id": f"content:{term}"}, {"$inc": {"count": -count}})
+            for term, count in term_counts.items()
+        ], ordered=False)
+        database.search_suggestions.delete_many({"kind": "content", "count": {"$lte": 0}})
+
+    def benchmark_search(self, corpus_size=1_000_000, samples=30, p95_target_ms=300):
+        """Search and autocomplete latency on a generated corpus of `corpus_size` items.
+        
+        Writes the corpus into the API's database (MONGO_URL/DB_NAME) tagged
+        with a run id, and removes it again afterwards.
+        """
+        mongo = pymongo.MongoClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+        database = mongo[os.environ.get("DB_NAME", "test_database")]
+        run_tag = f"benchcorpus{uuid.uuid4().hex[:8]}"
+
+        start = time.perf_counter()
+        term_counts = self.generate_search_corpus(database, run_tag, corpus_size)
+        self.log_result(f"Search Corpus x{corpus_size}", seconds=round(time.perf_counter() - start, 1))
+
+        def search(**params):
+            def call():
+                response = requests.get(f"{self.base_url}/search", params=params, timeout=60)
+                response.raise_for_status()
+                return response.json()
+            return call
+
+        second_page_cursor = search(q="sunset", limit=20)()["next_cursor"]
+        cases = {
+            "common word": search(q="beach"),
+            "two words": search(q="golden hour"),
+            "rare word": search(q="term4321"),
+            "word + tag filter": search(q="studio", tags="fitness"),
+            "second page": search(q="sunset", cursor=second_page_cursor),
+            "autocomplete (2 chars)": lambda: requests.get(f"{self.base_url}/search/suggest", params={"q": "be"}, timeout=60),
+            "autocomplete (5 chars)": lambda: requests.get(f"{self.base_url}/search/suggest", params={"q": "golden te"}, timeout=60)
+        }
+        try:
+            for name, call in cases.items():
+                median_ms, p95_ms = self.latency_summary(call, samples)
+                self.log_result(
+                    f"Search {name}",
+                    median_ms=median_ms,
+                    p95_ms=p95_ms,
+                    within_target=p95_ms <= p95_target_ms
+                )
+        finally:
+            self.remove_search_corpus(database, run_tag, term_counts)
+            mongo.close()
+
+    def live_producer(self, stream_id, stream_key, segments, segment_seconds, segment_size, pushed_at):
+        """Push synthetic MPEG-TS sized segments in real time, recording when each landed"""
+        payload = b"\x47" + b"\0" * 187  # one TS packet, repeated
+        data = payload * (segment_size // len(payload))
+        next_push = time.perf_counter()
+        for sequence in range(segments):
+            response = requests.put(
+                f"{self.base_url}/live/{stream_id}/segments/{sequence}",
+                params={"duration": segment_seconds},
+                data=data,
+                headers={"X-Stream-Key": stream_key},
+                timeout=30
+            )
+            response.raise_for_status()
+            pushed_at[sequence] = time.perf_counter()
+            next_push += segment_seconds
+            time.sleep(max(0, next_push - time.perf_counter()))
+        requests.post(f"{self.base_url}/live/{stream_id}/end", headers={"X-Stream-Key": stream_key}, timeout=60)
+
+    def live_viewer(self, stream_id, pushed_at):
+        """Follow a live playlist with blocking reloads; return per-segment delivery delays and errors"""
+        delays, errors, next_sequence = [], 0, None
+        session = requests.Session()
+        while True:
+            params = {"_HLS_msn": next_sequence} if next_sequence is not None else {}
+            try:
+                playlist = session.get(f"{self.base_url}/live/{stream_id}/playlist.m3u8", params=params, timeout=30).text
+            except requests.RequestException:
+                errors += 1
+                continue
+            listed = [int(line.split("/")[1].split(".")[0]) for line in playlist.splitlines() if line.startswith("segments/")]
+            if not listed and "#EXT-X-ENDLIST" not in playlist:
+                # Not started yet; blocking reloads only work once it has
+                time.sleep(0.1)
+            for sequence in listed:
+                if next_sequence is not None and sequence < next_sequence:
+                    continue
+                response = session.get(f"{self.base_url}/live/{stream_id}/segments/{sequence}.ts", timeout=30)
+                if response.status_code != 200:
+                    errors += 1
+                elif sequence in pushed_at:
+                    delays.append((time.perf_counter() - pushed_at[sequence]) * 1000)
+                next_sequence = sequence + 1
+            if "#EXT-X-ENDLIST" in playlist:
+                session.close()
+                return delays, errors
+
+    def benchmark_live_streaming(self, viewers=200, segments=30, segment_seconds=1.0, segment_size=256 * 1024):
+        """One synthetic live stream watched by many concurrent viewers"""
+        stream = requests.post(f"{self.base_url}/live", json={"title": "Benchmark Stream"}, timeout=30).json()
+        pushed_at = {}
+        baseline = self.server_rss_mb()
+        stop_event = threading.Event()
+        peak = [baseline or 0]
+        sampler = threading.Thread(target=self.sample_peak_rss, args=(stop_event, peak), daemon=True)
+        sampler.start()
+
+        producer = threading.Thread(
+            target=self.live_producer,
+            args=(stream["id"], stream["stream_key"], segments, segment_seconds, segment_size, pushed_at)
+        )
+        start = time.perf_counter()
+        producer.start()
+        with ThreadPoolExecutor(max_workers=viewers) as pool:
+            results = list(pool.map(lambda _: self.live_viewer(stream["id"], pushed_at), range(viewers)))
+        producer.join()
+        elapsed = time.perf_counter() - start
+        stop_event.set()
+        sampler.join()
+
+        delays = sorted(delay for viewer_delays, _ in results for delay in viewer_delays)
+        measurements = {
+            "segments_delivered": len(delays),
+            "expected": viewers * segments,
+            "errors": sum(errors for _, errors in results),
+            "median_delivery_ms": round(statistics.median(delays), 1) if delays else None,
+            "p95_delivery_ms": round(delays[max(0, int(len(delays) * 0.95) - 1)], 1) if delays else None,
+            "seconds": round(elapsed, 1)
+        }
+        if baseline is not None:
+            measurements["peak_rss_growth_MB"] = round(peak[0] - baseline, 1)
+        self.log_result(f"Live Stream x{viewers} Viewers", **measurements)
+
+    def benchmark_hot_media_cache(self, objects=50, size=8 * MB, requests_count=2000, concurrency=32, skew=1.1):
+        """Zipf-distributed downloads of many videos, measuring how much still reads storage.
+        
+        Without the hot media cache every byte served is a byte read from
+        storage (GridFS by default), so storage_read_ratio shows the share
+        of those reads left.
+        Needs MONGO_URL to sample Mongo's operation counters.
+        """
+        file_ids = [self.upload_benchmark_video(size) for _ in range(objects)]
+        file_ids = [file_id for file_id in file_ids if file_id]
+        weights = [1 / (rank ** skew) for rank in range(1, len(file_ids) + 1)]
+        picks = random.choices(file_ids, weights=weights, k=requests_count)
+
+        mongo = pymongo.MongoClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+
+        def mongo_reads():
+            counters = mongo.admin.command("serverStatus")["opcounters"]
+            return counters["query"] + counters["getmore"]
+
+        def download(file_id):
+            start = time.perf_counter()
+            received = self.stream_video(file_id)
+            return received, (time.perf_counter() - start) * 1000
+
+        cache_before = requests.get(f"{self.base_url}/health/media-cache", timeout=30).json()
+        reads_before = mongo_reads()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(download, picks))
+        elapsed = time.perf_counter() - start
+        reads_after = mongo_reads()
+        cache_after = requests.get(f"{self.base_url}/health/media-cache", timeout=30).json()
+        mongo.close()
+
+        served = sum(received for received, _ in results)
+        latencies = sorted(latency for _, latency in results)
+        storage_read = cache_after["storage_bytes_read"] - cache_before["storage_bytes_read"]
+        self.log_result(
+            f"Hot Media Cache x{requests_count} (Zipf {skew}, {len(file_ids)} x {size // MB}MB)",
+            complete_downloads=sum(1 for received, _ in results if received == size),
+            **{"aggregate_MB/s": round(served / MB / elapsed, 1) if elapsed else 0},
+            p50_ms=round(latencies[len(latencies) // 2], 1),
+            p95_ms=round(latencies[int(len(latencies) * 0.95) - 1], 1),
+            storage_read_ratio=round(storage_read / served, 3) if served else None,
+            mongo_reads_per_download=round((reads_after - reads_before) / requests_count, 1),
+            memory_hits=cache_after["memory"]["hits"] - cache_before["memory"]["hits"],
+            disk_hits=cache_after["disk"]["hits"] - cache_before["disk"]["hits"],
+            disk_fills=cache_after["disk"]["fills"] - cache_before["disk"]["fills"]
+        )
+
+    def benchmark_storage_backends(self, size=256 * MB, range_reads=200, range_size=MB):
+        """Write, read and random range-read throughput of each storage backend.
+        
+        Runs the backends in process through the API module, so it needs the
+        API's environment (MONGO_URL, DB_NAME, STORAGE_* settings). S3 is only
+        measured when STORAGE_S3_BUCKET is set, e.g. against a local MinIO.
+        """
+        sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+        import server
+        from bson import ObjectId
+
+        names = ["gridfs", "local"] + (["s3"] if os.environ.get("STORAGE_S3_BUCKET") else [])
+        block = os.urandom(MB)
+
+        async def body():
+            for _ in range(size // MB):
+                yield block
+
+        async def read_range(backend, document, start, end):
+            handle = await backend.open(document)
+            async for _ in server.iter_grid_range(handle, start, end):
+                pass
+
+        async def measure(name):
+            backend = server.get_storage_backend(name)
+            file_id = ObjectId()
+            start = time.perf_counter()
+            await backend.write(file_id, body())
+            write_seconds = time.perf_counter() - start
+            document = {
+                "_id": file_id,
+                "length": size // MB * MB,
+                "chunkSize": server.GRIDFS_CHUNK_SIZE,
+                "uploadDate": datetime.now(timezone.utc),
+                "filename": "storage_benchmark.bin"
+            }
+            try:
+                start = time.perf_counter()
+                await read_range(backend, document, 0, document["length"] - 1)
+                read_seconds = time.perf_counter() - start
+
+                latencies = []
+                for _ in range(range_reads):
+                    offset = random.randrange(0, document["length"] - range_size)
+                    start = time.perf_counter()
+                    await read_range(backend, document, offset, offset + range_size - 1)
+                    latencies.append((time.perf_counter() - start) * 1000)
+            finally:
+                await backend.delete(file_id)
+
+            latencies.sort()
+            self.log_result(
+                f"Storage Backend {name} ({size // MB}MB)",
+                **{
+                    "write_MB/s": round(document["length"] / MB / write_seconds, 1),
+                    "read_MB/s": round(document["length"] / MB / read_seconds, 1)
+                },
+                range_p50_ms=round(latencies[len(latencies) // 2], 1),
+                range_p95_ms=round(latencies[int(len(latencies) * 0.95) - 1], 1)
+            )
+
+        async def run():
+            try:
+                for name in names:
+                    await measure(name)
+            finally:
+                server.client.close()
+
+        asyncio.run(run())
+
+    def run_all_benchmarks(self):
+        """Run all backend benchmarks"""
+        print("🚀 Starting Gizzle TV L.L.C. Backend Benchmarks")
+        print(f"Benchmarking against: {self.base_url}")
+        print("=" * 60)
+
+        self.benchmark_upload()
+        self.benchmark_concurrent_viewers()
+        self.benchmark_hot_media_cache()
+        self.benchmark_resumable_upload()
+        self.benchmark_checkout_latency(stub_port=self.stripe_stub_port)
+        self.benchmark_view_counting()
+        self.benchmark_search()
+        self.benchmark_live_streaming()
+        self.benchmark_storage_backends()
+
+        print("\n" + "=" * 60)
+        print(f"📊 Benchmarks run: {len(self.results)}")
+        return 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Gizzle TV backend benchmarks")
+    parser.add_argument("--base-url", default="http://localhost:8001/api")
+    parser.add_argument("--pid", type=int, default=None, help="PID of a local API server for memory sampling")
+    parser.add_argument("--stripe-stub-port", type=int, default=None, help="Serve a Stripe stand-in on this port")
+    args = parser.parse_args()
+
+    benchmark = GizzleTVBenchmark(base_url=args.base_url, server_pid=args.pid, stripe_stub_port=args.stripe_stub_port)
+    return benchmark.run_all_benchmarks()
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,14 +1,192 @@
 import requests
 import sys
+import os
+import pymongo
 import json
 import io
+import hashlib
+import hmac
+import random
+import uuid
+import time
+import statistics
+import socketserver
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from http.server import ThreadingHTTPServer
+
+from backend_benchmark import StubStripeHandler
+
+class StubRedisHandler(socketserver.StreamRequestHandler):
+    """One client connection to the Redis stand-in"""
+
+    def setup(self):
+        super().setup()
+        self.write_lock = threading.Lock()
+        self.channels = set()
+
+    def read_command(self):
+        header = self.rfile.readline()
+        if not header:
+            return None
+        if not header.startswith(b"*"):
+            return header.decode().split()
+        args = []
+        for _ in range(int(header[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2].decode())
+        return args
+
+    def encode(self, value):
+        if value is None:
+            return b"$-1\r\n"
+        if isinstance(value, bool):
+            return b"+OK\r\n" if value else b"$-1\r\n"
+        if isinstance(value, int):
+            return f":{value}\r\n".encode()
+        if isinstance(value, (list, tuple, set)):
+            return f"*{len(value)}\r\n".encode() + b"".join(self.encode(item) for item in value)
+        if isinstance(value, Exception):
+            return f"-ERR {value}\r\n".encode()
+        data = str(value).encode()
+        return f"${len(data)}\r\n".encode() + data + b"\r\n"
+
+    def send(self, value):
+        with self.write_lock:
+            self.wfile.write(self.encode(value))
+            self.wfile.flush()
+
+    def handle(self):
+        try:
+            while True:
+                command = self.read_command()
+                if command is None:
+                    break
+                if command:
+                    self.send(self.server.execute(self, command[0].upper(), command[1:]))
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            self.server.unsubscribe(self, list(self.channels))
+
+class StubRedisServer(socketserver.ThreadingTCPServer):
+    """In-memory stand-in for the Redis commands the API's shared cache uses.
+
+    Start the API with CACHE_BACKEND_URL=redis://localhost:<port> to run it
+    against this instead of a real Redis.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port):
+        super().__init__(("0.0.0.0", port), StubRedisHandler)
+        self.lock = threading.Lock()
+        self.values = {}
+        self.sets = {}
+        self.subscribers = {}
+
+    def live_value(self, key):
+        entry = self.values.get(key)
+        if entry and entry[0] is not None and entry[0] <= time.monotonic():
+            del self.values[key]
+            return None
+        return entry[1] if entry else None
+
+    def unsubscribe(self, connection, channels):
+        with self.lock:
+            for channel in channels:
+                self.subscribers.get(channel, set()).discard(connection)
+                connection.channels.discard(channel)
+
+    def execute(self, connection, name, args):
+        with self.lock:
+            if name == "PING":
+                return True
+            if name in ("CLIENT", "SELECT"):
+                return True
+            if name == "GET":
+                return self.live_value(args[0])
+            if name == "SET":
+                key, value, options = args[0], args[1], [option.upper() for option in args[2:]]
+                if "NX" in options and self.live_value(key) is not None:
+                    return None
+                expires_at = None
+                if "PX" in options:
+                    expires_at = time.monotonic() + int(args[2 + options.index("PX") + 1]) / 1000
+                elif "EX" in options:
+                    expires_at = time.monotonic() + int(args[2 + options.index("EX") + 1])
+                self.values[key] = (expires_at, value)
+                return True
+            if name == "DEL":
+                return sum(1 for key in args if self.values.pop(key, None) is not None or self.sets.pop(key, None) is not None)
+            if name in ("INCR", "INCRBY"):
+                value = int(self.live_value(args[0]) or 0) + int(args[1] if len(args) > 1 else 1)
+                self.values[args[0]] = (None, str(value))
+                return value
+            if name == "SADD":
+                members = self.sets.setdefault(args[0], set())
+                added = len(set(args[1:]) - members)
+                members.update(args[1:])
+                return added
+            if name == "SMEMBERS":
+                return list(self.sets.get(args[0], ()))
+            if name == "SREM":
+                members = self.sets.get(args[0], set())
+                removed = len(members & set(args[1:]))
+                members.difference_update(args[1:])
+                return removed
+            if name == "PUBLISH":
+                receivers = list(self.subscribers.get(args[0], ()))
+            elif name == "SUBSCRIBE":
+                for channel in args:
+                    self.subscribers.setdefault(channel, set()).add(connection)
+                    connection.channels.add(channel)
+                return ["subscribe", args[-1], len(connection.channels)]
+            elif name == "UNSUBSCRIBE":
+                channels = args or list(connection.channels)
+                for channel in channels:
+                    self.subscribers.get(channel, set()).discard(connection)
+                    connection.channels.discard(channel)
+                return ["unsubscribe", channels[-1] if channels else None, len(connection.channels)]
+            else:
+                return Exception(f"unknown command '{name}'")
+        # Deliver outside the store lock
+        for receiver in receivers:
+            try:
+                receiver.send(["message", args[0], args[1]])
+            except OSError:
+                pass
+        return len(receivers)
+
+class CountingStripeHandler(StubStripeHandler):
+    """Stripe stand-in that counts checkout session reads and can mark sessions paid"""
+    latency = 0
+    reads = {}
+    paid = set()
+    lock = threading.Lock()
+
+    def checkout_session(self, session_id):
+        session = super().checkout_session(session_id)
+        if session_id in self.paid:
+            session.update(status="complete", payment_status="paid")
+        return session
+
+    def do_GET(self):
+        session_id = self.path.split("?")[0].rstrip("/").split("/")[-1]
+        with self.lock:
+            self.reads[session_id] = self.reads.get(session_id, 0) + 1
+        self.send_json(self.checkout_session(session_id))
 
 class GizzleTVAPITester:
-    def __init__(self, base_url="https://content-hub-228.preview.emergentagent.com/api"):
+    def __init__(self, base_url="https://content-hub-228.preview.emergentagent.com/api", redis_stub=None, stripe_stub=None):
         self.base_url = base_url
+        self.redis_stub = redis_stub
+        self.stripe_stub = stripe_stub
         self.tests_run = 0
         self.tests_passed = 0
+        self.tests_skipped = 0
         self.test_results = []
 
     def log_test(self, name, success, details=""):
@@ -26,6 +204,11 @@ class GizzleTVAPITester:
             "details": details
         })
 
+    def log_skip(self, name, reason):
+        """Log a test that could not run here; it counts as neither passed nor failed"""
+        self.tests_skipped += 1
+        print(f"⏭️  {name} - SKIPPED: {reason}")
+
     def test_health_check(self):
         """Test basic health endpoint"""
         try:
@@ -116,6 +299,285 @@ class GizzleTVAPITester:
             self.log_test("Community Members", False, str(e))
             return False
 
+    def test_member_uniqueness(self, attempts=10):
+        """Test that concurrent duplicate signups yield exactly one member"""
+        try:
+            suffix = datetime.now().strftime('%H%M%S%f')
+            payload = {
+                "username": f"race_{suffix}",
+                "email": f"race_{suffix}@example.com",
+                "display_name": "Race Test"
+            }
+            
+            def signup(_):
+                return requests.post(f"{self.base_url}/community/members", json=payload, timeout=10)
+            
+            with ThreadPoolExecutor(max_workers=attempts) as pool:
+                responses = list(pool.map(signup, range(attempts)))
+            
+            created = sum(1 for response in responses if response.status_code == 200)
+            rejected = [response for response in responses if response.status_code == 400]
+            success = created == 1 and len(rejected) == attempts - 1
+            details = f"Created: {created}, Rejected: {len(rejected)}"
+            
+            # Same email under another username must map to the email message
+            response = requests.post(
+                f"{self.base_url}/community/members",
+                json={**payload, "username": f"race_other_{suffix}"},
+                timeout=10
+            )
+            success = success and response.status_code == 400 and "Email" in response.json().get("detail", "")
+            details += f", Duplicate email: {response.status_code}"
+            
+            self.log_test("Member Uniqueness", success, details)
+            return success
+        except Exception as e:
+            self.log_test("Member Uniqueness", False, str(e))
+            return False
+
+    def test_model_cache(self, reads=20):
+        """Test that model reads are cached and writes invalidate them"""
+        try:
+            suffix = datetime.now().strftime('%H%M%S%f')
+            category = f"cache_{suffix}"
+            response = requests.post(f"{self.base_url}/models", json={
+                "name": "Cache Test",
+                "username": f"cache_{suffix}",
+                "category": category
+            }, timeout=10)
+            model_id = response.json()["id"]
+            
+            def list_verified():
+                return requests.get(
+                    f"{self.base_url}/models",
+                    params={"category": category, "verified": "true"},
+                    timeout=10
+                ).json()
+            
+            before = requests.get(f"{self.base_url}/health/cache", timeout=10).json()["model_profiles"]
+            for _ in range(reads):
+                list_verified()
+            after = requests.get(f"{self.base_url}/health/cache", timeout=10).json()["model_profiles"]
+            hits = after["hits"] - before["hits"]
+            success = hits >= reads - 1 and list_verified() == []
+            details = f"Hits: {hits}/{reads}"
+            
+            # Verifying must drop the cached list and the cached profile
+            requests.put(f"{self.base_url}/models/{model_id}/verify", timeout=10)
+            listed = [model["id"] for model in list_verified()]
+            profile = requests.get(f"{self.base_url}/models/{model_id}", timeout=10).json()
+            success = success and listed == [model_id] and profile.get("verification_status") == "verified"
+            details += f", Listed after verify: {len(listed)}, Status: {profile.get('verification_status')}"
+            
+            self.log_test("Model Cache", success, details)
+            return success
+        except Exception as e:
+            self.log_test("Model Cache", False, str(e))
+            return False
+
+    def test_shared_cache_consistency(self, reads=30):
+        """Test that a write is visible from every worker behind the load balancer"""
+        try:
+            suffix = datetime.now().strftime('%H%M%S%f')
+            response = requests.post(f"{self.base_url}/models", json={
+                "name": "Shared Cache Test",
+                "username": f"shared_{suffix}",
+                "category": f"shared_{suffix}"
+            }, timeout=10)
+            model_id = response.json()["id"]
+            
+            def read_status(_):
+                return requests.get(f"{self.base_url}/models/{model_id}", timeout=10).json().get("verification_status")
+            
+            # Warm the entry in as many workers as the requests reach
+            with ThreadPoolExecutor(max_workers=8) as pool:
+                list(pool.map(read_status, range(reads)))
+            requests.put(f"{self.base_url}/models/{model_id}/verify", timeout=10)
+            with ThreadPoolExecutor(max_workers=8) as pool:
+                statuses = list(pool.map(read_status, range(reads)))
+            
+            stale = sum(1 for status in statuses if status != "verified")
+            backend = requests.get(f"{self.base_url}/health/cache", timeout=10).json()["model_profiles"]["backend"]
+            success = stale == 0
+            details = f"Backend: {backend}, Stale reads after write: {stale}/{reads}"
+            
+            if self.redis_stub is not None:
+                stored = [key for key in self.redis_stub.values if ":model_profiles:" in key]
+                success = success and backend == "redis" and len(stored) > 0
+                details += f", Keys in stand-in: {len(stored)}"
+            
+            self.log_test("Shared Cache Consistency", success, details)
+            return success
+        except Exception as e:
+            self.log_test("Shared Cache Consistency", False, str(e))
+            return False
+
+    def test_engagement_counters(self, views=10, timeout=30):
+        """Test that profile views reach Mongo through the write-behind counters"""
+        try:
+            suffix = datetime.now().strftime('%H%M%S%f')
+            model_id = requests.post(f"{self.base_url}/models", json={
+                "name": "Counter Test",
+                "username": f"counter_{suffix}",
+                "category": "counters"
+            }, timeout=10).json()["id"]
+            
+            for _ in range(views):
+                requests.get(f"{self.base_url}/models/{model_id}", timeout=10)
+            
+            mongo = pymongo.MongoClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"), serverSelectionTimeoutMS=5000)
+            profiles = mongo[os.environ.get("DB_NAME", "test_database")].model_profiles
+            deadline = time.time() + timeout
+            total_views = 0
+            while time.time() < deadline:
+                total_views = profiles.find_one({"id": model_id})["total_views"]
+                if total_views >= views:
+                    break
+                time.sleep(0.5)
+            mongo.close()
+            
+            # Attribution to an unknown profile is rejected
+            response = requests.post(
+                f"{self.base_url}/content/upload",
+                files={"file": ("counter.png", b"\x89PNG\r\n\x1a\n", "image/png")},
+                data={"category": "pictures", "model_id": f"missing_{suffix}"},
+                timeout=30
+            )
+            
+            success = total_views == views and response.status_code == 400
+            details = f"Views flushed: {total_views}/{views}, Unknown model upload: {response.status_code}"
+            self.log_test("Engagement Counters", success, details)
+            return success
+        except Exception as e:
+            self.log_test("Engagement Counters", False, str(e))
+            return False
+
+    def test_search(self):
+        """Test full-text search, tag facets, pagination and autocomplete"""
+        try:
+            word = f"zebra{datetime.now().strftime('%H%M%S%f')}"
+            for index in range(3):
+                requests.post(f"{self.base_url}/models", json={
+                    "name": f"{word} Search {index}",
+                    "username": f"{word}_{index}",
+                    "category": "search",
+                    "bio": "Searchable test profile",
+                    "tags": ["searchtest", "even" if index % 2 == 0 else "odd"]
+                }, timeout=10)
+            
+            first = requests.get(f"{self.base_url}/search", params={"q": word, "kind": "models", "limit": 2}, timeout=10).json()
+            second = requests.get(
+                f"{self.base_url}/search",
+                params={"q": word, "kind": "models", "limit": 2, "cursor": first.get("next_cursor")},
+                timeout=10
+            ).json()
+            ids = [result["id"] for result in first["results"] + second["results"]]
+            tag_counts = {bucket["value"]: bucket["count"] for bucket in first["facets"]["tags"]}
+            filtered = requests.get(f"{self.base_url}/search", params={"q": word, "kind": "models", "tags": "odd"}, timeout=10).json()
+            suggestions = requests.get(f"{self.base_url}/search/suggest", params={"q": word[:-3], "kind": "models"}, timeout=10).json()
+            
+            success = (
+                first["total"] == 3
+                and len(set(ids)) == 3
+                and second["next_cursor"] is None
+                and tag_counts.get("even") == 2 and tag_counts.get("odd") == 1
+                and filtered["total"] == 1
+                and any(suggestion["term"] == word for suggestion in suggestions["suggestions"])
+            )
+            details = (
+                f"Total: {first['total']}, Paged ids: {len(set(ids))}, Tag facets: {tag_counts}, "
+                f"Filtered: {filtered['total']}, Suggestions: {[s['term'] for s in suggestions['suggestions']]}"
+            )
+            self.log_test("Search", success, details)
+            return success
+        except Exception as e:
+            self.log_test("Search", False, str(e))
+            return False
+
+    def test_content_stats(self):
+        """Test that content stats follow an upload without a rebuild"""
+        try:
+            def picture_stats():
+                stats = requests.get(f"{self.base_url}/stats/content", params={"top_tags": 100}, timeout=10).json()
+                return stats["categories"]["pictures"]
+            
+            before = picture_stats()
+            file_id, content = self.upload_test_image()
+            after = picture_stats()
+            
+            def tag_count(stats):
+                return next((tag["count"] for tag in stats["top_tags"] if tag["tag"] == "test"), 0)
+            
+            items_delta = after["items"] - before["items"]
+            bytes_delta = after["bytes"] - before["bytes"]
+            completed_delta = after["processing_status"].get("completed", 0) - before["processing_status"].get("completed", 0)
+            success = (
+                file_id is not None
+                and items_delta == 1
+                and bytes_delta == len(content)
+                and completed_delta == 1
+                and tag_count(after) == tag_count(before) + 1
+            )
+            details = f"Items +{items_delta}, Bytes +{bytes_delta}, Completed +{completed_delta}, Tag 'test': {tag_count(after)}"
+            self.log_test("Content Stats", success, details)
+            return success
+        except Exception as e:
+            self.log_test("Content Stats", False, str(e))
+            return False
+
+    def test_live_streaming(self):
+        """Test segment ingest, sliding playlist, blocking reload and replay after end"""
+        try:
+            stream = requests.post(f"{self.base_url}/live", json={"title": "Live Test", "tags": ["test"]}, timeout=10).json()
+            stream_id, key = stream["id"], stream["stream_key"]
+            segments = [os.urandom(188 * 100) for _ in range(4)]
+            
+            def push(sequence, stream_key=key):
+                return requests.put(
+                    f"{self.base_url}/live/{stream_id}/segments/{sequence}",
+                    params={"duration": 2.0},
+                    data=segments[sequence],
+                    headers={"X-Stream-Key": stream_key},
+                    timeout=10
+                )
+            
+            statuses = [push(sequence).status_code for sequence in range(3)]
+            wrong_key = push(3, stream_key="wrong").status_code
+            out_of_order = requests.put(
+                f"{self.base_url}/live/{stream_id}/segments/9",
+                params={"duration": 2.0}, data=b"x", headers={"X-Stream-Key": key}, timeout=10
+            ).status_code
+            playlist = requests.get(f"{self.base_url}/live/{stream_id}/playlist.m3u8", timeout=10).text
+            segment = requests.get(f"{self.base_url}/live/{stream_id}/segments/1.ts", timeout=10).content
+            
+            # A blocking reload for segment 3 returns once it is pushed
+            with ThreadPoolExecutor(max_workers=1) as pool:
+                waiting = pool.submit(
+                    requests.get, f"{self.base_url}/live/{stream_id}/playlist.m3u8", params={"_HLS_msn": 3}, timeout=30
+                )
+                time.sleep(0.5)
+                push(3)
+                reloaded = waiting.result().text
+            
+            requests.post(f"{self.base_url}/live/{stream_id}/end", headers={"X-Stream-Key": key}, timeout=60)
+            replay = requests.get(f"{self.base_url}/live/{stream_id}/playlist.m3u8", timeout=10).text
+            
+            success = (
+                statuses == [200, 200, 200]
+                and wrong_key == 403
+                and out_of_order == 409
+                and all(f"segments/{sequence}.ts" in playlist for sequence in range(3))
+                and segment == segments[1]
+                and "segments/3.ts" in reloaded
+                and "#EXT-X-ENDLIST" in replay and "segments/0.ts" in replay
+            )
+            details = f"Ingest: {statuses}, Wrong key: {wrong_key}, Out of order: {out_of_order}, Replay ended: {'#EXT-X-ENDLIST' in replay}"
+            self.log_test("Live Streaming", success, details)
+            return success
+        except Exception as e:
+            self.log_test("Live Streaming", False, str(e))
+            return False
+
     def test_content_endpoints(self):
         """Test content-related endpoints"""
         categories = ['videos', 'pictures', 'live_streams']
@@ -141,6 +603,42 @@ class GizzleTVAPITester:
                 
         return all_success
 
+    def test_content_pagination(self):
+        """Test cursor pagination and field projection of content listings"""
+        try:
+            # Make sure there are at least two pictures to page through
+            self.upload_test_image()
+            self.upload_test_image()
+            
+            url = f"{self.base_url}/content/pictures"
+            first = requests.get(url, params={"limit": 1, "fields": "id,filename"}, timeout=10)
+            cursor = first.headers.get("X-Next-Cursor")
+            first_page = first.json()
+            success = (
+                first.status_code == 200
+                and len(first_page) == 1
+                and bool(cursor)
+                and set(first_page[0]) == {"id", "filename", "upload_timestamp"}
+            )
+            details = [f"First page: {first.status_code}", f"Cursor: {bool(cursor)}"]
+            
+            if success:
+                second = requests.get(url, params={"limit": 1, "cursor": cursor}, timeout=10)
+                second_page = second.json()
+                success = second.status_code == 200 and len(second_page) == 1 and second_page[0]["id"] != first_page[0]["id"]
+                details.append(f"Second page: {second.status_code}")
+            
+            response = requests.get(url, params={"cursor": "not-a-cursor"}, timeout=10)
+            success = success and response.status_code == 400
+            details.append(f"Bad cursor: {response.status_code}")
+            
+            self.log_test("Content Pagination", success, ", ".join(details))
+            return success
+            
+        except Exception as e:
+            self.log_test("Content Pagination", False, str(e))
+            return False
+
     def test_file_upload(self):
         """Test file upload functionality"""
         # Test image upload
@@ -178,6 +676,725 @@ class GizzleTVAPITester:
             self.log_test("File Upload (Image)", False, str(e))
             return False
 
+    def upload_test_image(self):
+        """Upload the test PNG, return (GridFS file id, original bytes)"""
+        test_image_content = b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR\x00\x00\x00\x01\x00\x00\x00\x01\x08\x02\x00\x00\x00\x90wS\xde\x00\x00\x00\tpHYs\x00\x00\x0b\x13\x00\x00\x0b\x13\x01\x00\x9a\x9c\x18\x00\x00\x00\nIDATx\x9cc\xf8\x00\x00\x00\x01\x00\x01\x00\x00\x00\x00IEND\xaeB`\x82'
+        files = {
+            'file': ('range_test.png', io.BytesIO(test_image_content), 'image/png')
+        }
+        data = {'category': 'pictures', 'tags': 'test'}
+        response = requests.post(f"{self.base_url}/content/upload", files=files, data=data, timeout=30)
+        content_id = response.json().get('content_id')
+        
+        items = requests.get(f"{self.base_url}/content/pictures", timeout=30).json()
+        file_id = next((item['filename'] for item in items if item['id'] == content_id), None)
+        return file_id, test_image_content
+
+    def test_range_requests(self):
+        """Test partial content responses for the file endpoint"""
+        try:
+            file_id, content = self.upload_test_image()
+            if not file_id:
+                self.log_test("Range Requests", False, "Uploaded file not found in listing")
+                return False
+            url = f"{self.base_url}/content/file/{file_id}"
+            size = len(content)
+            details = []
+            
+            # Single range
+            response = requests.get(url, headers={"Range": "bytes=0-9"}, timeout=10)
+            success = (
+                response.status_code == 206
+                and response.content == content[0:10]
+                and response.headers.get("Content-Range") == f"bytes 0-9/{size}"
+            )
+            details.append(f"Single: {response.status_code}")
+            
+            # Suffix range
+            response = requests.get(url, headers={"Range": "bytes=-5"}, timeout=10)
+            success = success and response.status_code == 206 and response.content == content[-5:]
+            details.append(f"Suffix: {response.status_code}")
+            
+            # Multiple ranges
+            response = requests.get(url, headers={"Range": "bytes=0-1,20-29"}, timeout=10)
+            success = (
+                success
+                and response.status_code == 206
+                and response.headers.get("Content-Type", "").startswith("multipart/byteranges")
+                and content[20:30] in response.content
+            )
+            details.append(f"Multi: {response.status_code}")
+            
+            # Unsatisfiable range
+            response = requests.get(url, headers={"Range": f"bytes={size + 100}-"}, timeout=10)
+            success = success and response.status_code == 416
+            details.append(f"Unsatisfiable: {response.status_code}")
+            
+            # No range: full body, ranges advertised
+            response = requests.get(url, timeout=10)
+            success = success and response.content == content and response.headers.get("Accept-Ranges") == "bytes"
+            details.append(f"Full: {response.status_code}")
+            
+            self.log_test("Range Requests", success, ", ".join(details))
+            return success
+            
+        except Exception as e:
+            self.log_test("Range Requests", False, str(e))
+            return False
+
+    def test_conditional_get(self):
+        """Test ETag / Last-Modified validators and 304 responses"""
+        try:
+            file_id, content = self.upload_test_image()
+            if not file_id:
+                self.log_test("Conditional GET", False, "Uploaded file not found in listing")
+                return False
+            url = f"{self.base_url}/content/file/{file_id}"
+            
+            response = requests.get(url, timeout=10)
+            etag = response.headers.get("ETag")
+            last_modified = response.headers.get("Last-Modified")
+            success = bool(etag and last_modified and response.headers.get("Cache-Control"))
+            details = [f"ETag: {etag}", f"Cache-Control: {response.headers.get('Cache-Control')}"]
+            
+            response = requests.get(url, headers={"If-None-Match": etag}, timeout=10)
+            success = success and response.status_code == 304 and not response.content
+            details.append(f"If-None-Match: {response.status_code}")
+            
+            response = requests.get(url, headers={"If-Modified-Since": last_modified}, timeout=10)
+            success = success and response.status_code == 304
+            details.append(f"If-Modified-Since: {response.status_code}")
+            
+            response = requests.get(url, headers={"If-None-Match": '"stale"'}, timeout=10)
+            success = success and response.status_code == 200 and response.content == content
+            details.append(f"Stale ETag: {response.status_code}")
+            
+            self.log_test("Conditional GET", success, ", ".join(details))
+            return success
+            
+        except Exception as e:
+            self.log_test("Conditional GET", False, str(e))
+            return False
+
+    def test_media_cache(self, requests_count=5):
+        """Test that repeated downloads are served from the hot media cache, byte for byte"""
+        try:
+            file_id, content = self.upload_test_image()
+            if not file_id:
+                self.log_test("Hot Media Cache", False, "Uploaded file not found in listing")
+                return False
+            url = f"{self.base_url}/content/file/{file_id}"
+            before = requests.get(f"{self.base_url}/health/media-cache", timeout=10).json()
+            
+            # Admission needs a few requests; later ones must match the stored bytes
+            bodies = [requests.get(url, timeout=10).content for _ in range(requests_count)]
+            partial = requests.get(url, headers={"Range": "bytes=5-20"}, timeout=10)
+            after = requests.get(f"{self.base_url}/health/media-cache", timeout=10).json()
+            
+            memory_hits = after["memory"]["hits"] - before["memory"]["hits"]
+            success = (
+                all(body == content for body in bodies)
+                and partial.status_code == 206
+                and partial.content == content[5:21]
+                and memory_hits > 0
+                and after["bytes_from_memory"] > before["bytes_from_memory"]
+            )
+            self.log_test("Hot Media Cache", success, f"Memory hits: {memory_hits}, hit ratio: {after['hit_ratio']}")
+            return success
+        except Exception as e:
+            self.log_test("Hot Media Cache", False, str(e))
+            return False
+
+    def test_video_processing(self, timeout=120):
+        """Test that uploaded videos leave the "processing" state"""
+        try:
+            files = {
+                'file': ('processing_test.mp4', io.BytesIO(b'\0' * 1024), 'video/mp4')
+            }
+            data = {'category': 'videos', 'tags': 'test'}
+            response = requests.post(f"{self.base_url}/content/upload", files=files, data=data, timeout=30)
+            content_id = response.json().get('content_id')
+            
+            # Not a real video, so "failed" is the expected terminal state here
+            status = "processing"
+            deadline = time.time() + timeout
+            while status == "processing" and time.time() < deadline:
+                time.sleep(2)
+                items = requests.get(f"{self.base_url}/content/videos", params={"fields": "processing_status"}, timeout=10).json()
+                status = next((item['processing_status'] for item in items if item['id'] == content_id), "missing")
+            
+            success = status in ("completed", "failed")
+            self.log_test("Video Processing", success, f"Final status: {status}")
+            return success
+        except Exception as e:
+            self.log_test("Video Processing", False, str(e))
+            return False
+
+    def test_adaptive_bitrate(self, timeout=300):
+        """Test that a real video gets an HLS rendition ladder served with immutable caching"""
+        try:
+            # A short 720p clip with audio, so the ladder has several rungs
+            clip = subprocess.run([
+                "ffmpeg", "-v", "error",
+                "-f", "lavfi", "-i", "testsrc=size=1280x720:rate=30:duration=8",
+                "-f", "lavfi", "-i", "sine=frequency=440:duration=8",
+                "-c:v", "libx264", "-pix_fmt", "yuv420p", "-c:a", "aac",
+                "-movflags", "+faststart", "-f", "mp4", "pipe:1"
+            ], capture_output=True, check=True).stdout
+
+            files = {'file': ('abr_test.mp4', io.BytesIO(clip), 'video/mp4')}
+            data = {'category': 'videos', 'tags': 'test,abr'}
+            response = requests.post(f"{self.base_url}/content/upload", files=files, data=data, timeout=60)
+            content_id = response.json().get('content_id')
+
+            playback = {}
+            deadline = time.time() + timeout
+            while time.time() < deadline:
+                playback = requests.get(f"{self.base_url}/content/{content_id}/playback", timeout=10).json()
+                if playback.get('abr_status') in ("ready", "failed"):
+                    break
+                time.sleep(3)
+
+            if playback.get('abr_status') != "ready":
+                self.log_test("Adaptive Bitrate", False, f"Ladder status: {playback.get('abr_status')}")
+                return False
+
+            origin = self.base_url[:-len("/api")] if self.base_url.endswith("/api") else self.base_url
+            master = requests.get(origin + playback['hls_url'], timeout=10)
+            variants = [line for line in master.text.splitlines() if line and not line.startswith("#")]
+            heights = [rendition['height'] for rendition in playback['renditions']]
+
+            # Walk the lowest rendition down to its first segment
+            media_url = origin + playback['hls_url'].rsplit("/", 1)[0] + "/" + variants[-1]
+            media = requests.get(media_url, timeout=10)
+            segments = [line for line in media.text.splitlines() if line and not line.startswith("#")]
+            segment = requests.get(media_url.rsplit("/", 1)[0] + "/" + segments[0], timeout=10)
+            revalidated = requests.get(origin + playback['hls_url'], headers={"If-None-Match": master.headers.get("etag", "")}, timeout=10)
+
+            success = (
+                master.status_code == 200
+                and "immutable" in master.headers.get("cache-control", "")
+                and len(variants) == len(heights) >= 2
+                and max(heights) <= 720
+                and media.status_code == 200
+                and "#EXT-X-ENDLIST" in media.text
+                and segment.status_code == 200
+                and len(segment.content) > 0
+                and revalidated.status_code == 304
+            )
+            self.log_test(
+                "Adaptive Bitrate", success,
+                f"Renditions: {heights}, segments in lowest: {len(segments)}, revalidation: {revalidated.status_code}"
+            )
+            return success
+        except Exception as e:
+            self.log_test("Adaptive Bitrate", False, str(e))
+            return False
+
+    def test_picture_variants(self):
+        """Test resized picture variants and Accept negotiation"""
+        try:
+            file_id, content = self.upload_test_image()
+            if not file_id:
+                self.log_test("Picture Variants", False, "Uploaded file not found in listing")
+                return False
+            url = f"{self.base_url}/content/file/{file_id}"
+            
+            response = requests.get(url, params={"variant": "thumb"}, headers={"Accept": "image/jpeg"}, timeout=60)
+            success = response.status_code == 200 and response.headers.get("Content-Type") == "image/jpeg"
+            details = [f"JPEG thumb: {response.status_code}"]
+            
+            # Second request is served from the memoized derivative
+            again = requests.get(url, params={"variant": "thumb"}, headers={"Accept": "image/jpeg"}, timeout=10)
+            success = success and again.status_code == 200 and again.headers.get("ETag") == response.headers.get("ETag")
+            details.append(f"Memoized: {again.status_code}")
+            
+            response = requests.get(url, params={"variant": "thumb"}, headers={"Accept": "image/webp,*/*"}, timeout=60)
+            success = success and response.status_code == 200 and response.headers.get("Content-Type") in ("image/webp", "image/jpeg")
+            details.append(f"Negotiated: {response.headers.get('Content-Type')}")
+            
+            response = requests.get(url, params={"variant": "huge"}, timeout=10)
+            success = success and response.status_code == 400
+            details.append(f"Unknown variant: {response.status_code}")
+            
+            # Thumbnails are not views: after a thumb and a full fetch only the
+            # full one is counted (it also shows the counters were flushed)
+            mongo = pymongo.MongoClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"), serverSelectionTimeoutMS=5000)
+            content_items = mongo[os.environ.get("DB_NAME", "test_database")].content_items
+            
+            def total_views():
+                return sum(item.get("view_count", 0) for item in content_items.find({"filename": file_id}))
+            
+            time.sleep(6)  # let views from the requests above reach Mongo
+            views_before = total_views()
+            requests.get(url, params={"variant": "thumb"}, headers={"Accept": "image/jpeg"}, timeout=10)
+            requests.get(url, timeout=10)
+            deadline = time.time() + 30
+            while time.time() < deadline and total_views() == views_before:
+                time.sleep(0.5)
+            time.sleep(1)
+            added_views = total_views() - views_before
+            mongo.close()
+            success = success and added_views == 1
+            details.append(f"Views added by a thumb and a full fetch: {added_views}")
+            
+            self.log_test("Picture Variants", success, ", ".join(details))
+            return success
+        except Exception as e:
+            self.log_test("Picture Variants", False, str(e))
+            return False
+
+    def test_resumable_upload(self, size=10 * 1024 * 1024):
+        """Test the create / put chunks / status / complete upload flow"""
+        try:
+            payload = bytes(range(256)) * (size // 256)
+            response = requests.post(f"{self.base_url}/uploads", json={
+                "filename": "resumable_test.mp4",
+                "content_type": "video/mp4",
+                "category": "videos",
+                "total_size": len(payload),
+                "tags": ["test"]
+            }, timeout=10)
+            session = response.json()
+            upload_id, chunk_size, total_chunks = session["upload_id"], session["chunk_size"], session["total_chunks"]
+            details = [f"Chunks: {total_chunks}"]
+            
+            # Send all but the first chunk, last one first, and check what is missing
+            for index in reversed(range(1, total_chunks)):
+                requests.put(
+                    f"{self.base_url}/uploads/{upload_id}/chunks/{index}",
+                    data=payload[index * chunk_size:(index + 1) * chunk_size],
+                    timeout=60
+                )
+            status = requests.get(f"{self.base_url}/uploads/{upload_id}", timeout=10).json()
+            success = status["missing_chunks"] == [0]
+            details.append(f"Missing before resume: {status['missing_chunks']}")
+            
+            early = requests.post(f"{self.base_url}/uploads/{upload_id}/complete", timeout=10)
+            success = success and early.status_code == 409
+            
+            requests.put(f"{self.base_url}/uploads/{upload_id}/chunks/0", data=payload[:chunk_size], timeout=60)
+            response = requests.post(f"{self.base_url}/uploads/{upload_id}/complete", timeout=30)
+            content_id = response.json().get("content_id")
+            success = success and response.status_code == 200
+            details.append(f"Complete: {response.status_code}")
+            
+            items = requests.get(f"{self.base_url}/content/videos", timeout=10).json()
+            file_id = next((item['filename'] for item in items if item['id'] == content_id), None)
+            downloaded = requests.get(f"{self.base_url}/content/file/{file_id}", timeout=60).content
+            success = success and downloaded == payload
+            details.append(f"Round trip intact: {downloaded == payload}")
+            
+            self.log_test("Resumable Upload", success, ", ".join(details))
+            return success
+        except Exception as e:
+            self.log_test("Resumable Upload", False, str(e))
+            return False
+
+    def test_upload_deduplication(self):
+        """Test that re-uploading identical bytes reuses the stored file"""
+        try:
+            payload = f"dedup test {datetime.now().isoformat()}".encode() * 1000
+            digest = hashlib.sha256(payload).hexdigest()
+            
+            def upload(extra_data=None):
+                files = {'file': ('dedup_test.mp4', io.BytesIO(payload), 'video/mp4')}
+                data = {'category': 'videos', 'tags': 'test', **(extra_data or {})}
+                return requests.post(f"{self.base_url}/content/upload", files=files, data=data, timeout=30)
+            
+            report_before = requests.get(f"{self.base_url}/storage/dedup", timeout=10).json()
+            first = upload()
+            second = upload()
+            declared = upload({'sha256': digest})
+            mismatch = upload({'sha256': '0' * 64})
+            report_after = requests.get(f"{self.base_url}/storage/dedup", timeout=10).json()
+            
+            items = requests.get(f"{self.base_url}/content/videos", params={"fields": "filename"}, timeout=10).json()
+            file_ids = {item['id']: item['filename'] for item in items}
+            ids = [response.json().get('content_id') for response in (first, second, declared)]
+            
+            # A view of the shared file counts for the item being played only
+            requests.get(f"{self.base_url}/content/file/{file_ids.get(ids[1])}", params={"content_id": ids[1]}, timeout=30)
+            mongo = pymongo.MongoClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"), serverSelectionTimeoutMS=5000)
+            content_items = mongo[os.environ.get("DB_NAME", "test_database")].content_items
+            deadline = time.time() + 30
+            while time.time() < deadline and content_items.find_one({"id": ids[1]})["view_count"] < 1:
+                time.sleep(0.5)
+            view_counts = [content_items.find_one({"id": content_id})["view_count"] for content_id in ids]
+            mongo.close()
+            
+            success = (
+                first.json().get('deduplicated') is False
+                and second.json().get('deduplicated') is True
+                and declared.json().get('deduplicated') is True
+                and len({file_ids.get(content_id) for content_id in ids}) == 1
+                and mismatch.status_code == 400
+                and report_after['bytes_reclaimed'] - report_before['bytes_reclaimed'] == 2 * len(payload)
+                and view_counts == [0, 1, 0]
+            )
+            details = (
+                f"Shared file ids: {len({file_ids.get(content_id) for content_id in ids})}, "
+                f"Reclaimed: {report_after['bytes_reclaimed']}, View counts: {view_counts}"
+            )
+            self.log_test("Upload Deduplication", success, details)
+            return success
+        except Exception as e:
+            self.log_test("Upload Deduplication", False, str(e))
+            return False
+
+    def measure_health_latency(self, samples=20):
+        """Median /health latency in milliseconds"""
+        latencies = []
+        for _ in range(samples):
+            start = time.perf_counter()
+            requests.get(f"{self.base_url}/health", timeout=30)
+            latencies.append((time.perf_counter() - start) * 1000)
+        return statistics.median(latencies)
+
+    def upload_large_video(self, size):
+        """Upload a zero-filled video of the given size, return the GridFS file id"""
+        files = {
+            'file': ('load_test.mp4', io.BytesIO(b'\0' * size), 'video/mp4')
+        }
+        data = {'category': 'videos', 'tags': 'load-test'}
+        response = requests.post(f"{self.base_url}/content/upload", files=files, data=data, timeout=600)
+        content_id = response.json().get('content_id')
+        
+        items = requests.get(f"{self.base_url}/content/videos", timeout=30).json()
+        return next((item['filename'] for item in items if item['id'] == content_id), None)
+
+    def download_file(self, file_id):
+        """Download a stored file and discard the bytes"""
+        with requests.get(f"{self.base_url}/content/file/{file_id}", stream=True, timeout=600) as response:
+            for _ in response.iter_content(chunk_size=1024 * 1024):
+                pass
+
+    def test_health_latency_under_load(self, workers=8, size=50 * 1024 * 1024):
+        """Test that /health stays responsive while large uploads and downloads run"""
+        try:
+            idle_latency = self.measure_health_latency()
+            file_id = self.upload_large_video(size)
+            
+            with ThreadPoolExecutor(max_workers=workers * 2) as pool:
+                jobs = [pool.submit(self.upload_large_video, size) for _ in range(workers)]
+                if file_id:
+                    jobs += [pool.submit(self.download_file, file_id) for _ in range(workers)]
+                loaded_latency = self.measure_health_latency()
+                for job in jobs:
+                    job.result()
+            
+            # File I/O must not stall the event loop: allow noise, not multi-second stalls
+            success = loaded_latency < max(idle_latency * 5, idle_latency + 250)
+            details = f"Idle median: {idle_latency:.1f}ms, Under load median: {loaded_latency:.1f}ms"
+            self.log_test("Health Latency Under Load", success, details)
+            return success
+            
+        except Exception as e:
+            self.log_test("Health Latency Under Load", False, str(e))
+            return False
+
+    def test_storage_backends(self):
+        """Test that uploads land in the configured storage backend and read back intact"""
+        try:
+            file_id, content = self.upload_test_image()
+            if not file_id:
+                self.log_test("Storage Backends", False, "Uploaded file not found in listing")
+                return False
+            report = requests.get(f"{self.base_url}/storage/backends", timeout=10).json()
+            write_backend = report.get("write_backend")
+            response = requests.get(f"{self.base_url}/content/file/{file_id}", timeout=10)
+            
+            success = (
+                report.get("backends", {}).get(write_backend, {}).get("files", 0) > 0
+                and response.status_code == 200
+                and response.content == content
+            )
+            self.log_test("Storage Backends", success, f"Write backend: {write_backend}, backends: {report.get('backends')}")
+            return success
+        except Exception as e:
+            self.log_test("Storage Backends", False, str(e))
+            return False
+
+    def test_direct_upload(self):
+        """Test presigned uploads straight to the object store and redirected downloads"""
+        try:
+            write_backend = requests.get(f"{self.base_url}/storage/backends", timeout=10).json().get("write_backend")
+            content = os.urandom(256 * 1024)
+            body = {
+                "filename": "direct_test.bin",
+                "content_type": "application/octet-stream",
+                "category": "pictures",
+                "total_size": len(content),
+                "sha256": hashlib.sha256(content).hexdigest()
+            }
+            response = requests.post(f"{self.base_url}/uploads/direct", json=body, timeout=10)
+            if write_backend != "s3":
+                success = response.status_code == 501
+                self.log_test("Direct Upload", success, f"Write backend: {write_backend}, status: {response.status_code} (expected 501)")
+                return success
+            
+            upload = response.json()
+            put = requests.put(upload["upload_url"], data=content, headers=upload["headers"], timeout=30)
+            completed = requests.post(f"{self.base_url}/uploads/direct/{upload['upload_id']}/complete", timeout=30)
+            content_id = completed.json().get("content_id")
+            items = requests.get(f"{self.base_url}/content/pictures", timeout=30).json()
+            file_id = next((item['filename'] for item in items if item['id'] == content_id), None)
+            
+            redirect = requests.get(f"{self.base_url}/content/file/{file_id}", allow_redirects=False, timeout=10)
+            downloaded = requests.get(redirect.headers.get("Location", ""), timeout=30) if redirect.status_code == 307 else None
+            success = (
+                put.status_code == 200
+                and completed.status_code == 200
+                and redirect.status_code == 307
+                and downloaded is not None
+                and downloaded.content == content
+            )
+            details = f"PUT: {put.status_code}, complete: {completed.status_code}, download: {redirect.status_code}"
+            self.log_test("Direct Upload", success, details)
+            return success
+        except Exception as e:
+            self.log_test("Direct Upload", False, str(e))
+            return False
+
+    def test_index_provisioning(self):
+        """Test that all declared indexes were built at startup"""
+        try:
+            response = requests.get(f"{self.base_url}/health/indexes", timeout=10)
+            success = response.status_code == 200 and response.json().get("status") == "ready"
+            details = f"Status: {response.status_code}"
+            if response.status_code == 200:
+                failed = [
+                    f"{collection}.{name}"
+                    for collection, statuses in response.json().get("indexes", {}).items()
+                    for name, status in statuses.items() if status != "ready"
+                ]
+                details += f", Not ready: {failed or 'none'}"
+            self.log_test("Index Provisioning", success, details)
+            return success
+        except Exception as e:
+            self.log_test("Index Provisioning", False, str(e))
+            return False
+
+    def winning_plan_stages(self, plan):
+        """Collect every stage name in an explain() winning plan"""
+        stages = [plan.get("stage")]
+        for key in ("inputStage", "queryPlan"):
+            if key in plan:
+                stages += self.winning_plan_stages(plan[key])
+        for child in plan.get("inputStages", []):
+            stages += self.winning_plan_stages(child)
+        return stages
+
+    def test_queries_use_indexes(self):
+        """Test that every endpoint query is answered from an index (needs direct MongoDB access)"""
+        try:
+            mongo = pymongo.MongoClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"), serverSelectionTimeoutMS=5000)
+            database = mongo[os.environ.get("DB_NAME", "test_database")]
+            
+            # (collection, filter, sort) for each handler's query
+            endpoint_queries = {
+                "get_content_by_category": ("content_items", {"category": "videos"}, [("upload_timestamp", -1), ("id", -1)]),
+                "create_model_profile": ("model_profiles", {"username": "someone"}, None),
+                "get_model_profile": ("model_profiles", {"id": "some-id"}, None),
+                "get_models (featured)": ("model_profiles", {"is_featured": True}, None),
+                "get_models (category)": ("model_profiles", {"category": "fashion"}, None),
+                "get_models (verified)": ("model_profiles", {"verification_status": "verified"}, None),
+                "create_member (username)": ("community_members", {"username": "someone"}, None),
+                "create_member (email)": ("community_members", {"email": "someone@example.com"}, None),
+                "get_payment_status": ("payment_transactions", {"session_id": "cs_test"}, None),
+                "get_file (derivatives)": ("content_items", {"filename": "000000000000000000000000"}, None),
+            }
+            
+            collection_scans = []
+            for endpoint, (collection, query, sort) in endpoint_queries.items():
+                cursor = database[collection].find(query)
+                if sort:
+                    cursor = cursor.sort(sort)
+                plan = cursor.explain()["queryPlanner"]["winningPlan"]
+                if "COLLSCAN" in self.winning_plan_stages(plan):
+                    collection_scans.append(endpoint)
+            mongo.close()
+            
+            success = not collection_scans
+            details = f"Queries checked: {len(endpoint_queries)}, COLLSCAN: {collection_scans or 'none'}"
+            self.log_test("Queries Use Indexes", success, details)
+            return success
+        except Exception as e:
+            self.log_test("Queries Use Indexes", False, str(e))
+            return False
+
+    def test_payment_status_polling(self, polls=20, status_ttl=5):
+        """Test that status polls reach Stripe at most once per TTL, and never once final"""
+        if self.stripe_stub is None:
+            self.log_skip("Payment Status Polling", "STRIPE_STUB_PORT not set")
+            return None
+        try:
+            mongo = pymongo.MongoClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"), serverSelectionTimeoutMS=5000)
+            transactions = mongo[os.environ.get("DB_NAME", "test_database")].payment_transactions
+            pending_id = f"cs_test_poll_{uuid.uuid4().hex}"
+            final_id = f"cs_test_poll_{uuid.uuid4().hex}"
+            for session_id, payment_status in ((pending_id, "pending"), (final_id, "paid")):
+                transactions.insert_one({
+                    "id": str(uuid.uuid4()),
+                    "session_id": session_id,
+                    "amount": 9.99,
+                    "currency": "usd",
+                    "payment_status": payment_status,
+                    "metadata": {"type": "purchase"}
+                })
+            
+            def poll(session_id):
+                return requests.get(f"{self.base_url}/payments/status/{session_id}", timeout=10).json()
+            
+            def reads(session_id):
+                with CountingStripeHandler.lock:
+                    return CountingStripeHandler.reads.get(session_id, 0)
+            
+            def poll_burst(session_id):
+                with ThreadPoolExecutor(max_workers=polls) as pool:
+                    responses = list(pool.map(poll, [session_id] * polls))
+                for _ in range(polls):
+                    responses.append(poll(session_id))
+                return responses
+            
+            # Concurrent and repeated polls of a pending session share one Stripe read
+            poll_burst(pending_id)
+            pending_reads = reads(pending_id)
+            
+            # A final session is answered from Mongo
+            final_responses = poll_burst(final_id)
+            final_reads = reads(final_id)
+            
+            # Once the session is paid, the next poll after the TTL records it,
+            # and polls after that no longer ask Stripe
+            CountingStripeHandler.paid.add(pending_id)
+            time.sleep(status_ttl + 1)
+            paid_status = poll(pending_id).get("payment_status")
+            time.sleep(status_ttl + 1)
+            poll_burst(pending_id)
+            paid_reads = reads(pending_id)
+            stored_status = transactions.find_one({"session_id": pending_id})["payment_status"]
+            mongo.close()
+            
+            success = (
+                pending_reads == 1
+                and final_reads == 0
+                and all(response.get("payment_status") == "paid" for response in final_responses)
+                and paid_status == "paid"
+                and paid_reads == 2
+                and stored_status == "paid"
+            )
+            details = (
+                f"Stripe reads for {2 * polls} polls: pending {pending_reads}, final {final_reads}; "
+                f"after payment: {paid_reads - pending_reads}, stored status: {stored_status}"
+            )
+            self.log_test("Payment Status Polling", success, details)
+            return success
+        except Exception as e:
+            self.log_test("Payment Status Polling", False, str(e))
+            return False
+
+    def signed_stripe_event(self, secret, event_id, event_type, session_id, payment_status, created):
+        """Build a Stripe-style event body and a matching Stripe-Signature header"""
+        body = json.dumps({
+            "id": event_id,
+            "object": "event",
+            "type": event_type,
+            "created": created,
+            "data": {"object": {
+                "id": session_id,
+                "object": "checkout.session",
+                "status": "complete",
+                "payment_status": payment_status,
+                "metadata": {}
+            }}
+        })
+        timestamp = int(time.time())
+        signature = hmac.new(secret.encode(), f"{timestamp}.{body}".encode(), hashlib.sha256).hexdigest()
+        return body, f"t={timestamp},v1={signature}"
+
+    def test_webhook_replay(self):
+        """Test duplicate and out-of-order webhook bursts converge on the right state"""
+        secret = os.environ.get("STRIPE_WEBHOOK_SECRET")
+        if not secret:
+            self.log_skip("Webhook Replay", "STRIPE_WEBHOOK_SECRET not set")
+            return None
+        try:
+            mongo = pymongo.MongoClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"), serverSelectionTimeoutMS=5000)
+            database = mongo[os.environ.get("DB_NAME", "test_database")]
+            session_id = f"cs_test_replay_{uuid.uuid4().hex}"
+            database.payment_transactions.insert_one({
+                "id": str(uuid.uuid4()),
+                "session_id": session_id,
+                "amount": 9.99,
+                "currency": "usd",
+                "payment_status": "pending",
+                "metadata": {"type": "subscription"}
+            })
+            
+            created = int(time.time())
+            events = [
+                (f"evt_{uuid.uuid4().hex}", "checkout.session.completed", "unpaid", created),
+                (f"evt_{uuid.uuid4().hex}", "checkout.session.async_payment_succeeded", "paid", created + 10),
+                # Must not undo the payment, whichever is applied first
+                (f"evt_{uuid.uuid4().hex}", "checkout.session.expired", "unpaid", created + 20),
+            ]
+            # Every event several times, in shuffled order, all at once
+            deliveries = [event for event in events for _ in range(5)]
+            random.shuffle(deliveries)
+            
+            def deliver(event):
+                body, signature = self.signed_stripe_event(secret, event[0], event[1], session_id, event[2], event[3])
+                return requests.post(
+                    f"{self.base_url}/webhook/stripe",
+                    data=body,
+                    headers={"Content-Type": "application/json", "Stripe-Signature": signature},
+                    timeout=10
+                ).status_code
+            
+            with ThreadPoolExecutor(max_workers=len(deliveries)) as pool:
+                statuses = list(pool.map(deliver, deliveries))
+            
+            # The consumer works in the background
+            final_status = None
+            deadline = time.time() + 30
+            while time.time() < deadline:
+                pending = database.payment_events.count_documents({
+                    "event_id": {"$in": [event[0] for event in events]},
+                    "status": {"$in": ["pending", "processing"]}
+                })
+                final_status = database.payment_transactions.find_one({"session_id": session_id})["payment_status"]
+                if not pending:
+                    break
+                time.sleep(1)
+            logged = database.payment_events.count_documents({"event_id": {"$in": [event[0] for event in events]}})
+            mongo.close()
+            
+            # Events without an id cannot be deduplicated and are refused
+            body, signature = self.signed_stripe_event(secret, None, "checkout.session.expired", session_id, "unpaid", created)
+            anonymous = requests.post(
+                f"{self.base_url}/webhook/stripe",
+                data=body,
+                headers={"Content-Type": "application/json", "Stripe-Signature": signature},
+                timeout=10
+            ).status_code
+            
+            success = (
+                all(status == 200 for status in statuses)
+                and logged == len(events)
+                and final_status == "paid"
+                and anonymous == 400
+            )
+            details = (
+                f"Acknowledged: {statuses.count(200)}/{len(statuses)}, Logged events: {logged}, "
+                f"Final status: {final_status}, Event without id: {anonymous}"
+            )
+            self.log_test("Webhook Replay", success, details)
+            return success
+        except Exception as e:
+            self.log_test("Webhook Replay", False, str(e))
+            return False
+
     def test_subscription_checkout(self):
         """Test subscription checkout creation"""
         try:
@@ -262,21 +1479,50 @@ class GizzleTVAPITester:
         self.test_health_check()
         self.test_root_endpoint()
         
+        # Database index tests
+        self.test_index_provisioning()
+        self.test_queries_use_indexes()
+        
         # Content management tests
         self.test_content_endpoints()
         self.test_file_upload()
+        self.test_range_requests()
+        self.test_conditional_get()
+        self.test_media_cache()
+        self.test_content_pagination()
+        self.test_content_stats()
+        self.test_video_processing()
+        self.test_adaptive_bitrate()
+        self.test_picture_variants()
+        self.test_resumable_upload()
+        self.test_upload_deduplication()
+        self.test_storage_backends()
+        self.test_direct_upload()
+        self.test_live_streaming()
+        self.test_health_latency_under_load()
+        
+        # Model profile tests
+        self.test_model_cache()
+        self.test_shared_cache_consistency()
+        self.test_engagement_counters()
+        self.test_search()
         
         # Community tests
         self.test_community_members()
+        self.test_member_uniqueness()
         
         # Subscription and payment tests
         self.test_subscription_plans()
         self.test_subscription_checkout()
         self.test_purchase_checkout()
+        self.test_payment_status_polling()
+        self.test_webhook_replay()
         
         # Print summary
         print("\n" + "=" * 60)
         print(f"📊 Test Results: {self.tests_passed}/{self.tests_run} tests passed")
+        if self.tests_skipped:
+            print(f"⏭️  {self.tests_skipped} tests skipped")
         
         if self.tests_passed == self.tests_run:
             print("🎉 All tests passed!")
@@ -294,7 +1540,23 @@ class GizzleTVAPITester:
             return 1
 
 def main():
-    tester = GizzleTVAPITester()
+    # With REDIS_STUB_PORT set, serve the Redis stand-in on that port for an
+    # API running with CACHE_BACKEND_URL=redis://localhost:<port>. The API
+    # reconnects on its own, so it may be started before the stand-in.
+    redis_stub = None
+    if os.environ.get("REDIS_STUB_PORT"):
+        redis_stub = StubRedisServer(int(os.environ["REDIS_STUB_PORT"]))
+        threading.Thread(target=redis_stub.serve_forever, daemon=True).start()
+    
+    # With STRIPE_STUB_PORT set, serve the Stripe stand-in on that port for an
+    # API running with STRIPE_API_BASE=http://localhost:<port> (and any
+    # STRIPE_API_KEY), so payment tests can count what reaches the provider
+    stripe_stub = None
+    if os.environ.get("STRIPE_STUB_PORT"):
+        stripe_stub = ThreadingHTTPServer(("0.0.0.0", int(os.environ["STRIPE_STUB_PORT"])), CountingStripeHandler)
+        threading.Thread(target=stripe_stub.serve_forever, daemon=True).start()
+    
+    tester = GizzleTVAPITester(redis_stub=redis_stub, stripe_stub=stripe_stub)
     return tester.run_all_tests()
 
 if __name__ == "__main__":